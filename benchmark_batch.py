@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las APIs por lotes.
+Mide el throughput (imágenes/s) de la conversión de formato y, si rembg
+está instalado, de la remoción de fondo, para distintos números de hilos.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Agregar raíz del proyecto al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from PIL import Image
+
+from src.core.format_converter import FormatConverter
+from src.utils.parallel import shutdown_batch_executor
+
+
+def create_sample_images(folder: Path, count: int, size: tuple) -> list:
+    """Genera imágenes JPEG sintéticas (con ruido para que la compresión trabaje)."""
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(42)
+    files = []
+
+    for i in range(count):
+        noise = Image.effect_noise(size, rng.randint(20, 80)).convert('RGB')
+        path = folder / f"sample_{i:04d}.jpg"
+        noise.save(path, 'JPEG', quality=92)
+        files.append(path)
+
+    return files
+
+
+def run(label: str, func, images: int, worker_counts: list):
+    """Ejecuta func(workers) para cada número de hilos e imprime el throughput."""
+    print(f"\n{label}")
+    print(f"{'hilos':>6} {'segundos':>10} {'img/s':>10} {'speedup':>8}")
+
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        stats = func(workers)
+        elapsed = time.perf_counter() - start
+
+        throughput = images / elapsed if elapsed > 0 else float('inf')
+        baseline = baseline or throughput
+        failed = stats.get('failed', 0)
+        note = f"  ({failed} fallidas)" if failed else ""
+        print(f"{workers:>6} {elapsed:>10.2f} {throughput:>10.1f} {throughput / baseline:>7.2f}x{note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de procesamiento por lotes")
+    parser.add_argument('--images', type=int, default=60, help='Imágenes sintéticas (default: 60)')
+    parser.add_argument('--width', type=int, default=1800, help='Ancho de las imágenes (default: 1800)')
+    parser.add_argument('--height', type=int, default=2400, help='Alto de las imágenes (default: 2400)')
+    parser.add_argument(
+        '--workers',
+        default=None,
+        help='Hilos a probar separados por coma (default: 1,2,4,... hasta los núcleos)'
+    )
+    parser.add_argument('--bg', action='store_true', help='Incluir remoción de fondo (requiere rembg)')
+    args = parser.parse_args()
+
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(',')]
+    else:
+        cpus = os.cpu_count() or 1
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= cpus:
+            worker_counts.append(worker_counts[-1] * 2)
+        if worker_counts[-1] != cpus:
+            worker_counts.append(cpus)
+
+    workdir = Path(tempfile.mkdtemp(prefix="photocrop-bench-"))
+    try:
+        input_dir = workdir / "input"
+        print(f"Generando {args.images} imágenes de {args.width}x{args.height}...")
+        create_sample_images(input_dir, args.images, (args.width, args.height))
+
+        converter = FormatConverter()
+        run(
+            "Conversión de formato (FormatConverter.convert_batch)",
+            lambda w: converter.convert_batch(
+                input_dir, workdir / f"converted_{w}", incremental=False, workers=w
+            ),
+            args.images,
+            worker_counts
+        )
+
+        if args.bg:
+            from src.core.background_remover import REMBG_AVAILABLE, BackgroundRemover
+            if not REMBG_AVAILABLE:
+                print("\nrembg no está instalado: se omite la remoción de fondo")
+            else:
+                remover = BackgroundRemover()
+                run(
+                    "Remoción de fondo (BackgroundRemover.process_batch)",
+                    lambda w: remover.process_batch(
+                        input_dir, workdir / f"no_bg_{w}", (255, 255, 255, 255), workers=w
+                    ),
+                    args.images,
+                    worker_counts
+                )
+    finally:
+        shutdown_batch_executor()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,9 @@ from pathlib import Path
 import json
 import sys
 
+from src.core.output_layout import OutputLayout, iter_folder_files
+from src.utils.file_utils import announce_removed_directories
+
 
 def clean_system(confirm: bool = True):
     """
@@ -60,7 +63,8 @@ def clean_system(confirm: bool = True):
         if folder_path.exists():
             file_count = 0
             for item in folder_path.rglob('*'):
-                if item.is_file():
+                # La distribución por shards de la carpeta se conserva
+                if item.is_file() and item.name != OutputLayout.LAYOUT_NAME:
                     item.unlink()
                     file_count += 1
 
@@ -117,6 +121,9 @@ def clean_system(confirm: bool = True):
 
     print(f"✓ Índice procesados  - Reseteado correctamente")
 
+    # Los procesos en marcha (dashboard, vigilancia) olvidan las carpetas eliminadas
+    announce_removed_directories()
+
     # Limpiar logs
     log_path = Path('./logs/pipeline.log')
     if log_path.exists():
@@ -160,7 +167,7 @@ def show_current_state():
     for folder_name, description in folders.items():
         folder_path = Path(f"./{folder_name}")
         if folder_path.exists():
-            count = sum(1 for _ in folder_path.rglob('*') if _.is_file() and _.suffix.lower() in ['.jpg', '.jpeg', '.png', '.bmp'])
+            count = sum(1 for _ in iter_folder_files(folder_path, ['.jpg', '.jpeg', '.png', '.bmp']))
             print(f"  {description:20s}: {count:4d} imagen(es)")
         else:
             print(f"  {description:20s}: -")
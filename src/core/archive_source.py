@@ -0,0 +1,191 @@
+"""
+Entrada de fotos directamente desde archivos ZIP/TAR.
+Lee cada imagen del archivo a memoria (sin extraerla a input_raw) y la
+entrega al procesador como ArchiveMember, con la procedencia
+"<archivo>!<miembro>" para los metadatos.
+"""
+
+import hashlib
+import io
+import os
+import tarfile
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Iterator, Optional, Tuple
+
+from src.utils.file_utils import atomic_path
+from src.utils.parallel import map_ordered
+
+# Extensiones reconocidas como archivo de entrada
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive(path: Path) -> bool:
+    """True si la ruta tiene extensión de ZIP o TAR."""
+    return str(path).lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def member_parts(member_name: str) -> Optional[Tuple[str, ...]]:
+    """
+    Partes de la ruta de un miembro, o None si no es una ruta relativa
+    segura: absoluta, con "..", "." o partes vacías, o con separadores de
+    Windows. Con esas partes se arman rutas de salida (lote, subcarpeta),
+    así que un miembro no puede escribir fuera de las carpetas del sistema.
+    """
+    if not member_name or member_name.startswith('/') or '\\' in member_name:
+        return None
+    parts = tuple(member_name.split('/'))
+    if any(part in ('', '.', '..') or ':' in part for part in parts):
+        return None
+    return parts
+
+
+class ArchiveMember:
+    """
+    Imagen contenida en un ZIP/TAR.
+
+    Expone name, stem y suffix como un Path, de modo que el procesador la
+    trata igual que un archivo de input_raw; open() entrega los bytes sin
+    pasar por disco.
+    """
+
+    def __init__(
+        self,
+        archive_path: Path,
+        member_name: str,
+        data: Optional[bytes],
+        mtime: Optional[float] = None,
+        error: Optional[str] = None
+    ):
+        """
+        Args:
+            archive_path: Archivo ZIP/TAR de origen
+            member_name: Ruta del miembro dentro del archivo
+            data: Contenido de la imagen (None si no se pudo leer)
+            mtime: Fecha de modificación registrada en el archivo
+            error: Motivo por el que no se pudo leer el miembro
+
+        Raises:
+            ValueError: Si member_name no es una ruta relativa segura
+        """
+        parts = member_parts(member_name)
+        if parts is None:
+            raise ValueError(f"Ruta de miembro no permitida: {member_name!r}")
+
+        self.archive_path = Path(archive_path)
+        self.member_name = member_name
+        self.member_path = PurePosixPath(*parts)
+        self.data = data
+        self.mtime = mtime
+        self.error = error
+
+    @property
+    def name(self) -> str:
+        return self.member_path.name
+
+    @property
+    def stem(self) -> str:
+        return self.member_path.stem
+
+    @property
+    def suffix(self) -> str:
+        return self.member_path.suffix
+
+    @property
+    def provenance(self) -> str:
+        """Procedencia para metadatos: <archivo>!<miembro>."""
+        return f"{self.archive_path}!{self.member_name}"
+
+    def __str__(self) -> str:
+        return self.provenance
+
+    def __repr__(self) -> str:
+        return f"ArchiveMember({self.provenance!r})"
+
+    def open(self) -> io.BytesIO:
+        """Stream de lectura con el contenido del miembro."""
+        return io.BytesIO(self.data or b"")
+
+    def sha256(self) -> str:
+        return hashlib.sha256(self.data or b"").hexdigest()
+
+    def write_to(self, dest_path: Path):
+        """Escribe el contenido (igual que el archivo extraído, con su mtime)."""
+        with atomic_path(dest_path) as temp_path:
+            with open(temp_path, 'wb') as f:
+                f.write(self.data or b"")
+            if self.mtime is not None:
+                os.utime(temp_path, (self.mtime, self.mtime))
+
+
+def _accepts(member_name: str, extensions: set) -> bool:
+    """
+    Imágenes válidas: rutas relativas seguras (member_parts), sin ocultos
+    ni carpetas de sistema (__MACOSX).
+    """
+    parts = member_parts(member_name)
+    if parts is None:
+        return False
+    if any(part.startswith('.') or part == '__MACOSX' for part in parts):
+        return False
+    return PurePosixPath(parts[-1]).suffix.lower() in extensions
+
+
+def iter_archive_members(
+    archive_path: Path,
+    extensions: Iterable[str],
+    min_size: int = 0,
+    workers: Optional[int] = None
+) -> Iterator[ArchiveMember]:
+    """
+    Recorre las imágenes de un ZIP o TAR en el orden del archivo.
+
+    ZIP permite acceso aleatorio: los miembros se descomprimen en paralelo
+    (hasta `workers` en vuelo) y se entregan en orden. TAR (también .tar.gz,
+    .bz2, .xz) se lee como stream secuencial, una sola pasada.
+
+    Args:
+        archive_path: Ruta del archivo
+        extensions: Extensiones de imagen válidas (en minúsculas, con punto)
+        min_size: Tamaño mínimo en bytes (los menores se omiten)
+        workers: Miembros descomprimidos en paralelo (solo ZIP)
+    """
+    archive_path = Path(archive_path)
+    extensions = {ext.lower() for ext in extensions}
+
+    if zipfile.is_zipfile(archive_path):
+        yield from _iter_zip(archive_path, extensions, min_size, workers)
+    else:
+        yield from _iter_tar(archive_path, extensions, min_size)
+
+
+def _iter_zip(archive_path: Path, extensions: set, min_size: int, workers: Optional[int]) -> Iterator[ArchiveMember]:
+    with zipfile.ZipFile(archive_path) as archive:
+        infos = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.file_size >= min_size and _accepts(info.filename, extensions)
+        ]
+
+        # ZipFile serializa el acceso al archivo y descomprime fuera del lock
+        for result in map_ordered(archive.read, infos, workers):
+            info = result.item
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            if result.error is not None:
+                yield ArchiveMember(archive_path, info.filename, None, mtime, error=str(result.error))
+            else:
+                yield ArchiveMember(archive_path, info.filename, result.result, mtime)
+
+
+def _iter_tar(archive_path: Path, extensions: set, min_size: int) -> Iterator[ArchiveMember]:
+    # "r|*": stream secuencial con detección de compresión (sin seek)
+    with tarfile.open(archive_path, mode="r|*") as archive:
+        for info in archive:
+            if not info.isfile() or info.size < min_size or not _accepts(info.name, extensions):
+                continue
+            try:
+                data = archive.extractfile(info).read()
+            except (OSError, tarfile.TarError) as e:
+                yield ArchiveMember(archive_path, info.name, None, info.mtime, error=str(e))
+                continue
+            yield ArchiveMember(archive_path, info.name, data, info.mtime)
@@ -8,8 +8,12 @@ from typing import Optional, Tuple
 from PIL import Image
 import io
 
+from src.core.output_layout import get_layout
+from src.utils.file_utils import atomic_path, ensure_directory
+from src.utils.parallel import map_ordered
+
 try:
-    from rembg import remove
+    from rembg import remove, new_session
     REMBG_AVAILABLE = True
 except ImportError:
     REMBG_AVAILABLE = False
@@ -21,14 +25,59 @@ class BackgroundRemover:
     Funciona 100% offline después de descargar el modelo inicial.
     """
 
-    def __init__(self):
-        """Inicializa el removedor de fondo."""
+    def __init__(self, model_name: str = "u2net"):
+        """
+        Inicializa el removedor de fondo.
+
+        Carga el modelo una sola vez (sesión de rembg) para reutilizarlo
+        en todas las imágenes, en lugar de crear una sesión por llamada.
+
+        Args:
+            model_name: Nombre del modelo de rembg (default: u2net)
+        """
         if not REMBG_AVAILABLE:
             raise ImportError(
                 "rembg no está instalado. Instalar con: pip install rembg"
             )
+        self.model_name = model_name
+        self.session = new_session(model_name)
         self.model_loaded = True
 
+    @staticmethod
+    def _apply_background(
+        img: Image.Image,
+        background_color: Optional[Tuple[int, int, int, int]]
+    ) -> Image.Image:
+        """Aplica un color de fondo sólido a una imagen RGBA (None = transparente)."""
+        if background_color is None:
+            return img
+
+        # Crear nueva imagen con fondo de color
+        background = Image.new('RGBA', img.size, background_color)
+        # Pegar imagen con transparencia sobre el fondo
+        background.paste(img, (0, 0), img)
+        return background.convert('RGB')  # Convertir a RGB para JPG
+
+    def remove_background_image(
+        self,
+        img: Image.Image,
+        background_color: Optional[Tuple[int, int, int, int]] = None
+    ) -> Image.Image:
+        """
+        Remueve el fondo de una imagen ya cargada en memoria.
+
+        Args:
+            img: Objeto Image de PIL
+            background_color: Color RGBA del fondo (None = transparente)
+
+        Returns:
+            Imagen RGB con fondo sólido, o RGBA si background_color es None
+        """
+        output = remove(img, session=self.session)
+        if output.mode != 'RGBA':
+            output = output.convert('RGBA')
+        return self._apply_background(output, background_color)
+
     def remove_background(
         self,
         input_path: Path,
@@ -54,26 +103,22 @@ class BackgroundRemover:
                 input_data = f.read()
 
             # Remover fondo (retorna PNG con transparencia)
-            output_data = remove(input_data)
+            output_data = remove(input_data, session=self.session)
 
             # Convertir a PIL Image
             img = Image.open(io.BytesIO(output_data))
 
             # Si se especifica color de fondo, aplicarlo
-            if background_color is not None:
-                # Crear nueva imagen con fondo de color
-                background = Image.new('RGBA', img.size, background_color)
-                # Pegar imagen con transparencia sobre el fondo
-                background.paste(img, (0, 0), img)
-                img = background.convert('RGB')  # Convertir a RGB para JPG
-
-            # Guardar resultado
-            if background_color is not None:
-                # Guardar como JPG si tiene fondo sólido
-                img.save(output_path, 'JPEG', quality=95)
-            else:
-                # Guardar como PNG si tiene transparencia
-                img.save(output_path, 'PNG')
+            img = self._apply_background(img, background_color)
+
+            # Guardar resultado (temporal + rename: nunca queda a medias)
+            with atomic_path(output_path) as temp_path:
+                if background_color is not None:
+                    # Guardar como JPG si tiene fondo sólido
+                    img.save(temp_path, 'JPEG', quality=95)
+                else:
+                    # Guardar como PNG si tiene transparencia
+                    img.save(temp_path, 'PNG')
 
             return True
 
@@ -86,24 +131,29 @@ class BackgroundRemover:
         input_dir: Path,
         output_dir: Path,
         background_color: Optional[Tuple[int, int, int, int]] = None,
-        extensions: list = None
+        extensions: list = None,
+        workers: Optional[int] = None
     ) -> dict:
         """
         Procesa múltiples imágenes en lote.
 
+        Las imágenes se procesan en el pool de hilos compartido con la
+        misma sesión del modelo; un fallo en una imagen no detiene el lote.
+
         Args:
             input_dir: Directorio con imágenes de entrada
             output_dir: Directorio para guardar resultados
             background_color: Color de fondo a aplicar
             extensions: Lista de extensiones válidas
+            workers: Imágenes en paralelo (None = tamaño del pool compartido)
 
         Returns:
-            Dict con estadísticas del procesamiento
+            Dict con estadísticas del procesamiento (files en orden de entrada)
         """
         if extensions is None:
             extensions = ['.jpg', '.jpeg', '.png']
 
-        output_dir.mkdir(parents=True, exist_ok=True)
+        ensure_directory(output_dir)
 
         stats = {
             'total': 0,
@@ -112,32 +162,29 @@ class BackgroundRemover:
             'files': []
         }
 
-        for ext in extensions:
-            for img_path in input_dir.glob(f"*{ext}"):
-                stats['total'] += 1
-
-                # Mantener el nombre original del archivo
-                if background_color is not None:
-                    # Con fondo sólido, guardar como JPG
-                    output_name = img_path.stem + '.jpg'
-                else:
-                    # Con transparencia, guardar como PNG
-                    output_name = img_path.stem + '.png'
-
-                output_path = output_dir / output_name
-
-                # Procesar
-                success = self.remove_background(
-                    img_path,
-                    output_path,
-                    background_color
-                )
-
-                if success:
-                    stats['success'] += 1
-                    stats['files'].append(str(output_path))
-                else:
-                    stats['failed'] += 1
+        # Mantener el nombre original del archivo:
+        # JPG con fondo sólido, PNG con transparencia
+        output_suffix = '.jpg' if background_color is not None else '.png'
+
+        input_layout = get_layout(input_dir)
+        images = sorted(input_layout.iter_files(extensions), key=lambda p: p.name)
+        stats['total'] = len(images)
+        output_layout = get_layout(output_dir)
+
+        def process(img_path: Path) -> Path:
+            # Misma subcarpeta de lote que la entrada
+            output_path = output_layout.path_for(img_path.stem + output_suffix, input_layout.subdir_of(img_path))
+            ensure_directory(output_path.parent)
+            if not self.remove_background(img_path, output_path, background_color):
+                raise RuntimeError(f"No se pudo procesar {img_path.name}")
+            return output_path
+
+        for img_path, output_path, error in map_ordered(process, images, workers):
+            if error is None:
+                stats['success'] += 1
+                stats['files'].append(str(output_path))
+            else:
+                stats['failed'] += 1
 
         return stats
 
@@ -211,6 +258,12 @@ def main():
         action='store_true',
         help='Procesar directorio completo'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Imágenes en paralelo en modo --batch (default: núcleos disponibles)'
+    )
 
     args = parser.parse_args()
 
@@ -226,7 +279,8 @@ def main():
         stats = remover.process_batch(
             Path(args.input),
             Path(args.output),
-            None if args.color == 'transparent' else (255, 255, 255, 255)
+            None if args.color == 'transparent' else (255, 255, 255, 255),
+            workers=args.workers
         )
         print(f"Procesadas: {stats['success']}/{stats['total']}")
     else:
@@ -0,0 +1,223 @@
+"""
+Resumen de lote incremental.
+Actualiza estadísticas, breakdown y tasa de éxito a medida que termina cada
+archivo, sin mantener la lista de metadatos en memoria.
+"""
+
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.core.metadata_manager import MetadataManager
+from src.utils.file_utils import atomic_path, ensure_directory
+
+
+class BatchSummaryAggregator:
+    """
+    Acumula el resumen de un lote archivo por archivo.
+
+    Los contadores viven en memoria (tamaño constante). El resumen de cada
+    imagen se agrega a batch_images.jsonl junto a batch_summary.json, y
+    solo al finalizar se copia en streaming a la lista "images".
+
+    Mientras el lote corre, batch_summary.json se reescribe cada
+    flush_every archivos o flush_interval segundos con status "running"
+    (sin la lista de imágenes). Si el lote ya tiene resumen, el aggregator
+    continúa: los contadores se reconstruyen desde batch_images.jsonl (la
+    última línea de cada archivo), y un archivo que se vuelve a procesar
+    reemplaza su resultado anterior en lugar de sumarse dos veces.
+    """
+
+    IMAGES_FILE = "batch_images.jsonl"
+
+    def __init__(
+        self,
+        metadata_manager: MetadataManager,
+        batch_id: str,
+        batch_path: Optional[str] = None,
+        flush_every: int = 50,
+        flush_interval: float = 10.0
+    ):
+        """
+        Args:
+            metadata_manager: Gestor de metadatos (define la carpeta del resumen)
+            batch_id: Identificador del lote
+            batch_path: Carpeta de origen del lote (informativo)
+            flush_every: Archivos entre escrituras del resumen parcial
+            flush_interval: Segundos máximos entre escrituras del resumen parcial
+        """
+        self.manager = metadata_manager
+        self.batch_id = batch_id
+        self.batch_path = batch_path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self.summary_path = metadata_manager.batch_summary_path(batch_id)
+        self.images_path = self.summary_path.with_name(self.IMAGES_FILE)
+        ensure_directory(self.summary_path.parent)
+
+        self.stats, self.breakdown = metadata_manager.new_summary_counters()
+        self.total = 0
+        self.processing_date = self._timestamp()
+        # Resultados de ejecuciones anteriores (filename → resumen), que un
+        # reproceso reemplaza; y líneas del jsonl que quedaron reemplazadas
+        self._resumed: Dict[str, Dict[str, Any]] = {}
+        self._stale: Dict[str, int] = {}
+        self._resume()
+
+        self._images = open(self.images_path, 'a', encoding='utf-8')
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def _timestamp() -> str:
+        return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+    def _resume(self):
+        """
+        Retoma un lote con resumen previo. El resumen parcial puede ir
+        atrasado respecto de batch_images.jsonl (corte entre dos flush), así
+        que los contadores se reconstruyen desde el jsonl; el resumen solo
+        aporta fechas y batch_path (y los contadores si no hay jsonl).
+        """
+        try:
+            with open(self.summary_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+
+        if previous is not None:
+            self.processing_date = previous.get("processing_date", self.processing_date)
+            self.batch_path = self.batch_path or previous.get("batch_path")
+
+        lines = 0
+        try:
+            with open(self.images_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        img_summary = json.loads(line)
+                    except ValueError:
+                        continue  # Línea cortada por la interrupción
+                    # La última línea de cada archivo es su resultado vigente
+                    self._resumed.pop(img_summary["filename"], None)
+                    self._resumed[img_summary["filename"]] = img_summary
+        except FileNotFoundError:
+            if previous is not None:
+                self.total = previous.get("total_images", 0)
+                self.stats.update(previous.get("statistics", {}))
+                self.breakdown.update(previous.get("breakdown", {}))
+            return
+
+        for img_summary in self._resumed.values():
+            self.manager.accumulate_summary(self._as_metadata(img_summary), self.stats, self.breakdown)
+        self.total = len(self._resumed)
+
+        # Sin duplicados ni líneas cortadas, para que finalize() las copie tal cual
+        if lines != len(self._resumed):
+            with atomic_path(self.images_path) as temp_path:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    for img_summary in self._resumed.values():
+                        f.write(json.dumps(img_summary, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _as_metadata(img_summary: Dict[str, Any]) -> Dict[str, Any]:
+        """Metadato equivalente a un resumen de imagen (num_faces 1 no se guarda en el resumen)."""
+        metadata = {
+            "filename": img_summary["filename"],
+            "status": img_summary["status"],
+            "face_detected": img_summary.get("face_detected", False),
+            "num_faces": img_summary.get("num_faces") or (1 if img_summary.get("face_detected") else 0)
+        }
+        if img_summary.get("error"):
+            metadata["error_message"] = img_summary["error"]
+        return metadata
+
+    def _discount(self, img_summary: Dict[str, Any]):
+        """Resta de los contadores un resultado que se reemplaza."""
+        stats, breakdown = self.manager.new_summary_counters()
+        self.manager.accumulate_summary(self._as_metadata(img_summary), stats, breakdown)
+        for counters, delta in ((self.stats, stats), (self.breakdown, breakdown)):
+            for key, value in delta.items():
+                counters[key] = counters.get(key, 0) - value
+        self.total -= 1
+
+    def add(self, metadata: Dict[str, Any]):
+        """Suma el metadato final de un archivo al resumen."""
+        previous = self._resumed.pop(metadata["filename"], None)
+        if previous is not None:
+            # Reproceso de un archivo de una ejecución anterior
+            self._discount(previous)
+            self._stale[metadata["filename"]] = self._stale.get(metadata["filename"], 0) + 1
+
+        img_summary = self.manager.accumulate_summary(metadata, self.stats, self.breakdown)
+        self.total += 1
+
+        self._images.write(json.dumps(img_summary, ensure_ascii=False) + "\n")
+        self._pending += 1
+
+        if (self._pending >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> Path:
+        """Escribe el resumen parcial (status "running")."""
+        self._images.flush()
+        summary = self.manager.build_summary(
+            self.batch_id, self.batch_path, self.total, self.stats, self.breakdown,
+            processing_date=self.processing_date, completion_date=None
+        )
+        summary["status"] = "running"
+        summary["images_file"] = self.IMAGES_FILE
+
+        self._write(lambda f: json.dump(summary, f, indent=2, ensure_ascii=False))
+
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        return self.summary_path
+
+    def finalize(self) -> Path:
+        """Escribe el resumen final con la lista completa de imágenes."""
+        self._images.close()
+
+        placeholder = "__IMAGES__"
+        summary = self.manager.build_summary(
+            self.batch_id, self.batch_path, self.total, self.stats, self.breakdown,
+            processing_date=self.processing_date, completion_date=self._timestamp(),
+            images=placeholder
+        )
+        summary["status"] = "completed"
+        summary["images_file"] = self.IMAGES_FILE
+
+        # Mismo formato que json.dump(indent=2), copiando las imágenes en streaming
+        head, tail = json.dumps(summary, indent=2, ensure_ascii=False).split(f'"{placeholder}"')
+
+        def write(f):
+            f.write(head)
+            with open(self.images_path, 'r', encoding='utf-8') as images:
+                first = True
+                for line in images:
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    if self._stale.get(item["filename"]):
+                        # Resultado anterior de un archivo reprocesado (la línea nueva va después)
+                        self._stale[item["filename"]] -= 1
+                        continue
+                    item = json.dumps(item, indent=2, ensure_ascii=False)
+                    f.write("[\n" if first else ",\n")
+                    f.write("\n".join("    " + row for row in item.splitlines()))
+                    first = False
+                f.write("[]" if first else "\n  ]")
+            f.write(tail)
+
+        self._write(write)
+        return self.summary_path
+
+    def _write(self, writer):
+        """Escribe batch_summary.json de forma atómica (temporal + rename)."""
+        with atomic_path(self.summary_path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                writer(f)
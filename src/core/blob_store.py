@@ -0,0 +1,178 @@
+"""
+Almacén de salidas direccionado por contenido.
+Cada contenido distinto se guarda una sola vez en working/blobs/<ab>/<sha256>
+y las carpetas con nombre (prepared, output, output_white, output_final)
+quedan como hardlinks a esos blobs: los consumidores siguen viendo las
+mismas rutas, pero un JPEG idéntico en tres carpetas ocupa y se escribe una vez.
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from src.utils.file_utils import ensure_directory, file_sha256, link_or_copy, load_config
+
+
+class BlobStore:
+    """
+    Blobs inmutables nombrados por SHA-256.
+
+    Un blob nunca se modifica: las vistas se crean y reemplazan con
+    link_or_copy y los escritores regeneran una vista con atomic_path
+    (temporal + os.replace), que crea un inodo nuevo en lugar de escribir
+    sobre el compartido. Un blob cuyo único enlace es el propio
+    (st_nlink == 1) ya no tiene vistas y gc() lo elimina.
+    """
+
+    def __init__(self, blob_dir: Path):
+        """
+        Args:
+            blob_dir: Carpeta de blobs (mismo sistema de archivos que las
+                salidas, para poder usar hardlinks)
+        """
+        self.blob_dir = Path(blob_dir)
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def ingest(self, path: Path) -> str:
+        """
+        Incorpora un archivo recién escrito: si su contenido ya existe,
+        el archivo pasa a ser una vista del blob existente; si no, se
+        convierte en el blob.
+
+        Returns:
+            SHA-256 del contenido
+        """
+        path = Path(path)
+        digest = file_sha256(path)
+        blob = self.blob_path(digest)
+
+        # Un blob con otro tamaño se dañó fuera del almacén: se reemplaza
+        if blob.exists() and blob.stat().st_size == path.stat().st_size:
+            if not os.path.samefile(blob, path):
+                link_or_copy(blob, path)
+        else:
+            ensure_directory(blob.parent)
+            link_or_copy(path, blob)
+
+        return digest
+
+    def link(self, digest: str, dest_path: Path) -> str:
+        """
+        Publica un blob en una ruta con nombre.
+
+        Returns:
+            Estrategia usada (ver link_or_copy)
+        """
+        return link_or_copy(self.blob_path(digest), Path(dest_path))
+
+    def store(self, source: Path, *dest_paths: Path) -> str:
+        """Incorpora source y lo publica en cada destino. Retorna el SHA-256."""
+        digest = self.ingest(source)
+        for dest_path in dest_paths:
+            self.link(digest, dest_path)
+        return digest
+
+    def iter_blobs(self) -> Iterator[os.DirEntry]:
+        if not self.blob_dir.exists():
+            return
+        with os.scandir(self.blob_dir) as shards:
+            for shard in shards:
+                if shard.is_dir(follow_symlinks=False):
+                    with os.scandir(shard.path) as blobs:
+                        for blob in blobs:
+                            if blob.is_file(follow_symlinks=False) and not blob.name.startswith('.'):
+                                yield blob
+
+    def stats(self) -> Dict[str, Any]:
+        """Blobs, bytes almacenados y bytes que ocuparían las vistas como copias."""
+        blobs = stored = logical = orphans = 0
+        for blob in self.iter_blobs():
+            st = blob.stat()
+            blobs += 1
+            stored += st.st_size
+            logical += st.st_size * max(st.st_nlink - 1, 0)
+            orphans += st.st_nlink == 1
+        return {
+            "blobs": blobs,
+            "stored_bytes": stored,
+            "view_bytes": logical,
+            "orphans": orphans
+        }
+
+    def gc(self) -> Dict[str, int]:
+        """Elimina los blobs sin vistas (st_nlink == 1)."""
+        removed = freed = 0
+        for blob in self.iter_blobs():
+            st = blob.stat()
+            if st.st_nlink == 1:
+                try:
+                    os.unlink(blob.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += st.st_size
+        return {"removed": removed, "freed_bytes": freed}
+
+
+def open_blob_store() -> Optional[BlobStore]:
+    """Almacén configurado en settings.yml (output_store), o None si está desactivado."""
+    try:
+        config = load_config().get("output_store") or {}
+    except (OSError, ValueError):
+        config = {}
+
+    if not config.get("enabled", False):
+        return None
+    return BlobStore(Path(config.get("blob_dir") or "./working/blobs"))
+
+
+def write_view(blob_store: Optional[BlobStore], source: Path, dest_path: Path):
+    """
+    Publica source en dest_path: como vista de un blob si hay almacén, o
+    como copia (link_or_copy con copia completa) si no lo hay.
+    """
+    if blob_store is not None:
+        blob_store.store(source, dest_path)
+    else:
+        link_or_copy(source, dest_path, "copy")
+
+
+def main():
+    """Punto de entrada para uso por consola (estadísticas y limpieza)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Almacén de salidas direccionado por contenido"
+    )
+    parser.add_argument(
+        'command',
+        choices=['stats', 'gc'],
+        help='stats: uso de espacio; gc: eliminar blobs sin vistas'
+    )
+    parser.add_argument(
+        '--blob-dir',
+        default=None,
+        help='Carpeta de blobs (default: output_store.blob_dir)'
+    )
+
+    args = parser.parse_args()
+
+    if args.blob_dir:
+        blob_store = BlobStore(Path(args.blob_dir))
+    else:
+        blob_store = open_blob_store() or BlobStore(Path("./working/blobs"))
+
+    if args.command == 'stats':
+        stats = blob_store.stats()
+        print(f"Blobs: {stats['blobs']} ({stats['stored_bytes']} bytes)")
+        print(f"Vistas: {stats['view_bytes']} bytes si fueran copias")
+        print(f"Sin vistas: {stats['orphans']}")
+    else:
+        result = blob_store.gc()
+        print(f"Eliminados: {result['removed']} blobs ({result['freed_bytes']} bytes)")
+
+
+if __name__ == "__main__":
+    main()
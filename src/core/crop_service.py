@@ -0,0 +1,259 @@
+"""
+Servicio de recorte en memoria para una sola foto.
+Ejecuta decodificación → detección → CropDecisionEngine → eliminación de fondo
+sin tocar input_raw ni processed_index.json, usando modelos precargados.
+"""
+
+import io
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.core.background_remover import BackgroundRemover
+from src.core.face_detector import PerThreadFaceDetector
+from src.core.format_converter import FormatConverter
+from src.core.metadata_manager import MetadataManager
+from src.deterministic_processor import CropDecisionEngine
+
+
+class CropServiceBusy(Exception):
+    """Se lanza cuando la cola de trabajo del servicio está llena."""
+
+
+class CropService:
+    """
+    Procesa fotos individuales en memoria con un pool de hilos acotado.
+    U2-Net se carga una sola vez al crear el servicio; el detector de dlib,
+    uno por hilo del pool, también al crear el servicio (ninguna solicitud
+    paga la carga del modelo).
+    """
+
+    MEDIA_TYPES = {
+        '.jpg': 'image/jpeg',
+        '.png': 'image/png',
+        '.bmp': 'image/bmp',
+        '.tiff': 'image/tiff',
+        '.gif': 'image/gif'
+    }
+
+    def __init__(
+        self,
+        enable_bg_removal: bool = True,
+        background_color: Tuple[int, int, int, int] = (255, 255, 255, 255),
+        max_workers: int = 2,
+        max_pending: int = 8,
+        quality: int = 95,
+        latency_window: int = 1000
+    ):
+        """
+        Inicializa el servicio y precarga los modelos.
+
+        Args:
+            enable_bg_removal: Activar eliminación de fondo
+            background_color: Color RGBA del fondo (default: blanco)
+            max_workers: Hilos que procesan fotos en paralelo
+            max_pending: Solicitudes que pueden esperar en cola
+            quality: Calidad JPEG (1-100)
+            latency_window: Cantidad de latencias recientes para p50/p99
+        """
+        # dlib no admite detecciones concurrentes: un detector por hilo del pool
+        self.face_detector = PerThreadFaceDetector()
+        self.crop_engine = CropDecisionEngine()
+        self.background_color = background_color
+        self.quality = quality
+
+        self.background_remover = None
+        if enable_bg_removal:
+            try:
+                self.background_remover = BackgroundRemover()
+            except ImportError:
+                self.background_remover = None
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="crop-api"
+        )
+        self.face_detector.warm_pool(self._executor, max_workers)
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.counters = {
+            "processed": 0,
+            "manual_review": 0,
+            "errors": 0,
+            "rejected": 0
+        }
+
+    @property
+    def bg_removal_enabled(self) -> bool:
+        """Indica si la eliminación de fondo está disponible."""
+        return self.background_remover is not None
+
+    def submit(self, data: bytes, remove_background: bool = True) -> Future:
+        """
+        Encola una foto para procesar.
+
+        Args:
+            data: Bytes de la imagen subida
+            remove_background: Aplicar eliminación de fondo si está disponible
+
+        Returns:
+            Future con el resultado de process_bytes()
+
+        Raises:
+            CropServiceBusy: Si no hay espacio en la cola
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.counters["rejected"] += 1
+            raise CropServiceBusy("Cola de recorte llena")
+
+        try:
+            future = self._executor.submit(self._timed_process, data, remove_background)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _timed_process(self, data: bytes, remove_background: bool) -> Dict[str, Any]:
+        """Ejecuta process_bytes() registrando latencia y contadores."""
+        start = time.perf_counter()
+        try:
+            result = self.process_bytes(data, remove_background)
+        except Exception:
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        result["processing_time_ms"] = round(elapsed_ms, 2)
+
+        with self._lock:
+            self._latencies.append(elapsed_ms)
+            self.counters[result["status"]] += 1
+
+        return result
+
+    def process_bytes(self, data: bytes, remove_background: bool = True) -> Dict[str, Any]:
+        """
+        Procesa una foto completa en memoria.
+
+        Returns:
+            Dict con status ("processed" o "manual_review"). Si es "processed"
+            incluye content (bytes codificados), media_type y extension.
+
+        Raises:
+            ValueError: Si la imagen no se puede decodificar
+        """
+        # 1. DECODIFICACIÓN
+        try:
+            img = Image.open(io.BytesIO(data))
+            img.load()
+        except Exception as e:
+            raise ValueError(f"PIL error: {str(e)}")
+
+        width, height = img.size
+        if width == 0 or height == 0:
+            raise ValueError("Dimensiones inválidas")
+
+        img_format = img.format or 'JPEG'
+        orientation = MetadataManager._calculate_orientation(width, height)
+
+        result = {
+            "width": width,
+            "height": height,
+            "format": img_format,
+            "orientation": orientation,
+            "num_faces": 0,
+            "face_box": None,
+            "crop_box": None
+        }
+
+        # 2. DETECCIÓN FACIAL
+        faces = self.face_detector.detect_faces(np.array(img.convert('RGB')))
+        result["num_faces"] = len(faces)
+
+        if not faces:
+            return self._manual_review(result, "No se detectó rostro en la imagen")
+
+        face_box = list(self.face_detector.get_largest_face(faces))
+        result["face_box"] = face_box
+
+        if len(faces) > 1:
+            return self._manual_review(result, f"Múltiples rostros detectados ({len(faces)})")
+
+        # 3. DECISIÓN DE RECORTE
+        decision = self.crop_engine.calculate_crop_decision(width, height, face_box, orientation)
+        if decision["status"] != "OK":
+            return self._manual_review(result, decision["reason"])
+
+        result["crop_box"] = decision["crop_box"]
+        cropped_img = img.crop(decision["crop_box"])
+
+        # 4. ELIMINACIÓN DE FONDO (OPCIONAL)
+        result["background_removed"] = False
+        if remove_background and self.background_remover is not None:
+            cropped_img = self.background_remover.remove_background_image(
+                cropped_img,
+                self.background_color
+            )
+            result["background_removed"] = True
+
+        # 5. CODIFICACIÓN EN FORMATO ORIGINAL
+        extension = FormatConverter.FORMAT_MAP.get(img_format, '.jpg')
+        buffer = io.BytesIO()
+        FormatConverter.write_image(cropped_img, buffer, extension, self.quality)
+
+        result.update({
+            "status": "processed",
+            "extension": extension,
+            "media_type": self.MEDIA_TYPES.get(extension, 'image/jpeg'),
+            "content": buffer.getvalue()
+        })
+        return result
+
+    @staticmethod
+    def _manual_review(result: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        """Marca el resultado como pendiente de revisión manual."""
+        result["status"] = "manual_review"
+        result["reason"] = reason
+        return result
+
+    def latency_stats(self) -> Dict[str, Any]:
+        """Retorna percentiles de latencia (ms) y contadores del servicio."""
+        with self._lock:
+            samples = sorted(self._latencies)
+            counters = dict(self.counters)
+
+        stats = {
+            "samples": len(samples),
+            "p50_ms": None,
+            "p99_ms": None,
+            "max_ms": None,
+            "counters": counters,
+            "bg_removal_enabled": self.bg_removal_enabled
+        }
+
+        if samples:
+            stats["p50_ms"] = round(self._percentile(samples, 50), 2)
+            stats["p99_ms"] = round(self._percentile(samples, 99), 2)
+            stats["max_ms"] = round(samples[-1], 2)
+
+        return stats
+
+    @staticmethod
+    def _percentile(sorted_samples: list, percentile: float) -> float:
+        """Percentil por rango más cercano sobre una lista ordenada."""
+        rank = max(1, int(round(percentile / 100 * len(sorted_samples))))
+        return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+    def shutdown(self, wait: bool = True):
+        """Detiene el pool de hilos."""
+        self._executor.shutdown(wait=wait)
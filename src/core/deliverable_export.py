@@ -0,0 +1,450 @@
+"""
+Exportación de entregables de un lote.
+Genera en streaming un ZIP (JPEG/PNG sin recomprimir) o un tar.gz con las
+fotos finales de un lote y un manifest.csv armado desde los metadatos, sin
+copias temporales; la compresión se hace en paralelo por bloques.
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import struct
+import tarfile
+import time
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.core.metadata_store import MetadataStore, open_metadata_store
+from src.core.output_layout import get_layout
+from src.utils.file_utils import atomic_path, ensure_directory
+from src.utils.parallel import map_ordered
+
+# Formatos que ya vienen comprimidos: en el ZIP van en modo stored
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+
+# Columnas de manifest.csv
+MANIFEST_COLUMNS = [
+    "filename", "year", "batch_id", "status", "format", "width", "height",
+    "num_faces", "source_hash", "deliverable", "size", "sha256", "last_updated"
+]
+
+# Tipos MIME de cada formato de exportación
+MEDIA_TYPES = {
+    "zip": "application/zip",
+    "tar.gz": "application/gzip",
+    "tar": "application/x-tar"
+}
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+
+
+class _ZipStreamWriter:
+    """
+    ZIP secuencial (sin seek) para miembros ya comprimidos.
+
+    Cada miembro llega con CRC y tamaños calculados, así que la cabecera
+    local se escribe completa (sin data descriptor). Usa extensiones ZIP64
+    cuando tamaños, offsets o cantidad de entradas superan los límites.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.entries: List[Tuple] = []
+
+    @staticmethod
+    def _dos_datetime(mtime: float) -> Tuple[int, int]:
+        t = time.localtime(mtime)
+        year = max(t.tm_year, 1980)
+        return (
+            (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+        )
+
+    def member(self, name: str, data: bytes, method: int, crc: int, size: int, mtime: float) -> bytes:
+        """Cabecera local + datos de un miembro."""
+        encoded = name.encode('utf-8')
+        dos_time, dos_date = self._dos_datetime(mtime)
+        csize = len(data)
+
+        zip64 = size >= _ZIP64_LIMIT or csize >= _ZIP64_LIMIT
+        extra = struct.pack('<HHQQ', 0x0001, 16, size, csize) if zip64 else b''
+        header = struct.pack(
+            '<IHHHHHIIIHH',
+            0x04034b50, 45 if zip64 else 20, 0x0800, method, dos_time, dos_date, crc,
+            _ZIP64_LIMIT if zip64 else csize, _ZIP64_LIMIT if zip64 else size,
+            len(encoded), len(extra)
+        )
+
+        self.entries.append((encoded, method, dos_time, dos_date, crc, csize, size, self.offset))
+        self.offset += len(header) + len(encoded) + len(extra) + csize
+        return header + encoded + extra + data
+
+    def close(self) -> bytes:
+        """Directorio central y registros de fin de archivo."""
+        central = io.BytesIO()
+        for encoded, method, dos_time, dos_date, crc, csize, size, offset in self.entries:
+            zip64_fields = []
+            if size >= _ZIP64_LIMIT:
+                zip64_fields.append(size)
+            if csize >= _ZIP64_LIMIT:
+                zip64_fields.append(csize)
+            if offset >= _ZIP64_LIMIT:
+                zip64_fields.append(offset)
+            extra = (struct.pack('<HH', 0x0001, 8 * len(zip64_fields))
+                     + struct.pack(f'<{len(zip64_fields)}Q', *zip64_fields)) if zip64_fields else b''
+            central.write(struct.pack(
+                '<IHHHHHHIIIHHHHHII',
+                0x02014b50, (3 << 8) | 45, 45 if zip64_fields else 20, 0x0800, method,
+                dos_time, dos_date, crc,
+                _ZIP64_LIMIT if csize >= _ZIP64_LIMIT else csize,
+                _ZIP64_LIMIT if size >= _ZIP64_LIMIT else size,
+                len(encoded), len(extra), 0, 0, 0, 0o100644 << 16,
+                _ZIP64_LIMIT if offset >= _ZIP64_LIMIT else offset
+            ))
+            central.write(encoded)
+            central.write(extra)
+
+        directory = central.getvalue()
+        count = len(self.entries)
+        cd_offset = self.offset
+        tail = b''
+
+        if count >= 0xFFFF or cd_offset >= _ZIP64_LIMIT or len(directory) >= _ZIP64_LIMIT:
+            zip64_end = cd_offset + len(directory)
+            tail += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, len(directory), cd_offset)
+            tail += struct.pack('<IIQI', 0x07064b50, 0, zip64_end, 1)
+
+        tail += struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0,
+            min(count, 0xFFFF), min(count, 0xFFFF),
+            min(len(directory), _ZIP64_LIMIT), min(cd_offset, _ZIP64_LIMIT), 0
+        )
+        return directory + tail
+
+
+class _ByteSink:
+    """Destino de escritura en memoria que se vacía por bloques (para tarfile)."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        return len(data)
+
+    def take(self, size: Optional[int] = None) -> bytes:
+        size = len(self.buffer) if size is None else size
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return chunk
+
+
+class DeliverableExporter:
+    """
+    Empaqueta los entregables de un lote en un stream ZIP o TAR.
+
+    Los archivos del lote salen de los metadatos (backend configurado) y se
+    buscan por nombre en la carpeta de entregables (output_final/ por
+    defecto). Al final se agrega manifest.csv con una fila por metadato
+    del lote, incluyendo los que no tienen entregable (revisión manual,
+    errores).
+    """
+
+    MANIFEST_NAME = "manifest.csv"
+
+    def __init__(
+        self,
+        store: MetadataStore,
+        batch_id: str,
+        year: Optional[int] = None,
+        source_dir: str = "./output_final",
+        archive_format: str = "zip",
+        compress: bool = True,
+        workers: Optional[int] = None,
+        chunk_size: int = 4 * 1024 * 1024
+    ):
+        """
+        Args:
+            store: Backend de metadatos
+            batch_id: Lote a exportar
+            year: Año del lote (None = el lote en todos los años)
+            source_dir: Carpeta de entregables
+            archive_format: "zip", "tar.gz" o "tar"
+            compress: Comprimir (deflate en ZIP salvo JPEG/PNG, gzip en tar.gz)
+            workers: Bloques/miembros comprimidos en paralelo
+            chunk_size: Tamaño de bloque del tar.gz
+        """
+        if archive_format not in MEDIA_TYPES:
+            raise ValueError(f"Formato de exportación desconocido: {archive_format}")
+
+        self.store = store
+        self.batch_id = batch_id
+        self.year = year
+        self.source_dir = Path(source_dir)
+        self.archive_format = archive_format
+        self.compress = compress
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    @property
+    def filename(self) -> str:
+        """Nombre sugerido para la descarga."""
+        suffix = f"_{self.year}" if self.year else ""
+        return f"{self.batch_id}{suffix}_{self.source_dir.name}.{self.archive_format}"
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.archive_format]
+
+    def has_records(self) -> bool:
+        """True si el lote tiene metadatos."""
+        return next(iter(self.store.iter_records(self.year, self.batch_id)), None) is not None
+
+    def _deliverables(self) -> Iterator[Tuple[int, Dict[str, Any], Optional[Path]]]:
+        """
+        Metadatos del lote con la ruta de su entregable (None si no hay).
+        Un archivo en la subcarpeta <año>/<lote> del lote tiene prioridad
+        sobre uno con el mismo nombre en la raíz o en otro lote.
+        """
+        layout = get_layout(self.source_dir)
+        by_stem: Dict[str, List[Path]] = {}
+        for path in layout.iter_files():
+            subdir = layout.subdir_of(path)
+            if subdir and PurePosixPath(subdir).name != self.batch_id:
+                continue  # Salida de otro lote
+            by_stem.setdefault(path.stem, []).append(path)
+
+        for year, _, metadata in self.store.iter_records(self.year, self.batch_id):
+            filename = metadata.get("filename", "")
+            candidates = sorted(
+                by_stem.get(Path(filename).stem, []),
+                key=lambda path: (layout.subdir_of(path) != f"{year}/{self.batch_id}", str(path))
+            )
+            exact = [path for path in candidates if path.name == filename]
+            yield year, metadata, (exact or candidates or [None])[0]
+
+    def _manifest_row(self, year: int, metadata: Dict[str, Any], arcname: Optional[str],
+                      size: Optional[int], digest: Optional[str]) -> Dict[str, Any]:
+        return {
+            "filename": metadata.get("filename"),
+            "year": year,
+            "batch_id": self.batch_id,
+            "status": metadata.get("status"),
+            "format": metadata.get("format"),
+            "width": metadata.get("width"),
+            "height": metadata.get("height"),
+            "num_faces": metadata.get("num_faces"),
+            "source_hash": metadata.get("file_hash"),
+            "deliverable": arcname,
+            "size": size,
+            "sha256": digest,
+            "last_updated": metadata.get("last_updated")
+        }
+
+    def _manifest_bytes(self, rows: List[Dict[str, Any]]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=MANIFEST_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        """Stream del archivo completo, bloque por bloque."""
+        if self.archive_format == "zip":
+            return self._iter_zip()
+        return self._iter_tar()
+
+    # ------------------------------------------------------------------
+    # ZIP
+    # ------------------------------------------------------------------
+
+    def _zip_member(self, item: Tuple[int, Dict[str, Any], Optional[Path]]) -> Optional[Tuple]:
+        """Lee y comprime un entregable (corre en el pool de hilos)."""
+        _, _, path = item
+        if path is None:
+            return None
+        data = path.read_bytes()
+        crc = zlib.crc32(data)
+        digest = hashlib.sha256(data).hexdigest()
+
+        if self.compress and path.suffix.lower() not in STORED_EXTENSIONS:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+            method = 8  # deflate
+        else:
+            payload = data
+            method = 0  # stored
+
+        return payload, method, crc, len(data), path.stat().st_mtime, digest
+
+    def _iter_zip(self) -> Iterator[bytes]:
+        writer = _ZipStreamWriter()
+        rows = []
+
+        for result in map_ordered(self._zip_member, self._deliverables(), self.workers):
+            year, metadata, path = result.item
+            if result.error is not None or result.result is None:
+                rows.append(self._manifest_row(year, metadata, None, None, None))
+                continue
+            payload, method, crc, size, mtime, digest = result.result
+            rows.append(self._manifest_row(year, metadata, path.name, size, digest))
+            yield writer.member(path.name, payload, method, crc, size, mtime)
+
+        manifest = self._manifest_bytes(rows)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        yield writer.member(
+            self.MANIFEST_NAME, compressor.compress(manifest) + compressor.flush(),
+            8, zlib.crc32(manifest), len(manifest), time.time()
+        )
+        yield writer.close()
+
+    # ------------------------------------------------------------------
+    # TAR
+    # ------------------------------------------------------------------
+
+    def _tar_chunks(self) -> Iterator[bytes]:
+        """Bloques del tar sin comprimir (de chunk_size bytes)."""
+        sink = _ByteSink()
+        rows = []
+
+        with tarfile.open(fileobj=sink, mode="w|", format=tarfile.PAX_FORMAT) as archive:
+            for year, metadata, path in self._deliverables():
+                if path is None:
+                    rows.append(self._manifest_row(year, metadata, None, None, None))
+                    continue
+
+                try:
+                    data = path.read_bytes()
+                    st = path.stat()
+                except OSError:
+                    rows.append(self._manifest_row(year, metadata, None, None, None))
+                    continue
+
+                info = tarfile.TarInfo(path.name)
+                info.size = len(data)
+                info.mtime = st.st_mtime
+                info.mode = 0o644
+                archive.addfile(info, io.BytesIO(data))
+                rows.append(self._manifest_row(year, metadata, path.name, len(data), hashlib.sha256(data).hexdigest()))
+
+                while len(sink.buffer) >= self.chunk_size:
+                    yield sink.take(self.chunk_size)
+
+            manifest = self._manifest_bytes(rows)
+            info = tarfile.TarInfo(self.MANIFEST_NAME)
+            info.size = len(manifest)
+            info.mtime = time.time()
+            info.mode = 0o644
+            archive.addfile(info, io.BytesIO(manifest))
+
+        while sink.buffer:
+            yield sink.take(self.chunk_size)
+
+    def _iter_tar(self) -> Iterator[bytes]:
+        if self.archive_format == "tar" or not self.compress:
+            yield from self._tar_chunks()
+            return
+
+        # Cada bloque es un miembro gzip independiente: la concatenación es
+        # un .tar.gz válido (gzip multi-miembro) y los bloques se comprimen
+        # en paralelo
+        for result in map_ordered(lambda chunk: gzip.compress(chunk, compresslevel=6, mtime=0),
+                                  self._tar_chunks(), self.workers):
+            if result.error is not None:
+                raise result.error
+            yield result.result
+
+    def write_to(self, dest_path: Path) -> Path:
+        """Escribe el archivo en disco (temporal + rename al terminar)."""
+        dest_path = Path(dest_path)
+        ensure_directory(dest_path.parent)
+        with atomic_path(dest_path) as temp_path:
+            with open(temp_path, 'wb') as f:
+                for chunk in self.iter_bytes():
+                    f.write(chunk)
+        return dest_path
+
+
+def main():
+    """Punto de entrada para uso por consola."""
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Exportar los entregables de un lote a ZIP o tar.gz"
+    )
+    parser.add_argument(
+        'batch_id',
+        help='Lote a exportar'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        default=None,
+        help='Archivo destino ("-" = salida estándar). Default: <lote>_<carpeta>.<formato>'
+    )
+    parser.add_argument(
+        '--year',
+        type=int,
+        default=None,
+        help='Año del lote (default: todos)'
+    )
+    parser.add_argument(
+        '--folder',
+        default='./output_final',
+        help='Carpeta de entregables (default: ./output_final)'
+    )
+    parser.add_argument(
+        '--format',
+        choices=sorted(MEDIA_TYPES),
+        default='zip',
+        help='zip (JPEG/PNG sin recomprimir), tar.gz o tar (default: zip)'
+    )
+    parser.add_argument(
+        '--no-compress',
+        action='store_true',
+        help='Todo en modo stored (ZIP) o tar sin gzip'
+    )
+    parser.add_argument(
+        '--metadata-dir',
+        default='./metadata',
+        help='Directorio de metadatos (default: ./metadata)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Bloques comprimidos en paralelo (default: parallel.max_workers)'
+    )
+
+    args = parser.parse_args()
+
+    exporter = DeliverableExporter(
+        open_metadata_store(args.metadata_dir),
+        args.batch_id,
+        year=args.year,
+        source_dir=args.folder,
+        archive_format=args.format,
+        compress=not args.no_compress,
+        workers=args.workers
+    )
+
+    if not exporter.has_records():
+        print(f"El lote {args.batch_id} no tiene metadatos", file=sys.stderr)
+        return 1
+
+    if args.output == "-":
+        for chunk in exporter.iter_bytes():
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return 0
+
+    dest_path = exporter.write_to(Path(args.output or exporter.filename))
+    print(f"Exportado: {dest_path} ({dest_path.stat().st_size} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
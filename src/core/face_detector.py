@@ -2,7 +2,9 @@
 Detector de rostros utilizando dlib.
 """
 
+import threading
 import dlib
+from concurrent.futures import Executor
 from typing import List, Tuple, Optional
 import numpy as np
 
@@ -89,3 +91,58 @@ class FaceDetector:
         central_face = min(faces, key=distance_to_center)
         return central_face
 
+
+class PerThreadFaceDetector:
+    """
+    Un FaceDetector por hilo, con la misma interfaz.
+
+    El detector de dlib no admite llamadas concurrentes: cada hilo de un
+    pool (lotes concurrentes, API de recorte, ingesta) usa el suyo, creado
+    en su primera detección o con warm_pool(). El del hilo que crea el
+    objeto se carga al inicio.
+    """
+
+    # Segundos máximos que warm_pool() espera a que arranquen todos los hilos
+    WARM_TIMEOUT = 120.0
+
+    def __init__(self):
+        self._local = threading.local()
+        self.get()
+
+    def get(self) -> FaceDetector:
+        """Detector del hilo actual."""
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = FaceDetector()
+            self._local.detector = detector
+        return detector
+
+    def warm_pool(self, executor: Executor, workers: int):
+        """
+        Carga el detector en cada hilo de un pool, antes de la primera foto.
+
+        Se encola una tarea por hilo y cada una espera a las demás en una
+        barrera: mientras ninguna termina, el pool tiene que arrancar un
+        hilo nuevo para cada tarea, así que cada hilo carga el suyo.
+
+        Args:
+            executor: Pool recién creado (sin otras tareas en curso)
+            workers: Cantidad de hilos del pool (max_workers)
+        """
+        barrier = threading.Barrier(workers)
+
+        def warm():
+            self.get()
+            barrier.wait(self.WARM_TIMEOUT)
+
+        for future in [executor.submit(warm) for _ in range(workers)]:
+            future.result()
+
+    def detect_faces(self, image_array: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        return self.get().detect_faces(image_array)
+
+    def get_largest_face(self, faces: List[Tuple[int, int, int, int]]) -> Optional[Tuple[int, int, int, int]]:
+        return self.get().get_largest_face(faces)
+
+    def get_central_face(self, faces: List[Tuple[int, int, int, int]], image_width: int, image_height: int) -> Optional[Tuple[int, int, int, int]]:
+        return self.get().get_central_face(faces, image_width, image_height)
@@ -3,10 +3,17 @@ Módulo para convertir imágenes al formato original.
 Convierte imágenes de una carpeta a otra manteniendo el formato original.
 """
 
-from pathlib import Path
-from typing import Dict, List, Optional
+import threading
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, List, Optional, Union
 from PIL import Image
+from src.core.blob_store import BlobStore, open_blob_store
+from src.core.metadata_store import open_metadata_store
+from src.core.output_layout import get_layout
+from src.utils.file_utils import atomic_path, ensure_directory, file_sha256, write_json_atomic
+from src.utils.parallel import map_ordered
 import json
+import os
 
 
 class FormatConverter:
@@ -15,21 +22,44 @@ class FormatConverter:
     o extensión del archivo de entrada.
     """
 
-    def __init__(self, metadata_dir: Optional[Path] = None):
+    # Manifiesto de conversión incremental (dentro de output_dir)
+    MANIFEST_NAME = '.conversion_manifest.json'
+
+    # Mapeo de formato PIL a extensión
+    FORMAT_MAP = {
+        'JPEG': '.jpg',
+        'PNG': '.png',
+        'BMP': '.bmp',
+        'TIFF': '.tiff',
+        'GIF': '.gif'
+    }
+
+    def __init__(self, metadata_dir: Optional[Path] = None, blob_store: Optional[BlobStore] = None):
         """
         Inicializa el conversor de formatos.
 
         Args:
-            metadata_dir: Directorio con metadatos JSON (opcional)
+            metadata_dir: Directorio con metadatos (opcional)
+            blob_store: Almacén de salidas; si se indica, las imágenes que ya
+                están en el formato destino se publican como vista del mismo
+                blob en lugar de recodificarse
         """
         self.metadata_dir = metadata_dir
+        self.blob_store = blob_store
+        self.metadata_store = open_metadata_store(metadata_dir) if metadata_dir is not None else None
+
+        # <año>/<lote> → {stem: formato}, cargado una vez por lote y conversión
+        self._batch_formats: Dict[str, Dict[str, str]] = {}
+        self._batch_formats_lock = threading.Lock()
 
-    def get_original_format(self, filename: str) -> str:
+    def get_original_format(self, filename: str, subdir: Optional[str] = None) -> str:
         """
         Obtiene el formato original de una imagen desde metadata.
 
         Args:
             filename: Nombre del archivo
+            subdir: Carpeta de lote de la imagen (ej: "2026/admision_01");
+                None para los archivos sueltos
 
         Returns:
             Extensión del formato original (ej: '.jpg', '.png')
@@ -38,36 +68,49 @@ class FormatConverter:
             # Sin metadata, intentar desde el nombre
             return Path(filename).suffix.lower()
 
-        # Buscar archivo de metadata
-        metadata_file = None
-        for meta_path in self.metadata_dir.rglob(f"{Path(filename).stem}.json"):
-            metadata_file = meta_path
-            break
-
-        if metadata_file and metadata_file.exists():
-            try:
-                with open(metadata_file, 'r') as f:
-                    metadata = json.load(f)
-
-                # Obtener formato original
-                original_format = metadata.get('format', 'JPEG')
-
-                # Mapear formato PIL a extensión
-                format_map = {
-                    'JPEG': '.jpg',
-                    'PNG': '.png',
-                    'BMP': '.bmp',
-                    'TIFF': '.tiff',
-                    'GIF': '.gif'
-                }
-
-                return format_map.get(original_format, '.jpg')
-            except:
-                pass
+        stem = Path(filename).stem
+        if subdir:
+            # El mismo stem puede estar en varios lotes: solo vale el del suyo
+            img_format = self._formats_in(subdir).get(stem)
+            if img_format is not None:
+                return self.FORMAT_MAP.get(img_format, '.jpg')
+        else:
+            # Archivos sueltos: índice por stem (el más reciente)
+            entry = self.metadata_store.find_latest(stem)
+            if entry is not None:
+                return self.FORMAT_MAP.get(entry['format'], '.jpg')
 
         # Por defecto, usar extensión del archivo
         return Path(filename).suffix.lower() or '.jpg'
 
+    def _formats_in(self, subdir: str) -> Dict[str, str]:
+        """
+        Formato de cada stem de una carpeta de lote, según los metadatos
+        cuyo input_path está en esa carpeta (el batch_id solo no alcanza:
+        el mismo lote puede existir en dos años). Ante varios registros del
+        mismo stem gana el de last_updated más reciente.
+        """
+        with self._batch_formats_lock:
+            formats = self._batch_formats.get(subdir)
+            if formats is not None:
+                return formats
+
+            batch_id = PurePosixPath(subdir).name
+            latest: Dict[str, tuple] = {}
+            for _, _, metadata in self.metadata_store.iter_records(batch_id=batch_id):
+                input_path = (metadata.get("input_path") or "").split("!", 1)[-1]
+                parent = PurePosixPath(input_path.replace("\\", "/")).parent.as_posix()
+                if parent != subdir and not parent.endswith("/" + subdir):
+                    continue
+                stem = Path(metadata.get("filename", "")).stem
+                updated = metadata.get("last_updated") or ""
+                if metadata.get("format") and (stem not in latest or latest[stem][0] <= updated):
+                    latest[stem] = (updated, metadata["format"])
+
+            formats = {stem: img_format for stem, (_, img_format) in latest.items()}
+            self._batch_formats[subdir] = formats
+            return formats
+
     def convert_image(
         self,
         input_path: Path,
@@ -105,35 +148,8 @@ class FormatConverter:
             # Ajustar nombre de salida con formato correcto
             output_path = output_path.with_suffix(target_format)
 
-            # Convertir según formato
-            if target_format in ['.jpg', '.jpeg']:
-                # Convertir a RGB si es necesario (PNG con alpha -> JPG)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    # Crear fondo blanco
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                img.save(output_path, 'JPEG', quality=quality, optimize=True)
-
-            elif target_format == '.png':
-                img.save(output_path, 'PNG', optimize=True)
-
-            elif target_format == '.bmp':
-                if img.mode == 'RGBA':
-                    img = img.convert('RGB')
-                img.save(output_path, 'BMP')
-
-            elif target_format in ['.tiff', '.tif']:
-                img.save(output_path, 'TIFF')
-
-            else:
-                # Formato desconocido, usar PIL por defecto
-                img.save(output_path)
+            with atomic_path(output_path) as temp_path:
+                self.write_image(img, temp_path, target_format, quality)
 
             return True
 
@@ -141,67 +157,235 @@ class FormatConverter:
             print(f"Error al convertir {input_path.name}: {e}")
             return False
 
+    @staticmethod
+    def write_image(
+        img: Image.Image,
+        output: Union[Path, BinaryIO],
+        target_format: str,
+        quality: int = 95
+    ):
+        """
+        Codifica una imagen en el formato destino.
+
+        Args:
+            img: Objeto Image de PIL
+            output: Ruta de salida o stream binario (ej: io.BytesIO)
+            target_format: Extensión destino normalizada (ej: '.jpg')
+            quality: Calidad JPEG (1-100)
+        """
+        # Convertir según formato
+        if target_format in ['.jpg', '.jpeg']:
+            # Convertir a RGB si es necesario (PNG con alpha -> JPG)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                # Crear fondo blanco
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                if img.mode == 'P':
+                    img = img.convert('RGBA')
+                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            img.save(output, 'JPEG', quality=quality, optimize=True)
+
+        elif target_format == '.png':
+            img.save(output, 'PNG', optimize=True)
+
+        elif target_format == '.bmp':
+            if img.mode == 'RGBA':
+                img = img.convert('RGB')
+            img.save(output, 'BMP')
+
+        elif target_format in ['.tiff', '.tif']:
+            img.save(output, 'TIFF')
+
+        elif isinstance(output, Path):
+            # Formato desconocido, usar PIL por defecto
+            img.save(output)
+
+        else:
+            # Un stream no tiene extensión: usar JPEG por defecto
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.save(output, 'JPEG', quality=quality)
+
     def convert_batch(
         self,
         input_dir: Path,
         output_dir: Path,
         quality: int = 95,
-        extensions: Optional[List[str]] = None
+        extensions: Optional[List[str]] = None,
+        incremental: bool = True,
+        workers: Optional[int] = 1
     ) -> Dict:
         """
         Convierte todas las imágenes de un directorio.
 
+        En modo incremental solo convierte las imágenes nuevas o modificadas
+        desde la última ejecución, según el manifiesto guardado en output_dir.
+
         Args:
             input_dir: Directorio de entrada
             output_dir: Directorio de salida
             quality: Calidad JPEG (1-100)
             extensions: Lista de extensiones a procesar
+            incremental: Saltar imágenes sin cambios (default: True)
+            workers: Imágenes en paralelo (None = tamaño del pool compartido)
 
         Returns:
-            Dict con estadísticas del proceso
+            Dict con estadísticas del proceso (files en orden de entrada)
         """
         if extensions is None:
             extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
 
-        output_dir.mkdir(parents=True, exist_ok=True)
+        ensure_directory(output_dir)
+
+        # Sincronizar el índice de metadata con el disco una vez por lote
+        if self.metadata_store is not None:
+            self.metadata_store.refresh()
+            with self._batch_formats_lock:
+                self._batch_formats.clear()
+
+        manifest_path = output_dir / self.MANIFEST_NAME
+        manifest = self._load_manifest(manifest_path) if incremental else {}
+        seen = set()
 
         stats = {
             'total': 0,
             'converted': 0,
+            'skipped': 0,
             'failed': 0,
             'files': []
         }
 
-        # Procesar cada archivo
-        for ext in extensions:
-            for img_path in input_dir.glob(f"*{ext}"):
-                stats['total'] += 1
-
-                # Mantener nombre original
-                output_path = output_dir / img_path.name
+        # Seleccionar solo archivos nuevos o modificados (en cualquier shard).
+        # El manifiesto usa <año>/<lote>/<nombre> para los archivos de un lote
+        input_layout = get_layout(input_dir)
+        output_layout = get_layout(output_dir)
+        pending = []
+        for img_path in sorted(input_layout.iter_files(extensions), key=lambda p: p.name):
+            stats['total'] += 1
+            subdir = input_layout.subdir_of(img_path)
+            key = f"{subdir}/{img_path.name}" if subdir else img_path.name
+            seen.add(key)
+
+            st = img_path.stat()
+            if incremental and self._is_up_to_date(img_path, st, manifest.get(key)):
+                stats['skipped'] += 1
+                continue
+
+            pending.append((img_path, st, key, subdir))
+
+        # Convertir en el pool compartido (resultados en orden de entrada)
+        def convert(item):
+            img_path, _, _, subdir = item
+            target_format = self.get_original_format(img_path.name, subdir)
+            # Mantener nombre original (y subcarpeta de lote) con la extensión del formato destino
+            output_path = output_layout.path_for(Path(img_path.name).with_suffix(target_format).name, subdir)
+            ensure_directory(output_path.parent)
+
+            if self.blob_store is not None and self._same_format(img_path.suffix, target_format):
+                # Mismo formato: la salida es el mismo contenido (sin recodificar)
+                digest = self.blob_store.store(img_path, output_path)
+                return output_path, True, digest
+
+            success = self.convert_image(
+                input_path=img_path,
+                output_path=output_path,
+                target_format=target_format,
+                quality=quality
+            )
+            if success and self.blob_store is not None:
+                self.blob_store.ingest(output_path)
+            digest = self._file_hash(img_path) if success else None
+            return output_path, success, digest
+
+        for item, result, error in map_ordered(convert, pending, workers):
+            img_path, st, key, _ = item
+            if error is None and result[1]:
+                output_path, _, digest = result
+                stats['converted'] += 1
+                stats['files'].append(str(output_path))
+                manifest[key] = {
+                    'size': st.st_size,
+                    'mtime_ns': st.st_mtime_ns,
+                    'sha256': digest,
+                    'output': str(output_path)
+                }
+            else:
+                if error is not None:
+                    print(f"Error al convertir {img_path.name}: {error}")
+                stats['failed'] += 1
+                manifest.pop(key, None)
 
-                # Convertir
-                success = self.convert_image(
-                    input_path=img_path,
-                    output_path=output_path,
-                    target_format=None,  # Detectar desde metadata
-                    quality=quality
-                )
+        # Olvidar fuentes que ya no existen (sus salidas se conservan)
+        for name in list(manifest):
+            if name not in seen:
+                del manifest[name]
 
-                if success:
-                    stats['converted'] += 1
-                    stats['files'].append(str(output_path))
-                else:
-                    stats['failed'] += 1
+        if incremental:
+            self._save_manifest(manifest_path, manifest)
 
         return stats
 
+    def _is_up_to_date(self, img_path: Path, st: os.stat_result, entry: Optional[Dict]) -> bool:
+        """
+        Indica si la salida registrada en el manifiesto sigue vigente.
+
+        Compara tamaño y mtime; si solo cambió el mtime (ej: copia o touch),
+        compara el hash del contenido antes de reconvertir.
+        """
+        if not entry or not Path(entry['output']).exists():
+            return False
+
+        if entry['size'] != st.st_size:
+            return False
+
+        if entry['mtime_ns'] == st.st_mtime_ns:
+            return True
+
+        if entry.get('sha256') == self._file_hash(img_path):
+            entry['mtime_ns'] = st.st_mtime_ns
+            return True
+
+        return False
+
+    @staticmethod
+    def _same_format(suffix: str, target_format: str) -> bool:
+        """True si la extensión ya corresponde al formato destino."""
+        aliases = {'.jpeg': '.jpg', '.tif': '.tiff'}
+        suffix, target_format = suffix.lower(), target_format.lower()
+        return aliases.get(suffix, suffix) == aliases.get(target_format, target_format)
+
+    @staticmethod
+    def _file_hash(path: Path) -> str:
+        """SHA-256 del contenido de un archivo (leído por bloques)."""
+        return file_sha256(path)
+
+    @staticmethod
+    def _load_manifest(manifest_path: Path) -> Dict[str, Dict]:
+        """Carga el manifiesto de conversiones previas (vacío si no existe)."""
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('entries', {})
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_manifest(manifest_path: Path, entries: Dict[str, Dict]):
+        """Guarda el manifiesto de forma atómica."""
+        write_json_atomic(manifest_path, {'version': 1, 'entries': entries}, indent=None)
+
 
 def convert_to_original_format(
     input_dir: str,
     output_dir: str,
     metadata_dir: Optional[str] = "./metadata",
-    quality: int = 95
+    quality: int = 95,
+    incremental: bool = True,
+    workers: int = 1
 ) -> Dict:
     """
     Función helper para convertir imágenes al formato original.
@@ -211,18 +395,23 @@ def convert_to_original_format(
         output_dir: Directorio para guardar con formato original
         metadata_dir: Directorio con archivos de metadata
         quality: Calidad JPEG (1-100)
+        incremental: Convertir solo imágenes nuevas o modificadas
+        workers: Hilos de conversión en paralelo
 
     Returns:
         Dict con estadísticas
     """
     converter = FormatConverter(
-        metadata_dir=Path(metadata_dir) if metadata_dir else None
+        metadata_dir=Path(metadata_dir) if metadata_dir else None,
+        blob_store=open_blob_store()
     )
 
     return converter.convert_batch(
         input_dir=Path(input_dir),
         output_dir=Path(output_dir),
-        quality=quality
+        quality=quality,
+        incremental=incremental,
+        workers=workers
     )
 
 
@@ -252,6 +441,17 @@ def main():
         default=95,
         help='Calidad JPEG 1-100 (default: 95)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Hilos de conversión en paralelo (default: 1)'
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Reconvertir todo, ignorando el manifiesto incremental'
+    )
 
     args = parser.parse_args()
 
@@ -264,7 +464,9 @@ def main():
         input_dir=args.input_dir,
         output_dir=args.output_dir,
         metadata_dir=args.metadata_dir,
-        quality=args.quality
+        quality=args.quality,
+        incremental=not args.full,
+        workers=args.workers
     )
 
     print(f"\n{'='*60}")
@@ -272,6 +474,7 @@ def main():
     print(f"{'='*60}")
     print(f"Total procesadas: {stats['total']}")
     print(f"Convertidas exitosamente: {stats['converted']}")
+    print(f"Sin cambios (saltadas): {stats['skipped']}")
     print(f"Fallidas: {stats['failed']}")
     print(f"{'='*60}\n")
 
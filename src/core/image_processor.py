@@ -8,6 +8,8 @@ import numpy as np
 from pathlib import Path
 from typing import Optional, Tuple
 
+from src.utils.file_utils import atomic_path, ensure_directory
+
 
 class ImageProcessor:
     """Procesador de imágenes con Pillow."""
@@ -121,7 +123,7 @@ class ImageProcessor:
             True si se guardó correctamente, False en caso contrario
         """
         try:
-            filepath.parent.mkdir(parents=True, exist_ok=True)
+            ensure_directory(filepath.parent)
 
             # Configurar opciones según formato
             save_kwargs = {}
@@ -129,7 +131,9 @@ class ImageProcessor:
                 save_kwargs['quality'] = quality
                 save_kwargs['optimize'] = True
 
-            img.save(filepath, **save_kwargs)
+            # Temporal + rename: nunca queda una imagen a medias en la ruta final
+            with atomic_path(filepath) as temp_path:
+                img.save(temp_path, **save_kwargs)
             return True
         except Exception as e:
             return False
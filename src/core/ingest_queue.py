@@ -0,0 +1,199 @@
+"""
+Cola de ingesta continua.
+Alimenta a un procesador persistente (modelos ya cargados) con archivos
+a medida que llegan, con contrapresión cuando la cola está llena.
+"""
+
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, List, Optional
+
+from src.utils.logger import setup_logger
+
+
+class IngestQueue:
+    """
+    Cola acotada procesada por uno o más hilos trabajadores.
+
+    El procesador se crea una sola vez y lo comparten todos los
+    trabajadores (cada hilo usa su propio detector facial, ver
+    PerThreadFaceDetector). put() bloquea cuando la cola está llena, de
+    modo que el productor (subida, vigilancia) se frena al ritmo del
+    procesamiento.
+
+    El lock se toma cuando el primer trabajador empieza un archivo y se
+    libera cuando el último termina: los trabajadores de la cola procesan
+    en paralelo entre sí, pero no a la vez que otro procesamiento del
+    mismo índice.
+    """
+
+    def __init__(
+        self,
+        processor_factory: Callable[[], Any],
+        maxsize: int = 64,
+        on_idle: Optional[Callable[[], None]] = None,
+        lock: Optional[ContextManager] = None,
+        workers: int = 1
+    ):
+        """
+        Inicializa la cola.
+
+        Args:
+            processor_factory: Función que crea el procesador (DeterministicPhotoProcessor)
+            maxsize: Máximo de archivos en espera
+            on_idle: Función a ejecutar cada vez que la cola queda vacía
+            lock: Lock (o Lease del JobStore) compartido con otros
+                procesamientos del mismo índice
+            workers: Hilos trabajadores que procesan archivos a la vez
+        """
+        self.processor_factory = processor_factory
+        self.on_idle = on_idle
+        self.logger = setup_logger()
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = lock or threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._workers = max(1, int(workers))
+        self._threads: List[threading.Thread] = []
+        self._processor = None
+
+        # Trabajadores con un archivo en curso (mientras > 0, _lock está tomado)
+        self._holders = 0
+        self._holders_lock = threading.Lock()
+
+        self.counters = {
+            "enqueued": 0,
+            "processed": 0,
+            "skipped": 0,
+            "failed": 0
+        }
+
+    def start(self):
+        """Inicia los hilos trabajadores que no estén corriendo."""
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        for index in range(len(self._threads), self._workers):
+            thread = threading.Thread(
+                target=self._worker,
+                name=f"ingest-worker-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, img_path: Path, batch_id: Optional[str] = None, timeout: Optional[float] = None):
+        """
+        Encola un archivo para procesar.
+
+        Bloquea mientras la cola esté llena (contrapresión).
+
+        Raises:
+            queue.Full: Si se indicó timeout y no hubo espacio a tiempo
+        """
+        self.start()
+        self._queue.put((Path(img_path), batch_id), timeout=timeout)
+
+        with self._stats_lock:
+            self.counters["enqueued"] += 1
+
+    def join(self):
+        """Espera a que se procesen todos los archivos encolados."""
+        self._queue.join()
+
+    def stop(self, wait: bool = True):
+        """Detiene los hilos trabajadores después de vaciar la cola."""
+        if not self._threads:
+            return
+
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    @contextmanager
+    def _hold_lock(self):
+        """
+        Mantiene _lock tomado mientras algún trabajador tenga un archivo en
+        curso. Al tomarlo se recarga el índice, porque otro procesamiento
+        pudo haberlo actualizado mientras estaba libre.
+        """
+        with self._holders_lock:
+            if self._holders == 0:
+                self._lock.acquire()
+                try:
+                    processor = self._get_processor()
+                    processor.processed_index.reload()
+                except BaseException:
+                    self._lock.release()
+                    raise
+            self._holders += 1
+        try:
+            yield self._processor
+        finally:
+            with self._holders_lock:
+                self._holders -= 1
+                if self._holders == 0:
+                    self._lock.release()
+
+    def _get_processor(self):
+        """Crea el procesador la primera vez (carga de modelos)."""
+        if self._processor is None:
+            self._processor = self.processor_factory()
+        return self._processor
+
+    def _worker(self):
+        """Bucle del hilo trabajador."""
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                self._queue.task_done()
+                break
+
+            img_path, batch_id = item
+            result = "failed"
+
+            try:
+                with self._hold_lock() as processor:
+                    result = "processed" if processor.process_file(img_path, batch_id) else "skipped"
+            except Exception as e:
+                self.logger.error(f"Error en ingesta de {img_path.name}: {e}", exc_info=True)
+            finally:
+                with self._stats_lock:
+                    self.counters[result] += 1
+                self._queue.task_done()
+
+            if self._drained():
+                self._on_queue_drained()
+
+    def _drained(self) -> bool:
+        """True si no queda nada en la cola ni en curso en otro trabajador."""
+        with self._queue.mutex:
+            return self._queue.unfinished_tasks == 0
+
+    def _on_queue_drained(self):
+        """Cierra los resúmenes de lote y ejecuta on_idle al vaciarse la cola."""
+        try:
+            with self._hold_lock():
+                if self._processor is not None:
+                    self._processor.finalize_summaries()
+                if self.on_idle is not None:
+                    self.on_idle()
+        except Exception as e:
+            self.logger.error(f"Error en tarea posterior a la ingesta: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna contadores y ocupación de la cola."""
+        with self._stats_lock:
+            stats = dict(self.counters)
+
+        stats.update({
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "workers": self._workers,
+            "running": any(thread.is_alive() for thread in self._threads)
+        })
+        return stats
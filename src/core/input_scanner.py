@@ -0,0 +1,176 @@
+"""
+Escaneo incremental de input_raw.
+Recorre la carpeta con os.scandir (tipo y stat cacheados por entrada) y
+compara contra un snapshot persistente de (ruta relativa, tamaño, mtime_ns),
+para entregar solo los archivos nuevos o modificados a medida que se
+encuentran. Opcionalmente desciende a las carpetas de lote
+(input_raw/<año>/<lote>/).
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from src.utils.file_utils import ensure_directory, write_json_atomic
+
+
+class InputScanner:
+    """
+    Generador de archivos nuevos o modificados de una carpeta de entrada.
+
+    El snapshot (por defecto metadata/.input_snapshot.json) guarda la firma
+    [size, mtime_ns] de cada archivo ya resuelto. Un archivo entra al
+    snapshot cuando el procesador lo marca con mark(); si el procesamiento
+    se interrumpe, el archivo vuelve a entregarse en la siguiente ejecución.
+
+    Si processed_index.json se reinicia (su total baja respecto del
+    registrado), el snapshot se descarta y se reescanea todo. Además, un
+    archivo sin cambios solo se omite si sigue registrado en el índice
+    (parámetro known de scan()): los que recover() o un operador quitaron
+    del índice se vuelven a entregar aunque el total no haya bajado.
+    """
+
+    SNAPSHOT_NAME = ".input_snapshot.json"
+    SNAPSHOT_VERSION = 1
+
+    def __init__(
+        self,
+        input_dir: Path,
+        snapshot_path: Path,
+        extensions: Iterable[str],
+        min_size: int = 0,
+        recursive: bool = False,
+        logger=None
+    ):
+        """
+        Args:
+            input_dir: Carpeta a escanear
+            snapshot_path: Ruta del snapshot persistente
+            extensions: Extensiones válidas (en minúsculas, con punto)
+            min_size: Tamaño mínimo en bytes (los menores se ignoran)
+            recursive: Descender a subcarpetas (lotes); si es False, solo el nivel raíz
+            logger: Logger opcional para avisos
+        """
+        self.input_dir = Path(input_dir)
+        self.snapshot_path = Path(snapshot_path)
+        self.extensions = {ext.lower() for ext in extensions}
+        self.min_size = min_size
+        self.recursive = recursive
+        self.logger = logger
+
+        self._snapshot: Dict[str, List[int]] = {}
+        self._seen: Dict[str, List[int]] = {}
+        self._resolved: Dict[str, List[int]] = {}
+
+        # Contadores de la última pasada (unchanged_by_dir: carpeta relativa → sin cambios)
+        self.found = 0
+        self.unchanged = 0
+        self.unchanged_by_dir: Dict[str, int] = {}
+
+    def scan(self, index_total: int = 0, known: Optional[Callable[[Path], bool]] = None) -> Iterator[Path]:
+        """
+        Recorre la carpeta y entrega solo archivos nuevos o modificados.
+
+        Args:
+            index_total: total_processed actual de processed_index.json
+                (si es menor que el del snapshot, el snapshot se descarta)
+            known: Retorna si un archivo sigue registrado como resuelto
+                (None = confiar en el snapshot); los que no, se entregan
+                aunque su firma coincida
+        """
+        self._load(index_total)
+        self._seen = {}
+        self._resolved = {}
+        self.found = 0
+        self.unchanged = 0
+        self.unchanged_by_dir = {}
+
+        if not self.input_dir.exists():
+            return
+
+        # Recorrido en profundidad: los archivos de cada carpeta se entregan
+        # apenas se listan, antes de bajar a las subcarpetas
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            subdirs = []
+
+            with os.scandir(self.input_dir / rel_dir) as entries:
+                for entry in entries:
+                    # Excluir ocultos y extensiones no válidas
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive:
+                            subdirs.append(f"{rel_dir}/{entry.name}" if rel_dir else entry.name)
+                        continue
+                    if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in self.extensions:
+                        continue
+
+                    st = entry.stat()
+                    if st.st_size < self.min_size:
+                        if self.logger:
+                            self.logger.warning(f"Archivo muy pequeño, ignorando: {entry.name}")
+                        continue
+
+                    key = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    signature = [st.st_size, st.st_mtime_ns]
+                    self.found += 1
+                    self._seen[key] = signature
+
+                    if self._snapshot.get(key) == signature and (known is None or known(Path(entry.path))):
+                        self._resolved[key] = signature
+                        self.unchanged += 1
+                        self.unchanged_by_dir[rel_dir] = self.unchanged_by_dir.get(rel_dir, 0) + 1
+                        continue
+
+                    yield Path(entry.path)
+
+            stack.extend(sorted(subdirs, reverse=True))
+
+    def mark(self, img_path: Path):
+        """
+        Registra un archivo entregado por scan() como resuelto.
+        Puede llamarse desde otros hilos mientras el escaneo continúa.
+        """
+        key = Path(img_path).relative_to(self.input_dir).as_posix()
+        signature = self._seen.get(key)
+        if signature is not None:
+            self._resolved[key] = signature
+
+    def save(self, index_total: int):
+        """
+        Persiste el snapshot de la última pasada (los archivos que ya no
+        están en la carpeta se descartan).
+        """
+        self._snapshot = dict(self._resolved)
+        try:
+            ensure_directory(self.snapshot_path.parent)
+            write_json_atomic(self.snapshot_path, {
+                "version": self.SNAPSHOT_VERSION,
+                "input_dir": str(self.input_dir.resolve()),
+                "recursive": self.recursive,
+                "index_total": index_total,
+                "files": self._snapshot
+            }, indent=None)
+        except OSError as e:
+            if self.logger:
+                self.logger.warning(f"No se pudo guardar el snapshot de entrada: {e}")
+
+    def _load(self, index_total: int):
+        """Carga el snapshot (vacío si no existe, es de otra carpeta o el índice se reinició)."""
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+
+        valid = (
+            data.get("version") == self.SNAPSHOT_VERSION
+            and data.get("input_dir") == str(self.input_dir.resolve())
+            and data.get("recursive", False) == self.recursive
+            and data.get("index_total", 0) <= index_total
+        )
+        self._snapshot = data.get("files", {}) if valid else {}
+
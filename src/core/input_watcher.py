@@ -0,0 +1,272 @@
+"""
+Vigilancia continua de input_raw (incluidas sus subcarpetas <año>/<lote>/).
+Detecta fotos nuevas con inotify (si inotify_simple está instalado, Linux)
+o por sondeo con os.scandir, espera a que terminen de escribirse y las
+encola en una IngestQueue con el procesador ya cargado.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.core.ingest_queue import IngestQueue
+from src.utils.file_utils import ensure_directory
+from src.utils.logger import setup_logger
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    INOTIFY_AVAILABLE = True
+except ImportError:
+    INOTIFY_AVAILABLE = False
+
+
+class InputWatcher:
+    """
+    Observa una carpeta (y sus subcarpetas) y encola cada archivo cuando
+    está completo. Los archivos se identifican por su ruta relativa a la
+    carpeta vigilada (ej: "2026/admision_01/foto.jpg").
+
+    Un archivo se considera completo cuando llega un evento close-write o
+    moved-to (inotify), o cuando su tamaño y mtime no cambian durante
+    settle_seconds (sondeo, y también para archivos que inotify solo vio
+    crearse). Cada archivo se encola una vez por versión: si se reescribe,
+    vuelve a encolarse y el índice de procesados decide si corresponde.
+    """
+
+    def __init__(
+        self,
+        input_dir: Path,
+        ingest_queue: IngestQueue,
+        extensions: Iterable[str],
+        min_size: int = 0,
+        batch_id: Optional[str] = None,
+        settle_seconds: float = 2.0,
+        poll_interval: float = 1.0,
+        backend: str = "auto",
+        recursive: bool = True
+    ):
+        """
+        Args:
+            input_dir: Carpeta vigilada
+            ingest_queue: Cola que recibe los archivos completos
+            extensions: Extensiones válidas (en minúsculas, con punto)
+            min_size: Tamaño mínimo en bytes
+            batch_id: Lote asignado a los archivos encolados
+            settle_seconds: Segundos sin cambios para dar un archivo por completo
+            poll_interval: Segundos entre sondeos (o espera máxima de inotify)
+            backend: "inotify", "poll" o "auto" (inotify si está disponible)
+            recursive: Vigilar también las subcarpetas (processing.scan_batches)
+        """
+        self.input_dir = Path(input_dir)
+        self.ingest_queue = ingest_queue
+        self.extensions = {ext.lower() for ext in extensions}
+        self.min_size = min_size
+        self.batch_id = batch_id
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.recursive = recursive
+        self.logger = setup_logger()
+
+        if backend == "auto":
+            backend = "inotify" if INOTIFY_AVAILABLE else "poll"
+        if backend == "inotify" and not INOTIFY_AVAILABLE:
+            raise ImportError("inotify_simple no está instalado. Instalar con: pip install inotify_simple")
+        self.backend = backend
+
+        # ruta relativa → (firma, momento desde el que la firma no cambia)
+        self._pending: Dict[str, Tuple[Tuple[int, int], float]] = {}
+        # ruta relativa → firma ya encolada
+        self._enqueued: Dict[str, Tuple[int, int]] = {}
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Inicia la vigilancia en un hilo en segundo plano."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="input-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, wait: bool = True):
+        """Detiene la vigilancia."""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def run(self):
+        """Bucle de vigilancia (bloquea hasta stop())."""
+        ensure_directory(self.input_dir)
+        self.logger.info(f"Vigilando {self.input_dir} ({self.backend}, estable tras {self.settle_seconds}s)")
+
+        # Archivos que ya estaban antes de empezar
+        self._poll()
+
+        if self.backend == "inotify":
+            self._run_inotify()
+        else:
+            while not self._stop.is_set():
+                self._check_pending()
+                self._stop.wait(self.poll_interval)
+                self._poll()
+
+    def _run_inotify(self):
+        watch_flags = (
+            inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+            | inotify_flags.MODIFY | inotify_flags.DELETE | inotify_flags.MOVED_FROM
+        )
+        with INotify() as inotify:
+            # descriptor de watch → carpeta relativa ("" = raíz)
+            watches: Dict[int, str] = {}
+            self._add_watches(inotify, watch_flags, watches, "")
+
+            while not self._stop.is_set():
+                for event in inotify.read(timeout=int(self.poll_interval * 1000)):
+                    if event.mask & inotify_flags.IGNORED:
+                        # Carpeta eliminada o movida: el kernel quitó su watch
+                        watches.pop(event.wd, None)
+                        continue
+                    parent = watches.get(event.wd)
+                    if parent is None or not event.name:
+                        continue
+                    name = self._join(parent, event.name)
+
+                    if event.mask & inotify_flags.ISDIR:
+                        if (self.recursive and not event.name.startswith('.')
+                                and event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO)):
+                            # Carpeta nueva: se vigila y se recorre, porque
+                            # pudo recibir archivos antes de agregar el watch
+                            self._add_watches(inotify, watch_flags, watches, name)
+                            self._poll(name)
+                        elif event.mask & inotify_flags.MOVED_FROM:
+                            # Carpeta movida: su watch seguiría con la ruta vieja
+                            self._remove_watches(inotify, watches, name)
+                        continue
+
+                    if not self._accepts(event.name):
+                        continue
+                    if event.mask & (inotify_flags.DELETE | inotify_flags.MOVED_FROM):
+                        self._pending.pop(name, None)
+                        self._enqueued.pop(name, None)
+                    elif event.mask & (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO):
+                        # El escritor cerró el archivo: está completo
+                        signature = self._signature(self.input_dir / name)
+                        if signature is not None:
+                            self._pending.pop(name, None)
+                            self._ready(name, signature)
+                    else:
+                        self._observe(name, self._signature(self.input_dir / name))
+
+                self._check_pending()
+
+    def _add_watches(self, inotify, watch_flags, watches: Dict[int, str], relative: str):
+        """Agrega un watch a la carpeta y, si es recursivo, a sus subcarpetas."""
+        try:
+            wd = inotify.add_watch(str(self.input_dir / relative), watch_flags)
+        except OSError:
+            return
+        watches[wd] = relative
+
+        if not self.recursive:
+            return
+        for subdir in self._subdirs(relative):
+            self._add_watches(inotify, watch_flags, watches, subdir)
+
+    @staticmethod
+    def _remove_watches(inotify, watches: Dict[int, str], relative: str):
+        """Quita los watches de una carpeta relativa y de sus subcarpetas."""
+        for wd, watched in list(watches.items()):
+            if watched == relative or watched.startswith(relative + "/"):
+                del watches[wd]
+                try:
+                    inotify.rm_watch(wd)
+                except OSError:
+                    pass
+
+    def _subdirs(self, relative: str) -> List[str]:
+        """Subcarpetas visibles de una carpeta relativa."""
+        try:
+            with os.scandir(self.input_dir / relative) as entries:
+                return [
+                    self._join(relative, entry.name)
+                    for entry in entries
+                    if not entry.name.startswith('.') and entry.is_dir(follow_symlinks=False)
+                ]
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+    def _poll(self, relative: str = ""):
+        """Recorre la carpeta (y sus subcarpetas) y registra archivos nuevos o modificados."""
+        pending_dirs = [relative]
+        while pending_dirs:
+            current = pending_dirs.pop()
+            try:
+                with os.scandir(self.input_dir / current) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive:
+                                pending_dirs.append(self._join(current, entry.name))
+                        elif self._accepts(entry.name) and entry.is_file():
+                            st = entry.stat()
+                            self._observe(self._join(current, entry.name), (st.st_size, st.st_mtime_ns))
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+
+    @staticmethod
+    def _join(parent: str, name: str) -> str:
+        return f"{parent}/{name}" if parent else name
+
+    def _observe(self, name: str, signature: Optional[Tuple[int, int]]):
+        """Registra la firma actual de un archivo candidato."""
+        if signature is None or self._enqueued.get(name) == signature:
+            return
+
+        previous = self._pending.get(name)
+        if previous is None or previous[0] != signature:
+            self._pending[name] = (signature, time.monotonic())
+
+    def _check_pending(self):
+        """Encola los candidatos cuya firma no cambió durante settle_seconds."""
+        now = time.monotonic()
+        for name, (signature, since) in list(self._pending.items()):
+            current = self._signature(self.input_dir / name)
+            if current is None:
+                del self._pending[name]
+            elif current != signature:
+                self._pending[name] = (current, now)
+            elif now - since >= self.settle_seconds:
+                del self._pending[name]
+                self._ready(name, signature)
+
+    def _ready(self, name: str, signature: Tuple[int, int]):
+        """Encola un archivo completo (una vez por versión)."""
+        if self._enqueued.get(name) == signature:
+            return
+        self._enqueued[name] = signature
+
+        if signature[0] < self.min_size:
+            self.logger.warning(f"Archivo muy pequeño, ignorando: {name}")
+            return
+
+        self.logger.info(f"Archivo listo, encolando: {name}")
+        self.ingest_queue.put(self.input_dir / name, self.batch_id)
+
+    def _accepts(self, name: str) -> bool:
+        return not name.startswith('.') and os.path.splitext(name)[1].lower() in self.extensions
+
+    @staticmethod
+    def _signature(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def pending(self) -> List[str]:
+        """Archivos detectados que todavía se están escribiendo."""
+        return sorted(self._pending)
@@ -0,0 +1,261 @@
+"""
+Estado de trabajos compartido entre procesos.
+Usa SQLite en modo WAL para que varios workers de uvicorn/gunicorn vean el
+mismo estado, y un lease atómico para que un solo proceso procese a la vez.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from src.utils.file_utils import ensure_directory
+from src.utils.logger import setup_logger
+
+
+class JobStore:
+    """Almacén SQLite (WAL) de trabajos de procesamiento y leases."""
+
+    def __init__(self, db_path: str = "./metadata/jobs.db"):
+        """
+        Inicializa el almacén y crea las tablas si no existen.
+
+        Args:
+            db_path: Ruta del archivo SQLite
+        """
+        self.db_path = Path(db_path)
+        ensure_directory(self.db_path.parent)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    batch_id TEXT,
+                    owner TEXT,
+                    state TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT,
+                    stats TEXT,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_started ON jobs(started_at);
+            """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Abre una conexión nueva (una por operación, segura entre hilos)."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA busy_timeout=30000")
+            yield conn
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Leases
+    # ------------------------------------------------------------------
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Intenta tomar el lease de forma atómica.
+
+        Se obtiene si está libre, expirado o ya pertenece a owner.
+
+        Returns:
+            True si owner quedó como dueño del lease
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute("""
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE leases.expires_at < ? OR leases.owner = excluded.owner
+            """, (name, owner, now + ttl, now))
+            return cursor.rowcount == 1
+
+    def renew_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Extiende el lease si owner todavía es su dueño."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?",
+                (time.time() + ttl, name, owner)
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, name: str, owner: str):
+        """Libera el lease si owner es su dueño."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def lease_holder(self, name: str) -> Optional[str]:
+        """Retorna el dueño actual del lease, o None si está libre o expirado."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT owner FROM leases WHERE name = ? AND expires_at >= ?",
+                (name, time.time())
+            ).fetchone()
+        return row["owner"] if row else None
+
+    def lease(self, name: str, ttl: float = 60.0) -> "Lease":
+        """Crea un objeto Lease con un dueño único para este proceso."""
+        return Lease(self, name, ttl)
+
+    # ------------------------------------------------------------------
+    # Trabajos
+    # ------------------------------------------------------------------
+
+    def start_job(self, batch_id: Optional[str], owner: str) -> str:
+        """Registra un trabajo en curso y retorna su job_id."""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, batch_id, owner, state, started_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, batch_id, owner, "running", datetime.now().isoformat())
+            )
+        return job_id
+
+    def finish_job(
+        self,
+        job_id: str,
+        stats: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ):
+        """Marca un trabajo como terminado (completed o failed)."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, stats = ?, error = ? WHERE job_id = ?",
+                (
+                    "failed" if error else "completed",
+                    datetime.now().isoformat(),
+                    json.dumps(stats, ensure_ascii=False, default=str) if stats is not None else None,
+                    error,
+                    job_id
+                )
+            )
+
+    def get_status(self, lease_name: str = "pipeline") -> Dict[str, Any]:
+        """
+        Estado del procesamiento con el mismo formato que el dashboard espera.
+
+        Returns:
+            Dict con is_processing, last_run, last_stats y error
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state != 'running' ORDER BY finished_at DESC LIMIT 1"
+            ).fetchone()
+
+        status = {
+            "is_processing": self.lease_holder(lease_name) is not None,
+            "last_run": None,
+            "last_stats": None,
+            "error": None
+        }
+
+        if row:
+            status["last_run"] = row["finished_at"]
+            status["last_stats"] = json.loads(row["stats"]) if row["stats"] else None
+            status["error"] = row["error"]
+
+        return status
+
+
+class Lease:
+    """
+    Lease con renovación automática en un hilo de fondo.
+
+    Se puede usar como context manager (bloquea hasta obtenerlo) o con
+    try_acquire() para no bloquear.
+    """
+
+    def __init__(self, store: JobStore, name: str, ttl: float = 60.0, poll_interval: float = 0.5):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lost = False
+        self.logger = setup_logger()
+
+        self._held = False
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    @property
+    def held(self) -> bool:
+        return self._held
+
+    def try_acquire(self) -> bool:
+        """Intenta obtener el lease sin bloquear."""
+        if self._held:
+            return True
+
+        if not self.store.acquire_lease(self.name, self.owner, self.ttl):
+            return False
+
+        self._held = True
+        self.lost = False
+        self._stop.clear()
+        self._heartbeat = threading.Thread(
+            target=self._renew_loop,
+            name=f"lease-{self.name}",
+            daemon=True
+        )
+        self._heartbeat.start()
+        return True
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Bloquea hasta obtener el lease (o hasta timeout segundos)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def release(self):
+        """Libera el lease y detiene la renovación."""
+        if not self._held:
+            return
+
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+        self.store.release_lease(self.name, self.owner)
+        self._held = False
+
+    def _renew_loop(self):
+        """Renueva el lease cada tercio del ttl mientras esté tomado."""
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.store.renew_lease(self.name, self.owner, self.ttl):
+                    self.lost = True
+                    self.logger.error(f"Se perdió el lease '{self.name}' ({self.owner})")
+                    return
+            except sqlite3.Error as e:
+                self.logger.warning(f"No se pudo renovar el lease '{self.name}': {e}")
+
+    def __enter__(self) -> "Lease":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,329 @@
+"""
+Archivo de metadatos en segmentos comprimidos.
+Empaqueta los lotes de años cerrados en un archivo por lote con un miembro
+comprimido por registro (zstd si está instalado, si no gzip) y una tabla de
+offsets, para leer cualquier registro con acceso aleatorio.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.core.metadata_query import query_fields
+from src.utils.file_utils import atomic_path, ensure_directory
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+class MetadataArchive:
+    """
+    Segmentos en metadata/archive/<año>/<lote>/:
+
+    - records-<generación>.seg: miembros comprimidos concatenados (uno por
+      registro, en orden de stem)
+    - records.idx.json: codec, nombre del segmento vigente y tabla
+      stem → [offset, length, format, last_updated, status, num_faces]
+      (lo necesario para ubicar, resolver formatos y filtrar consultas sin
+      descomprimir; los segmentos anteriores solo tienen los cuatro primeros)
+    - batch_summary.json / batch_images.jsonl del lote, si existían
+
+    Reescribir un lote crea un segmento de la generación siguiente y
+    después reemplaza el índice: ese rename es el único punto de commit.
+    Un corte antes deja el índice anterior apuntando a su segmento intacto.
+    La generación anterior se conserva hasta la siguiente reescritura, para
+    los lectores (y punteros de SQLite) que todavía la usan.
+    """
+
+    # Segmento de los índices sin "segment" (versión 1)
+    SEGMENT_NAME = "records.seg"
+    INDEX_NAME = "records.idx.json"
+    INDEX_VERSION = 2
+
+    # Archivos del lote que acompañan al segmento
+    ATTACHED_FILES = ("batch_summary.json", "batch_images.jsonl")
+
+    def __init__(self, archive_dir: Path, codec: Optional[str] = None):
+        """
+        Args:
+            archive_dir: Carpeta raíz del archivo (metadata/archive)
+            codec: "zstd" o "gzip" para segmentos nuevos (None = zstd si está disponible)
+        """
+        self.archive_dir = Path(archive_dir)
+        self.codec = codec or ("zstd" if ZSTD_AVAILABLE else "gzip")
+        if self.codec == "zstd" and not ZSTD_AVAILABLE:
+            raise ImportError("zstandard no está instalado. Instalar con: pip install zstandard")
+
+        self._lock = threading.Lock()
+        self._indexes: Dict[Tuple[int, str], Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        self._by_stem: Optional[Dict[str, Dict[str, Any]]] = None
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def segment_dir(self, year: int, batch_id: str) -> Path:
+        return self.archive_dir / str(year) / batch_id
+
+    def write_segment(self, year: int, batch_id: str, records: Iterable[Dict[str, Any]]) -> Dict[str, List]:
+        """
+        Escribe (o reemplaza) el segmento de un lote.
+
+        Args:
+            records: Metadatos tal como están guardados (historial sin expandir)
+
+        Returns:
+            Tabla stem → [offset, length, format, last_updated, status, num_faces]
+        """
+        segment_dir = self.segment_dir(year, batch_id)
+        ensure_directory(segment_dir)
+        index_path = segment_dir / self.INDEX_NAME
+
+        # Un segmento existente se conserva: sus registros se reescriben
+        # junto con los nuevos (los nuevos reemplazan a los del mismo stem)
+        previous = self.index(year, batch_id)
+        merged = {Path(m["filename"]).stem: m for m in self.iter_segment(year, batch_id)}
+        for metadata in records:
+            merged[Path(metadata["filename"]).stem] = metadata
+
+        generation = (previous.get("generation", 0) + 1) if previous else 1
+        segment_name = f"records-{generation}.seg"
+        compress = self._compressor(self.codec)
+        table = {}
+
+        # El segmento nuevo no lo referencia nadie hasta que se reemplaza
+        # el índice: ese rename es el único punto de commit
+        with atomic_path(segment_dir / segment_name) as temp_segment:
+            with open(temp_segment, 'wb') as f:
+                offset = 0
+                for stem in sorted(merged):
+                    metadata = merged[stem]
+                    payload = compress(json.dumps(metadata, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+                    f.write(payload)
+                    table[stem] = [
+                        offset, len(payload), metadata.get("format"), metadata.get("last_updated"),
+                        metadata.get("status"), metadata.get("num_faces")
+                    ]
+                    offset += len(payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+        with atomic_path(index_path) as temp_index:
+            with open(temp_index, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "version": self.INDEX_VERSION,
+                    "codec": self.codec,
+                    "generation": generation,
+                    "segment": segment_name,
+                    "records": table
+                }, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+
+        with self._lock:
+            self._indexes.pop((int(year), batch_id), None)
+            self._by_stem = None
+
+        # Se conservan la generación vigente y la anterior
+        keep = {segment_name, self.segment_name(previous)} if previous else {segment_name}
+        for entry in os.scandir(segment_dir):
+            if entry.name.endswith(".seg") and entry.name.startswith("records") and entry.name not in keep:
+                os.unlink(entry.path)
+
+        return table
+
+    def segment_name(self, data: Dict[str, Any]) -> str:
+        """Archivo de segmento al que apunta un índice."""
+        return data.get("segment", self.SEGMENT_NAME)
+
+    def current_segment(self, year: int, batch_id: str) -> Optional[str]:
+        """Nombre del segmento vigente de un lote (None si no está archivado)."""
+        data = self.index(year, batch_id)
+        return self.segment_name(data) if data is not None else None
+
+    def attach_file(self, year: int, batch_id: str, source: Path):
+        """Mueve un archivo auxiliar del lote (resumen) a la carpeta del segmento."""
+        if source.exists():
+            destination = self.segment_dir(year, batch_id) / source.name
+            ensure_directory(destination.parent)
+            shutil.move(str(source), str(destination))
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def segments(self, year: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Lotes archivados (año, batch_id), ordenados."""
+        found = []
+        if not self.archive_dir.exists():
+            return found
+
+        for year_entry in os.scandir(self.archive_dir):
+            if not year_entry.is_dir() or not year_entry.name.isdigit():
+                continue
+            if year is not None and int(year_entry.name) != int(year):
+                continue
+            for batch_entry in os.scandir(year_entry.path):
+                if os.path.exists(os.path.join(batch_entry.path, self.INDEX_NAME)):
+                    found.append((int(year_entry.name), batch_entry.name))
+
+        return sorted(found)
+
+    def index(self, year: int, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Índice de un segmento (en caché mientras no cambie en disco)."""
+        index_path = self.segment_dir(year, batch_id) / self.INDEX_NAME
+        try:
+            st = index_path.stat()
+        except FileNotFoundError:
+            return None
+
+        # El reemplazo atómico crea un inodo nuevo: cambia aunque el mtime no
+        version = (st.st_mtime_ns, st.st_ino)
+        key = (int(year), batch_id)
+        with self._lock:
+            cached = self._indexes.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+
+        with open(index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        with self._lock:
+            self._indexes[key] = (version, data)
+        return data
+
+    def read(self, year: int, batch_id: str, stem: str) -> Optional[Dict[str, Any]]:
+        """Lee un registro con acceso aleatorio (un seek + una descompresión)."""
+        data = self.index(year, batch_id)
+        if data is None:
+            return None
+
+        entry = data["records"].get(stem)
+        if entry is None:
+            return None
+
+        return self.read_at(year, batch_id, entry[0], entry[1], data["codec"], self.segment_name(data))
+
+    def read_at(
+        self,
+        year: int,
+        batch_id: str,
+        offset: int,
+        length: int,
+        codec: Optional[str] = None,
+        segment: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Lee el registro en la posición indicada de un segmento.
+
+        Args:
+            codec: Codec del segmento (None = el del índice vigente)
+            segment: Archivo de segmento (None = el vigente)
+        """
+        if codec is None or segment is None:
+            data = self.index(year, batch_id)
+            codec = codec or data["codec"]
+            segment = segment or self.segment_name(data)
+
+        with open(self.segment_dir(year, batch_id) / segment, 'rb') as f:
+            f.seek(offset)
+            payload = f.read(length)
+
+        return json.loads(self._decompressor(codec)(payload))
+
+    def iter_segment(self, year: int, batch_id: str) -> Iterator[Dict[str, Any]]:
+        """Recorre un segmento completo en orden de stem (lectura secuencial)."""
+        data = self.index(year, batch_id)
+        if data is None:
+            return
+
+        decompress = self._decompressor(data["codec"])
+        entries = sorted(data["records"].values(), key=lambda e: e[0])
+        with open(self.segment_dir(year, batch_id) / self.segment_name(data), 'rb') as f:
+            for offset, length, *_ in entries:
+                f.seek(offset)
+                yield json.loads(decompress(f.read(length)))
+
+    def query_fields(self, year: int, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Campos de búsqueda (status, format, num_faces, last_updated) de cada
+        registro, desde la tabla del índice. Los segmentos escritos antes de
+        que la tabla los incluyera se leen completos una vez.
+        """
+        data = self.index(year, batch_id)
+        if data is None:
+            return {}
+
+        records = data["records"]
+        if all(len(entry) >= 6 for entry in records.values()):
+            return {
+                stem: {"status": status, "format": img_format, "num_faces": num_faces, "last_updated": last_updated}
+                for stem, (_, _, img_format, last_updated, status, num_faces, *_) in records.items()
+            }
+
+        return {
+            Path(metadata["filename"]).stem: query_fields(metadata)
+            for metadata in self.iter_segment(year, batch_id)
+        }
+
+    def count(self) -> int:
+        return sum(len(self.index(year, batch_id)["records"]) for year, batch_id in self.segments())
+
+    def signature(self, year: int, batch_id: str) -> str:
+        """Firma de un segmento (cambia si se reescribe)."""
+        index_path = self.segment_dir(year, batch_id) / self.INDEX_NAME
+        data = self.index(year, batch_id)
+        return f"{data.get('generation', 0)}:{len(data['records'])}:{index_path.stat().st_mtime_ns}"
+
+    def find_latest(self, stem: str) -> Optional[Dict[str, Any]]:
+        """Busca un stem en todos los segmentos (mismo criterio que MetadataIndex)."""
+        with self._lock:
+            by_stem = self._by_stem
+
+        if by_stem is None:
+            by_stem = {}
+            for year, batch_id in self.segments():
+                for record_stem, (_, _, img_format, last_updated, *_) in self.index(year, batch_id)["records"].items():
+                    rank = (last_updated or "", f"{year}/{batch_id}/{record_stem}.json")
+                    current = by_stem.get(record_stem)
+                    if current is None or current["rank"] < rank:
+                        by_stem[record_stem] = {
+                            "format": img_format,
+                            "last_updated": last_updated,
+                            "rank": rank
+                        }
+            with self._lock:
+                self._by_stem = by_stem
+
+        return by_stem.get(stem)
+
+    def refresh(self):
+        """Descarta los índices en caché (se releen en el próximo acceso)."""
+        with self._lock:
+            self._indexes.clear()
+            self._by_stem = None
+
+    # ------------------------------------------------------------------
+    # Codecs
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _compressor(codec: str):
+        if codec == "zstd":
+            return zstandard.ZstdCompressor(level=10).compress
+        return lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+
+    @staticmethod
+    def _decompressor(codec: str):
+        if codec == "zstd":
+            if not ZSTD_AVAILABLE:
+                raise ImportError("Segmento zstd: instalar zstandard para leerlo")
+            return zstandard.ZstdDecompressor().decompress
+        return gzip.decompress
@@ -0,0 +1,292 @@
+"""
+Exportación columnar de metadatos para análisis.
+Convierte el backend de metadatos en un archivo por lote (Parquet si
+pyarrow está instalado, si no CSV comprimido con gzip), con face_box
+aplanado y métricas derivadas, sin cargar todo en memoria.
+"""
+
+import csv
+import gzip
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.core.metadata_store import MetadataStore, open_metadata_store
+from src.utils.file_utils import atomic_path, ensure_directory, write_json_atomic
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+# Columnas exportadas (en este orden)
+COLUMNS = [
+    "year", "batch_id", "filename", "status", "format", "width", "height",
+    "orientation", "face_detected", "num_faces",
+    "face_x", "face_y", "face_width", "face_height",
+    "face_area_ratio", "face_width_ratio", "face_height_ratio",
+    "processing_time", "last_updated", "processing_seconds",
+    "history_length", "background_removed", "error_message", "file_hash"
+]
+
+# Tipos para el esquema Parquet
+_INT_COLUMNS = {"year", "width", "height", "num_faces", "face_x", "face_y",
+                "face_width", "face_height", "history_length"}
+_FLOAT_COLUMNS = {"face_area_ratio", "face_width_ratio", "face_height_ratio", "processing_seconds"}
+_BOOL_COLUMNS = {"face_detected", "background_removed"}
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parsea timestamps ISO8601 con sufijo Z."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def flatten_metadata(year: int, batch_id: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte un metadato en una fila plana.
+
+    face_box [x, y, w, h] se separa en columnas y se agregan las
+    proporciones del rostro respecto de la imagen y la duración del
+    procesamiento (last_updated - processing_time).
+    """
+    width = metadata.get("width")
+    height = metadata.get("height")
+
+    face_box = metadata.get("face_box")
+    face_x = face_y = face_w = face_h = None
+    if isinstance(face_box, (list, tuple)) and len(face_box) == 4:
+        face_x, face_y, face_w, face_h = face_box
+
+    area_ratio = width_ratio = height_ratio = None
+    if face_w and face_h and width and height:
+        area_ratio = round(face_w * face_h / (width * height), 6)
+        width_ratio = round(face_w / width, 6)
+        height_ratio = round(face_h / height, 6)
+
+    started = _parse_timestamp(metadata.get("processing_time"))
+    finished = _parse_timestamp(metadata.get("last_updated"))
+    seconds = round((finished - started).total_seconds(), 3) if started and finished else None
+
+    return {
+        "year": year,
+        "batch_id": batch_id,
+        "filename": metadata.get("filename"),
+        "status": metadata.get("status"),
+        "format": metadata.get("format"),
+        "width": width,
+        "height": height,
+        "orientation": metadata.get("orientation"),
+        "face_detected": metadata.get("face_detected"),
+        "num_faces": metadata.get("num_faces"),
+        "face_x": face_x,
+        "face_y": face_y,
+        "face_width": face_w,
+        "face_height": face_h,
+        "face_area_ratio": area_ratio,
+        "face_width_ratio": width_ratio,
+        "face_height_ratio": height_ratio,
+        "processing_time": metadata.get("processing_time"),
+        "last_updated": metadata.get("last_updated"),
+        "processing_seconds": seconds,
+        "history_length": len(metadata.get("processing_history") or []),
+        "background_removed": metadata.get("background_removed"),
+        "error_message": metadata.get("error_message"),
+        "file_hash": metadata.get("file_hash")
+    }
+
+
+class ColumnarExporter:
+    """
+    Exporta metadatos a <dest>/year=<año>/<lote>.parquet (o .csv.gz).
+
+    El manifiesto <dest>/_export_manifest.json guarda la firma de cada
+    lote exportado; en las siguientes ejecuciones solo se reescriben los
+    lotes nuevos o modificados.
+    """
+
+    MANIFEST_NAME = "_export_manifest.json"
+
+    def __init__(
+        self,
+        store: MetadataStore,
+        dest_dir: str,
+        output_format: Optional[str] = None,
+        chunk_size: int = 10000
+    ):
+        """
+        Args:
+            store: Backend de metadatos de origen
+            dest_dir: Carpeta destino
+            output_format: "parquet" o "csv" (None = parquet si hay pyarrow)
+            chunk_size: Filas por bloque (row group de Parquet)
+        """
+        self.store = store
+        self.dest_dir = Path(dest_dir)
+        self.chunk_size = chunk_size
+
+        output_format = (output_format or ("parquet" if PYARROW_AVAILABLE else "csv")).lower()
+        if output_format == "parquet" and not PYARROW_AVAILABLE:
+            raise ImportError("pyarrow no está instalado. Instalar con: pip install pyarrow")
+        if output_format not in ("parquet", "csv"):
+            raise ValueError(f"Formato de exportación desconocido: {output_format}")
+
+        self.output_format = output_format
+        self.extension = ".parquet" if output_format == "parquet" else ".csv.gz"
+
+    def export(self, full: bool = False) -> Dict[str, Any]:
+        """
+        Exporta los lotes nuevos o modificados (todos si full=True).
+
+        Returns:
+            Dict con batches, exported, skipped, rows y files
+        """
+        manifest_path = self.dest_dir / self.MANIFEST_NAME
+        manifest = {} if full else self._load_manifest(manifest_path)
+
+        stats = {"batches": 0, "exported": 0, "skipped": 0, "rows": 0, "files": []}
+
+        for (year, batch_id), signature in sorted(self.store.batch_signatures().items()):
+            stats["batches"] += 1
+            key = f"{year}/{batch_id}"
+            target = self.dest_dir / f"year={year}" / f"{batch_id}{self.extension}"
+
+            previous = manifest.get(key)
+            if (previous and previous.get("signature") == signature
+                    and previous.get("format") == self.output_format and target.exists()):
+                stats["skipped"] += 1
+                continue
+
+            rows = self._write_batch(target, self._rows(year, batch_id))
+            manifest[key] = {"signature": signature, "format": self.output_format, "rows": rows}
+
+            stats["exported"] += 1
+            stats["rows"] += rows
+            stats["files"].append(str(target))
+
+            # Guardar progreso por lote (una interrupción no repite lo ya exportado)
+            self._save_manifest(manifest_path, manifest)
+
+        return stats
+
+    def _rows(self, year: int, batch_id: str) -> Iterator[Dict[str, Any]]:
+        for record_year, record_batch, metadata in self.store.iter_records(year, batch_id):
+            yield flatten_metadata(record_year, record_batch, metadata)
+
+    def _write_batch(self, target: Path, rows: Iterator[Dict[str, Any]]) -> int:
+        """Escribe un lote en un temporal y lo renombra al terminar."""
+        ensure_directory(target.parent)
+        with atomic_path(target) as temp_path:
+            if self.output_format == "parquet":
+                count = self._write_parquet(temp_path, rows)
+            else:
+                count = self._write_csv(temp_path, rows)
+
+        return count
+
+    def _write_csv(self, path: Path, rows: Iterator[Dict[str, Any]]) -> int:
+        count = 0
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        return count
+
+    def _write_parquet(self, path: Path, rows: Iterator[Dict[str, Any]]) -> int:
+        schema = pa.schema([(name, self._arrow_type(name)) for name in COLUMNS])
+        count = 0
+
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            chunk: List[Dict[str, Any]] = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                    count += len(chunk)
+                    chunk = []
+            if chunk or count == 0:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                count += len(chunk)
+
+        return count
+
+    @staticmethod
+    def _arrow_type(name: str):
+        if name in _INT_COLUMNS:
+            return pa.int64()
+        if name in _FLOAT_COLUMNS:
+            return pa.float64()
+        if name in _BOOL_COLUMNS:
+            return pa.bool_()
+        return pa.string()
+
+    @staticmethod
+    def _load_manifest(manifest_path: Path) -> Dict[str, Dict]:
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_manifest(manifest_path: Path, manifest: Dict[str, Dict]):
+        ensure_directory(manifest_path.parent)
+        write_json_atomic(manifest_path, manifest)
+
+
+def main():
+    """Punto de entrada para uso por consola."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Exportar metadatos a formato columnar para análisis"
+    )
+    parser.add_argument(
+        'dest_dir',
+        help='Carpeta destino (un archivo por lote)'
+    )
+    parser.add_argument(
+        '--metadata-dir',
+        default='./metadata',
+        help='Directorio de metadatos (default: ./metadata)'
+    )
+    parser.add_argument(
+        '--format',
+        choices=['parquet', 'csv'],
+        default=None,
+        help='parquet (requiere pyarrow) o csv (gzip). Default: parquet si está disponible'
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Reexportar todos los lotes, ignorando el manifiesto'
+    )
+
+    args = parser.parse_args()
+
+    exporter = ColumnarExporter(
+        open_metadata_store(args.metadata_dir),
+        args.dest_dir,
+        output_format=args.format
+    )
+    stats = exporter.export(full=args.full)
+
+    print(f"Formato: {exporter.output_format}")
+    print(f"Lotes: {stats['batches']} (exportados {stats['exported']}, sin cambios {stats['skipped']})")
+    print(f"Filas exportadas: {stats['rows']}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
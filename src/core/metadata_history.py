@@ -0,0 +1,151 @@
+"""
+Codificación compacta y compactación de processing_history.
+Cada entrada se guarda como [epoch_ms, acción, status(, details)] con
+acciones y status conocidos como códigos enteros, y se expande de vuelta
+al esquema actual ({timestamp, action, status, details}) al leer.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
+
+# Identificador del formato compacto dentro del metadato
+COMPACT_ENCODING = "compact-v1"
+
+# Códigos internados. Solo se agregan al final: nunca reordenar ni borrar,
+# los metadatos ya guardados dependen de estos números.
+ACTION_CODES = [
+    "initial_scan",
+    "update",
+    "face_detection",
+    "face_detected_and_cropped",
+    "sent_to_manual_review",
+    "error_detected"
+]
+STATUS_CODES = [
+    "pending",
+    "processed",
+    "manual_review",
+    "error"
+]
+
+_ACTION_INDEX = {name: code for code, name in enumerate(ACTION_CODES)}
+_STATUS_INDEX = {name: code for code, name in enumerate(STATUS_CODES)}
+
+
+def _to_epoch_ms(timestamp: Optional[str]) -> Optional[int]:
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _from_epoch_ms(epoch_ms: Optional[int]) -> Optional[str]:
+    if epoch_ms is None:
+        return None
+    moment = datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+    return moment.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def _intern(value: Optional[str], index: Dict[str, int]) -> Union[int, str, None]:
+    """Código entero si el valor es conocido; el texto tal cual si no."""
+    return index.get(value, value)
+
+
+def _expand(value: Union[int, str, None], names: List[str]) -> Optional[str]:
+    if isinstance(value, int) and 0 <= value < len(names):
+        return names[value]
+    return value
+
+
+def is_compact(history: Any) -> bool:
+    """True si processing_history está en formato compacto."""
+    return isinstance(history, dict) and history.get("encoding") == COMPACT_ENCODING
+
+
+def compact_history(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reduce el historial a la primera entrada, la última y cada cambio de status.
+
+    Reprocesos y recortes repetidos con el mismo status dejan de acumular
+    entradas; la trazabilidad de estados se conserva.
+    """
+    if len(entries) <= 2:
+        return list(entries)
+
+    kept = [entries[0]]
+    for entry in entries[1:-1]:
+        if entry.get("status") != kept[-1].get("status"):
+            kept.append(entry)
+    kept.append(entries[-1])
+    return kept
+
+
+def encode_history(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Convierte la lista de entradas al formato compacto."""
+    encoded = []
+    for entry in entries:
+        row = [
+            _to_epoch_ms(entry.get("timestamp")),
+            _intern(entry.get("action"), _ACTION_INDEX),
+            _intern(entry.get("status"), _STATUS_INDEX)
+        ]
+        if entry.get("details") is not None:
+            row.append(entry["details"])
+        encoded.append(row)
+
+    return {"encoding": COMPACT_ENCODING, "entries": encoded}
+
+
+def decode_history(history: Any) -> List[Dict[str, Any]]:
+    """Expande el formato compacto al esquema actual (listas ya expandidas se retornan igual)."""
+    if not is_compact(history):
+        return history if history is not None else []
+
+    entries = []
+    for row in history.get("entries", []):
+        entry = {
+            "timestamp": _from_epoch_ms(row[0]),
+            "action": _expand(row[1], ACTION_CODES),
+            "status": _expand(row[2], STATUS_CODES)
+        }
+        if len(row) > 3:
+            entry["details"] = row[3]
+        entries.append(entry)
+    return entries
+
+
+def pack_metadata(metadata: Dict[str, Any], encoding: str = "full", compaction: bool = False) -> Dict[str, Any]:
+    """
+    Prepara un metadato para guardarlo.
+
+    Args:
+        metadata: Metadato con processing_history expandido (o ya compacto)
+        encoding: "full" (lista de dicts, esquema actual) o "compact"
+        compaction: Aplicar compact_history() antes de guardar
+
+    Returns:
+        Copia superficial del metadato (el original no se modifica)
+    """
+    history = metadata.get("processing_history")
+    if history is None or (encoding == "full" and not compaction and not is_compact(history)):
+        return metadata
+
+    entries = decode_history(history)
+    if compaction:
+        entries = compact_history(entries)
+
+    packed = dict(metadata)
+    packed["processing_history"] = encode_history(entries) if encoding == "compact" else entries
+    return packed
+
+
+def unpack_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Expande processing_history de un metadato leído del almacenamiento."""
+    if is_compact(metadata.get("processing_history")):
+        metadata["processing_history"] = decode_history(metadata["processing_history"])
+    return metadata
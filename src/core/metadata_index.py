@@ -0,0 +1,305 @@
+"""
+Índice de búsqueda de metadatos por nombre de archivo.
+Recorre el árbol de metadata una sola vez y guarda un caché persistente
+para que las siguientes ejecuciones solo relean los JSON nuevos o modificados.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from src.utils.file_utils import ensure_directory, write_json_atomic
+
+# listener(cambiados: rel_path → entrada, eliminados: [rel_path])
+IndexListener = Callable[[Dict[str, Dict[str, Any]], List[str]], None]
+
+
+class MetadataIndex:
+    """
+    Índice stem → {format, path, last_updated} sobre metadata/<year>/<batch>/.
+
+    Si el mismo stem aparece en varios lotes, gana el metadato con
+    last_updated más reciente; ante empate, el de ruta relativa mayor
+    (orden lexicográfico). El resultado no depende del orden del disco.
+
+    Cada entrada guarda además status y num_faces (los campos de búsqueda
+    de query()). El caché recuerda el mtime de cada carpeta: una carpeta
+    sin cambios no se vuelve a listar, así que refresh() cuesta un stat
+    por carpeta más los archivos de las carpetas que cambiaron. Los JSON
+    se escriben con reemplazo atómico (write_json_atomic), que siempre
+    actualiza el mtime de la carpeta; un JSON editado en su lugar no se
+    detecta hasta que cambie su carpeta.
+    """
+
+    CACHE_NAME = ".metadata_index.json"
+    CACHE_VERSION = 2
+
+    # JSON dentro de metadata/ que no son metadatos de imagen
+    EXCLUDED_FILES = {"processed_index.json", "batch_summary.json"}
+
+    # Carpetas de metadata/ que no se indexan (segmentos archivados)
+    EXCLUDED_DIRS = {"archive"}
+
+    # Una carpeta modificada hace menos que esto se relista aunque su mtime
+    # coincida con el del caché (cambios dentro de la resolución del reloj)
+    RACY_WINDOW_NS = 2_000_000_000
+
+    # Mínimo de segundos entre escrituras del caché. Perder los últimos
+    # cambios solo obliga a relistar esas carpetas en el próximo arranque.
+    CACHE_SAVE_INTERVAL = 30.0
+
+    def __init__(self, metadata_dir: Path, cache_path: Optional[Path] = None):
+        """
+        Args:
+            metadata_dir: Directorio raíz de metadatos
+            cache_path: Ruta del caché persistente (default: metadata_dir/.metadata_index.json)
+        """
+        self.metadata_dir = Path(metadata_dir)
+        self.cache_path = cache_path or self.metadata_dir / self.CACHE_NAME
+        self.collisions = 0
+
+        self._files: Dict[str, Dict[str, Any]] = {}
+        # rel_dir → {"mtime_ns", "dirs": [rel_dir hijas], "files": [nombres]}
+        self._dirs: Dict[str, Dict[str, Any]] = {}
+        self._by_stem: Dict[str, Dict[str, Any]] = {}
+        self._stem_paths: Dict[str, Set[str]] = {}
+        self._listeners: List[IndexListener] = []
+        self._loaded = False
+        self._dirty = False
+        self._saved_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def lookup(self, stem: str) -> Optional[Dict[str, Any]]:
+        """Retorna la entrada del índice para un stem (construye el índice si hace falta)."""
+        if not self._loaded:
+            self.refresh()
+        return self._by_stem.get(stem)
+
+    def subscribe(self, listener: IndexListener):
+        """
+        Registra un listener de cambios. Recibe primero todas las entradas
+        actuales y después, en cada refresh(), solo las que cambiaron.
+        """
+        if not self._loaded:
+            self.refresh()
+        with self._lock:
+            self._listeners.append(listener)
+            listener(dict(self._files), [])
+
+    def refresh(self):
+        """
+        Sincroniza el índice con el disco.
+
+        Solo se listan las carpetas cuyo mtime cambió y solo se parsean los
+        JSON cuyo tamaño o mtime cambió respecto del caché.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._files, self._dirs = self._load_cache()
+                self._stem_paths = {}
+                self._by_stem = {}
+                for rel_path, entry in self._files.items():
+                    self._add_stem(rel_path, entry)
+                for stem in self._stem_paths:
+                    self._resolve_stem(stem)
+                self._loaded = True
+
+            changed, removed = self._sync()
+            if changed or removed:
+                self._dirty = True
+                stems = set()
+                for rel_path in removed:
+                    entry = self._files.pop(rel_path, None)
+                    if entry is not None:
+                        self._drop_stem(rel_path, entry)
+                        stems.add(entry["stem"])
+                for rel_path, entry in changed.items():
+                    previous = self._files.get(rel_path)
+                    if previous is not None:
+                        self._drop_stem(rel_path, previous)
+                    self._files[rel_path] = entry
+                    self._add_stem(rel_path, entry)
+                    stems.add(entry["stem"])
+                for stem in stems:
+                    self._resolve_stem(stem)
+
+                for listener in self._listeners:
+                    listener(changed, removed)
+
+            if self._dirty and (self._saved_at is None
+                                or time.monotonic() - self._saved_at >= self.CACHE_SAVE_INTERVAL):
+                self._save_cache()
+
+    def flush(self):
+        """Guarda el caché si quedaron cambios sin escribir."""
+        with self._lock:
+            if self._dirty:
+                self._save_cache()
+
+    def _sync(self) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """Recorre las carpetas; relista solo las que cambiaron."""
+        changed: Dict[str, Dict[str, Any]] = {}
+        removed: List[str] = []
+        racy_after = time.time_ns() - self.RACY_WINDOW_NS
+        seen = set()
+
+        stack = [""] if self.metadata_dir.is_dir() else []
+        while stack:
+            rel_dir = stack.pop()
+            path = os.path.join(self.metadata_dir, rel_dir) if rel_dir else str(self.metadata_dir)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue  # Borrada durante el recorrido
+            seen.add(rel_dir)
+
+            cached = self._dirs.get(rel_dir)
+            if cached and cached["mtime_ns"] == mtime_ns and mtime_ns < racy_after:
+                stack.extend(cached["dirs"])
+                continue
+
+            try:
+                subdirs, names = self._scan_dir(path, rel_dir, changed)
+            except OSError:
+                continue
+            if cached:
+                gone = set(cached["files"]) - set(names)
+                removed.extend(self._join(rel_dir, name) for name in gone)
+            if not cached or cached["dirs"] != subdirs or cached["files"] != names:
+                self._dirty = True  # Solo el mtime nuevo no justifica reescribir el caché
+            self._dirs[rel_dir] = {"mtime_ns": mtime_ns, "dirs": subdirs, "files": names}
+            stack.extend(subdirs)
+
+        for rel_dir in set(self._dirs) - seen:
+            removed.extend(self._join(rel_dir, name) for name in self._dirs.pop(rel_dir)["files"])
+            self._dirty = True
+
+        return changed, removed
+
+    def _scan_dir(self, path: str, rel_dir: str, changed: Dict[str, Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+        """Lista una carpeta con os.scandir y relee los JSON modificados."""
+        subdirs, names = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if not rel_dir and entry.name in self.EXCLUDED_DIRS:
+                        continue
+                    subdirs.append(self._join(rel_dir, entry.name))
+                    continue
+                if not entry.name.endswith('.json') or entry.name in self.EXCLUDED_FILES:
+                    continue
+
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                names.append(entry.name)
+                rel_path = self._join(rel_dir, entry.name)
+                previous = self._files.get(rel_path)
+                if previous and previous["size"] == st.st_size and previous["mtime_ns"] == st.st_mtime_ns:
+                    continue
+
+                fields = {
+                    "stem": entry.name[:-len('.json')],
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns
+                }
+                fields.update(self._read_fields(Path(entry.path)))
+                changed[rel_path] = fields
+
+        return sorted(subdirs), sorted(names)
+
+    @staticmethod
+    def _join(rel_dir: str, name: str) -> str:
+        return f"{rel_dir}/{name}" if rel_dir else name
+
+    @staticmethod
+    def _read_fields(metadata_path: Path) -> Dict[str, Any]:
+        """Lee del JSON solo los campos que el índice necesita."""
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return {"invalid": True}
+
+        if not isinstance(metadata, dict):
+            return {"invalid": True}
+
+        return {
+            "format": metadata.get("format"),
+            "last_updated": metadata.get("last_updated"),
+            "status": metadata.get("status"),
+            "num_faces": metadata.get("num_faces")
+        }
+
+    # ------------------------------------------------------------------
+    # Mapa stem → entrada
+    # ------------------------------------------------------------------
+
+    def _add_stem(self, rel_path: str, entry: Dict[str, Any]):
+        if entry.get("invalid"):
+            return  # JSON ilegible: se usa la extensión del archivo
+        paths = self._stem_paths.setdefault(entry["stem"], set())
+        if paths:
+            self.collisions += 1
+        paths.add(rel_path)
+
+    def _drop_stem(self, rel_path: str, entry: Dict[str, Any]):
+        paths = self._stem_paths.get(entry["stem"])
+        if not paths or rel_path not in paths:
+            return
+        paths.discard(rel_path)
+        if paths:
+            self.collisions -= 1
+        else:
+            del self._stem_paths[entry["stem"]]
+
+    def _resolve_stem(self, stem: str):
+        """Resuelve colisiones de stem de forma determinista."""
+        paths = self._stem_paths.get(stem)
+        if not paths:
+            self._by_stem.pop(stem, None)
+            return
+
+        rel_path = max(paths, key=lambda p: (self._files[p].get("last_updated") or "", p))
+        entry = self._files[rel_path]
+        self._by_stem[stem] = {
+            "format": entry.get("format"),
+            "path": self.metadata_dir / rel_path,
+            "last_updated": entry.get("last_updated")
+        }
+
+    # ------------------------------------------------------------------
+    # Caché persistente
+    # ------------------------------------------------------------------
+
+    def _load_cache(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """Carga el caché persistente (vacío si no existe o es de otra versión)."""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}, {}
+
+        if not isinstance(data, dict) or data.get("version") != self.CACHE_VERSION:
+            return {}, {}
+        return data.get("files", {}), data.get("dirs", {})
+
+    def _save_cache(self):
+        """Guarda el caché de forma atómica (si no se puede, se ignora)."""
+        try:
+            ensure_directory(self.cache_path.parent)
+            write_json_atomic(
+                self.cache_path,
+                {"version": self.CACHE_VERSION, "files": self._files, "dirs": self._dirs},
+                indent=None
+            )
+            self._dirty = False
+        except OSError:
+            pass
+        self._saved_at = time.monotonic()
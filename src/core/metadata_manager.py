@@ -1,20 +1,24 @@
 """
 Gestor de metadatos para el pipeline de procesamiento de imágenes.
-Maneja la creación, actualización y persistencia de archivos JSON de metadatos.
+Maneja la creación, actualización y persistencia de metadatos (árbol JSON
+o base SQLite, según metadata_store en settings.yml).
 """
 
-import json
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Tuple
+
+from src.core.metadata_store import MetadataStore, open_metadata_store
+from src.utils.file_utils import ensure_directory, write_json_atomic
 
 
 class MetadataManager:
-    """Gestiona los archivos de metadatos JSON para cada imagen procesada."""
+    """Gestiona los metadatos de cada imagen procesada."""
 
-    def __init__(self, metadata_base_dir: str = "./metadata"):
+    def __init__(self, metadata_base_dir: str = "./metadata", store: Optional[MetadataStore] = None):
         self.metadata_base_dir = Path(metadata_base_dir)
         self.metadata_version = "1.0"
+        self.store = store or open_metadata_store(self.metadata_base_dir)
 
     def create_metadata(
         self,
@@ -23,7 +27,8 @@ class MetadataManager:
         batch_id: str,
         width: Optional[int] = None,
         height: Optional[int] = None,
-        img_format: Optional[str] = None
+        img_format: Optional[str] = None,
+        file_hash: Optional[str] = None
     ) -> Dict[str, Any]:
         """Crea un nuevo diccionario de metadatos con valores iniciales."""
 
@@ -35,7 +40,9 @@ class MetadataManager:
             "input_path": input_path,
             "current_path": input_path,
             "output_path": None,
+            "copy_strategy": None,
             "format": img_format,
+            "file_hash": file_hash,
             "width": width,
             "height": height,
             "orientation": orientation,
@@ -90,36 +97,29 @@ class MetadataManager:
         return metadata
 
     def save_metadata(self, metadata: Dict[str, Any], batch_id: str) -> Path:
-        """Guarda el metadata en un archivo JSON."""
-
-        # Crear estructura de directorios
-        year = datetime.now(timezone.utc).year
-        metadata_dir = self.metadata_base_dir / str(year) / batch_id
-        metadata_dir.mkdir(parents=True, exist_ok=True)
-
-        # Generar nombre de archivo
-        filename = Path(metadata["filename"]).stem + ".json"
-        metadata_path = metadata_dir / filename
-
-        # Guardar JSON
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
-
-        return metadata_path
+        """Guarda el metadata en el backend configurado (JSON por imagen o SQLite)."""
+        return self.store.put(metadata, batch_id)
 
     def load_metadata(self, filename: str, batch_id: str) -> Optional[Dict[str, Any]]:
         """Carga metadata existente si está disponible."""
+        return self.store.get(filename, batch_id)
 
-        year = datetime.now(timezone.utc).year
-        metadata_dir = self.metadata_base_dir / str(year) / batch_id
-        json_filename = Path(filename).stem + ".json"
-        metadata_path = metadata_dir / json_filename
+    def query(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        **filters: Any
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Busca metadatos por status, batch_id, img_format, num_faces,
+        min_faces, max_faces, updated_after, updated_before y year.
 
-        if metadata_path.exists():
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        Ejemplo: query(status="manual_review", batch_id="admission_01", min_faces=2)
 
-        return None
+        Returns:
+            Tupla (metadatos, cursor de la página siguiente o None)
+        """
+        return self.store.query(limit=limit, cursor=cursor, **filters)
 
     def create_batch_summary(
         self,
@@ -132,7 +132,20 @@ class MetadataManager:
         timestamp = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
 
         # Calcular estadísticas
-        total = len(metadata_list)
+        stats, breakdown = self.new_summary_counters()
+        images = [
+            self.accumulate_summary(meta, stats, breakdown)
+            for meta in metadata_list
+        ]
+
+        return self.build_summary(
+            batch_id, batch_path, len(metadata_list), stats, breakdown,
+            processing_date=timestamp, completion_date=timestamp, images=images
+        )
+
+    @staticmethod
+    def new_summary_counters() -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Contadores vacíos (statistics, breakdown) de un resumen de lote."""
         stats = {
             "processed": 0,
             "manual_review": 0,
@@ -147,67 +160,93 @@ class MetadataManager:
             "corrupted_files": 0
         }
 
-        images = []
-
-        for meta in metadata_list:
-            status = meta.get("status", "pending")
-            stats[status] = stats.get(status, 0) + 1
-
-            # Breakdown detallado
-            if meta.get("status") == "error":
-                breakdown["corrupted_files"] += 1
-            elif meta.get("num_faces") == 1:
-                breakdown["face_detected_single"] += 1
-            elif meta.get("num_faces") > 1:
-                breakdown["face_detected_multiple"] += 1
-            elif meta.get("num_faces") == 0 and meta.get("status") == "manual_review":
-                breakdown["no_face_detected"] += 1
-
-            # Resumen de imagen
-            img_summary = {
-                "filename": meta["filename"],
-                "status": meta["status"],
-                "face_detected": meta.get("face_detected", False)
-            }
-            if meta.get("num_faces", 0) > 1:
-                img_summary["num_faces"] = meta["num_faces"]
-            if meta.get("error_message"):
-                img_summary["error"] = "corrupted file"
+        return stats, breakdown
 
-            images.append(img_summary)
+    @staticmethod
+    def accumulate_summary(
+        meta: Dict[str, Any],
+        stats: Dict[str, int],
+        breakdown: Dict[str, int]
+    ) -> Dict[str, Any]:
+        """
+        Suma un metadato a los contadores del resumen.
+
+        Returns:
+            Resumen de la imagen para la lista "images"
+        """
+        status = meta.get("status", "pending")
+        stat_key = "errors" if status == "error" else status
+        stats[stat_key] = stats.get(stat_key, 0) + 1
+
+        # Breakdown detallado
+        num_faces = meta.get("num_faces") or 0
+        if status == "error":
+            breakdown["corrupted_files"] += 1
+        elif num_faces == 1:
+            breakdown["face_detected_single"] += 1
+        elif num_faces > 1:
+            breakdown["face_detected_multiple"] += 1
+        elif status == "manual_review":
+            breakdown["no_face_detected"] += 1
+
+        # Resumen de imagen
+        img_summary = {
+            "filename": meta["filename"],
+            "status": meta["status"],
+            "face_detected": meta.get("face_detected", False)
+        }
+        if num_faces > 1:
+            img_summary["num_faces"] = num_faces
+        if meta.get("error_message"):
+            img_summary["error"] = "corrupted file"
 
+        return img_summary
+
+    def build_summary(
+        self,
+        batch_id: str,
+        batch_path: str,
+        total: int,
+        stats: Dict[str, int],
+        breakdown: Dict[str, int],
+        processing_date: str,
+        completion_date: Optional[str],
+        images: Optional[Any] = None
+    ) -> Dict[str, Any]:
+        """Arma el resumen del lote a partir de los contadores (images es opcional)."""
         success_rate = stats["processed"] / total if total > 0 else 0
         requires_attention = stats["manual_review"] + stats["errors"]
 
         summary = {
             "batch_id": batch_id,
             "batch_path": batch_path,
-            "processing_date": timestamp,
-            "completion_date": timestamp,
+            "processing_date": processing_date,
+            "completion_date": completion_date,
             "total_images": total,
-            "statistics": stats,
-            "breakdown": breakdown,
+            "statistics": dict(stats),
+            "breakdown": dict(breakdown),
             "success_rate": round(success_rate, 2),
-            "requires_manual_attention": requires_attention,
-            "images": images,
-            "metadata_version": self.metadata_version,
-            "pipeline_version": "1.0.0"
+            "requires_manual_attention": requires_attention
         }
+        if images is not None:
+            summary["images"] = images
+        summary["metadata_version"] = self.metadata_version
+        summary["pipeline_version"] = "1.0.0"
 
         return summary
 
+    def batch_summary_path(self, batch_id: str) -> Path:
+        """Ruta de batch_summary.json de un lote (año actual)."""
+        year = datetime.now(timezone.utc).year
+        return self.metadata_base_dir / str(year) / batch_id / "batch_summary.json"
+
     def save_batch_summary(self, summary: Dict[str, Any]) -> Path:
         """Guarda el resumen del lote."""
 
-        year = datetime.now(timezone.utc).year
-        batch_id = summary["batch_id"]
-        summary_dir = self.metadata_base_dir / str(year) / batch_id
-        summary_dir.mkdir(parents=True, exist_ok=True)
-
-        summary_path = summary_dir / "batch_summary.json"
+        summary_path = self.batch_summary_path(summary["batch_id"])
+        ensure_directory(summary_path.parent)
 
-        with open(summary_path, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+        write_json_atomic(summary_path, summary)
 
         return summary_path
 
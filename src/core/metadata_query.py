@@ -0,0 +1,241 @@
+"""
+Índices secundarios en memoria para query() del backend JSON.
+Se alimentan del caché de MetadataIndex (registros sueltos) y de las
+tablas de los segmentos archivados, así que una consulta solo abre los
+JSON de la página que retorna.
+"""
+
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# (año, batch_id, stem): mismo orden que el cursor de query()
+Position = Tuple[int, str, str]
+
+# Campos de búsqueda de un registro (mismas claves que el metadato)
+QUERY_FIELDS = ("status", "format", "num_faces", "last_updated")
+
+
+def query_fields(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos que QueryIndex necesita de un metadato."""
+    return {key: metadata.get(key) for key in QUERY_FIELDS}
+
+
+def position_of(rel_path: str) -> Optional[Position]:
+    """Posición de metadata/<año>/<lote>/<stem>.json (None si no es un registro)."""
+    parts = rel_path.split('/')
+    if len(parts) != 3 or not parts[0].isdigit() or not parts[2].endswith('.json'):
+        return None
+    return int(parts[0]), parts[1], parts[2][:-len('.json')]
+
+
+class QueryIndex:
+    """
+    Posiciones ordenadas más un índice por valor de cada filtro de
+    igualdad (status, lote, formato, rostros, año) y uno ordenado por
+    last_updated. query() recorre la lista candidata más corta desde el
+    cursor (bisect) y verifica los demás filtros sobre los campos en
+    memoria.
+
+    Un registro suelto tiene prioridad sobre su copia archivada, igual
+    que en JsonTreeStore.iter_records().
+    """
+
+    # filtro de igualdad → cómo sale su valor de (posición, campos)
+    _KEYS = {
+        "status": lambda position, fields: fields.get("status"),
+        "batch_id": lambda position, fields: position[1],
+        "img_format": lambda position, fields: fields.get("format"),
+        "num_faces": lambda position, fields: fields.get("num_faces") or 0,
+        "year": lambda position, fields: position[0]
+    }
+
+    # Con más cambios que esta fracción del total, se reconstruye todo
+    # (ordenar una vez) en lugar de insertar de a uno
+    REBUILD_RATIO = 0.25
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loose: Dict[Position, Dict[str, Any]] = {}
+        self._archived: Dict[Position, Dict[str, Any]] = {}
+        self._segments: Dict[Tuple[int, str], List[Position]] = {}
+        self._positions: List[Position] = []
+        self._buckets: Dict[str, Dict[Any, List[Position]]] = {key: {} for key in self._KEYS}
+        self._by_updated: List[Tuple[str, Position]] = []
+
+    # ------------------------------------------------------------------
+    # Actualización
+    # ------------------------------------------------------------------
+
+    def update_loose(self, changed: Dict[str, Dict[str, Any]], removed: List[str]):
+        """Listener de MetadataIndex: aplica los JSON sueltos que cambiaron."""
+        with self._lock:
+            if len(changed) + len(removed) > max(len(self._positions) * self.REBUILD_RATIO, 100):
+                for rel_path in removed:
+                    position = position_of(rel_path)
+                    if position is not None:
+                        self._loose.pop(position, None)
+                for rel_path, entry in changed.items():
+                    position = position_of(rel_path)
+                    if position is None:
+                        continue
+                    if entry.get("invalid"):
+                        self._loose.pop(position, None)
+                    else:
+                        self._loose[position] = query_fields(entry)
+                self._rebuild()
+                return
+
+            for rel_path in removed:
+                position = position_of(rel_path)
+                if position is not None and position in self._loose:
+                    previous = self._effective(position)
+                    del self._loose[position]
+                    self._reindex(position, previous, self._effective(position))
+
+            for rel_path, entry in changed.items():
+                position = position_of(rel_path)
+                if position is None:
+                    continue
+                previous = self._effective(position)
+                if entry.get("invalid"):
+                    self._loose.pop(position, None)
+                else:
+                    self._loose[position] = query_fields(entry)
+                self._reindex(position, previous, self._effective(position))
+
+    def update_segment(self, year: int, batch_id: str, records: Dict[str, Dict[str, Any]]):
+        """Reemplaza los registros archivados de un lote (vacío = segmento eliminado)."""
+        key = (int(year), batch_id)
+        with self._lock:
+            for position in self._segments.pop(key, []):
+                previous = self._effective(position)
+                del self._archived[position]
+                self._reindex(position, previous, self._effective(position))
+
+            positions = [(key[0], batch_id, stem) for stem in records]
+            if positions:
+                self._segments[key] = positions
+            if len(positions) > max(len(self._positions) * self.REBUILD_RATIO, 100):
+                for position in positions:
+                    self._archived[position] = records[position[2]]
+                self._rebuild()
+                return
+
+            for position in positions:
+                previous = self._effective(position)
+                self._archived[position] = records[position[2]]
+                self._reindex(position, previous, self._effective(position))
+
+    def _rebuild(self):
+        """Reconstruye todos los índices desde los registros sueltos y archivados."""
+        effective = dict(self._archived)
+        effective.update(self._loose)
+        self._positions = sorted(effective)
+        self._buckets = {key: {} for key in self._KEYS}
+        for position in self._positions:
+            fields = effective[position]
+            for key, value_of in self._KEYS.items():
+                self._buckets[key].setdefault(value_of(position, fields), []).append(position)
+        self._by_updated = sorted((fields.get("last_updated") or "", position) for position, fields in effective.items())
+
+    def _effective(self, position: Position) -> Optional[Dict[str, Any]]:
+        fields = self._loose.get(position)
+        return fields if fields is not None else self._archived.get(position)
+
+    def _reindex(self, position: Position, previous: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]):
+        """Mueve una posición entre los índices según sus campos antes y después."""
+        if previous == current:
+            return
+
+        if previous is not None:
+            if current is None:
+                self._remove(self._positions, position)
+            for key, value_of in self._KEYS.items():
+                bucket = self._buckets[key].get(value_of(position, previous))
+                self._remove(bucket, position)
+                if bucket is not None and not bucket:
+                    del self._buckets[key][value_of(position, previous)]
+            self._remove(self._by_updated, (previous.get("last_updated") or "", position))
+
+        if current is not None:
+            if previous is None:
+                insort(self._positions, position)
+            for key, value_of in self._KEYS.items():
+                insort(self._buckets[key].setdefault(value_of(position, current), []), position)
+            insort(self._by_updated, (current.get("last_updated") or "", position))
+
+    @staticmethod
+    def _remove(items: Optional[list], value: Any):
+        if not items:
+            return
+        i = bisect_left(items, value)
+        if i < len(items) and items[i] == value:
+            del items[i]
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    def select(self, filters: Dict[str, Any], after: Optional[Position], limit: int) -> List[Tuple[Position, bool]]:
+        """
+        Posiciones que cumplen los filtros, en orden, a partir del cursor.
+
+        Returns:
+            Lista de hasta limit tuplas (posición, es_suelto)
+        """
+        # Import diferido: metadata_store importa este módulo
+        from src.core.metadata_store import matches_filters
+
+        with self._lock:
+            found = []
+            for position in self._candidates(filters, after):
+                fields = self._effective(position)
+                if fields is None or not matches_filters(position[0], position[1], fields, filters):
+                    continue
+                found.append((position, position in self._loose))
+                if len(found) == limit:
+                    break
+            return found
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _candidates(self, filters: Dict[str, Any], after: Optional[Position]) -> Iterator[Position]:
+        """La lista candidata más corta entre los índices que aplican."""
+        options = [(len(self._positions), lambda: self._from(self._positions, after))]
+
+        for key in self._KEYS:
+            if key in filters:
+                value = int(filters[key]) if key in ("num_faces", "year") else filters[key]
+                bucket = self._buckets[key].get(value, [])
+                options.append((len(bucket), lambda bucket=bucket: self._from(bucket, after)))
+
+        if "min_faces" in filters or "max_faces" in filters:
+            low, high = filters.get("min_faces"), filters.get("max_faces")
+            buckets = [
+                bucket for value, bucket in self._buckets["num_faces"].items()
+                if (low is None or value >= low) and (high is None or value <= high)
+            ]
+            options.append((
+                sum(len(bucket) for bucket in buckets),
+                lambda: heapq.merge(*(self._from(bucket, after) for bucket in buckets))
+            ))
+
+        if "updated_after" in filters or "updated_before" in filters:
+            start = bisect_left(self._by_updated, (filters.get("updated_after", ""),))
+            end = (bisect_left(self._by_updated, (filters["updated_before"],))
+                   if "updated_before" in filters else len(self._by_updated))
+            options.append((
+                max(end - start, 0),
+                lambda: self._from(sorted(position for _, position in self._by_updated[start:end]), after)
+            ))
+
+        return min(options, key=lambda option: option[0])[1]()
+
+    @staticmethod
+    def _from(positions: List[Position], after: Optional[Position]) -> Iterator[Position]:
+        start = bisect_right(positions, after) if after is not None else 0
+        for i in range(start, len(positions)):
+            yield positions[i]
@@ -0,0 +1,998 @@
+"""
+Backends de almacenamiento de metadatos.
+Permite guardar los metadatos por imagen en el árbol JSON tradicional
+(metadata/<año>/<lote>/<nombre>.json) o en una base SQLite consolidada
+con columnas indexadas, y migrar o exportar entre ambos.
+"""
+
+import abc
+import base64
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.core.metadata_archive import MetadataArchive
+from src.core.metadata_history import pack_metadata, unpack_metadata
+from src.core.metadata_index import MetadataIndex
+from src.core.metadata_query import QueryIndex
+from src.utils.file_utils import announce_removed_directories, ensure_directory, load_config, write_json_atomic
+
+# (año, batch_id, metadata)
+MetadataRecord = Tuple[int, str, Dict[str, Any]]
+
+# Máximo de registros por página en query()
+QUERY_LIMIT_MAX = 1000
+
+# Filtros aceptados por query() (ver MetadataStore.query)
+QUERY_FILTERS = (
+    "status", "batch_id", "img_format", "num_faces", "min_faces",
+    "max_faces", "updated_after", "updated_before", "year"
+)
+
+
+def current_year() -> int:
+    """Año (UTC) con el que se agrupan los metadatos nuevos."""
+    return datetime.now(timezone.utc).year
+
+
+def encode_cursor(position: Any) -> str:
+    """Cursor opaco de paginación a partir de la posición del último registro."""
+    raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Any:
+    """
+    Decodifica un cursor de encode_cursor().
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+
+def matches_filters(year: int, batch_id: str, metadata: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """Evalúa los filtros de query() sobre un registro ya cargado."""
+    num_faces = metadata.get("num_faces") or 0
+    last_updated = metadata.get("last_updated") or ""
+
+    checks = {
+        "status": lambda v: metadata.get("status") == v,
+        "batch_id": lambda v: batch_id == v,
+        "img_format": lambda v: metadata.get("format") == v,
+        "num_faces": lambda v: num_faces == v,
+        "min_faces": lambda v: num_faces >= v,
+        "max_faces": lambda v: num_faces <= v,
+        "updated_after": lambda v: last_updated >= v,
+        "updated_before": lambda v: last_updated < v,
+        "year": lambda v: year == int(v)
+    }
+    return all(checks[key](value) for key, value in filters.items())
+
+
+class MetadataStore(abc.ABC):
+    """
+    Interfaz común de los backends de metadatos.
+
+    Cada registro se identifica por (año, batch_id, stem del nombre de
+    archivo), igual que la ruta metadata/<año>/<lote>/<stem>.json.
+    """
+
+    backend = None
+
+    # Cómo se guarda processing_history (ver src/core/metadata_history.py)
+    history_encoding = "full"     # "full" (esquema actual) o "compact"
+    history_compaction = False    # conservar solo primera, última y cambios de status
+
+    def configure_history(self, encoding: str = "full", compaction: bool = False) -> "MetadataStore":
+        """Define la codificación de processing_history para las escrituras."""
+        if encoding not in ("full", "compact"):
+            raise ValueError(f"Codificación de historial desconocida: {encoding}")
+        self.history_encoding = encoding
+        self.history_compaction = compaction
+        return self
+
+    def _pack(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Metadato tal como se guarda (historial codificado/compactado)."""
+        return pack_metadata(metadata, self.history_encoding, self.history_compaction)
+
+    @abc.abstractmethod
+    def put(self, metadata: Dict[str, Any], batch_id: str, year: Optional[int] = None) -> Path:
+        """Guarda (o reemplaza) el metadato de una imagen y retorna dónde quedó."""
+
+    def put_many(self, records: Iterable[MetadataRecord]) -> int:
+        """Guarda muchos registros; retorna cuántos se escribieron."""
+        count = 0
+        for year, batch_id, metadata in records:
+            self.put(metadata, batch_id, year)
+            count += 1
+        return count
+
+    @abc.abstractmethod
+    def get(self, filename: str, batch_id: str, year: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Carga el metadato de una imagen, o None si no existe."""
+
+    @abc.abstractmethod
+    def iter_records(self, year: Optional[int] = None, batch_id: Optional[str] = None) -> Iterator[MetadataRecord]:
+        """Recorre los registros (opcionalmente de un año y/o lote)."""
+
+    @abc.abstractmethod
+    def find_latest(self, stem: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca un stem en todos los lotes.
+
+        Returns:
+            Dict con format y last_updated del registro más reciente, o None
+        """
+
+    def count(self) -> int:
+        """Cantidad de registros guardados."""
+        return sum(1 for _ in self.iter_records())
+
+    def query(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        **filters: Any
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Busca metadatos por status, lote, formato, rostros y fecha.
+
+        Implementación genérica (recorrido completo); los backends con
+        índices la reemplazan.
+
+        Args:
+            limit: Máximo de registros a retornar (hasta QUERY_LIMIT_MAX)
+            cursor: Cursor de la página anterior (None = primera página)
+            **filters: status, batch_id, img_format, num_faces, min_faces,
+                max_faces, updated_after, updated_before (ISO8601) y year
+
+        Returns:
+            Tupla (metadatos, cursor de la página siguiente o None)
+        """
+        filters = self._clean_filters(filters)
+        limit = max(1, min(limit, QUERY_LIMIT_MAX))
+        after = self._decode_position(cursor)
+
+        items, last = [], None
+        for year, batch_id, metadata in self.iter_records(filters.get("year"), filters.get("batch_id")):
+            position = (year, batch_id, Path(metadata.get("filename", "")).stem)
+            if after is not None and position <= after:
+                continue
+            if not matches_filters(year, batch_id, metadata, filters):
+                continue
+            if len(items) == limit:
+                return items, encode_cursor(last)
+            items.append(metadata)
+            last = position
+
+        return items, None
+
+    @staticmethod
+    def _decode_position(cursor: Optional[str]) -> Optional[Tuple[int, str, str]]:
+        """Posición (año, lote, stem) de un cursor de query() (None = primera página)."""
+        if not cursor:
+            return None
+        after = decode_cursor(cursor)
+        if (not isinstance(after, list) or len(after) != 3 or not isinstance(after[0], int)
+                or not all(isinstance(part, str) for part in after[1:])):
+            raise ValueError(f"Cursor inválido: {cursor}")
+        return tuple(after)
+
+    @staticmethod
+    def _clean_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """Descarta filtros vacíos y rechaza los desconocidos."""
+        unknown = set(filters) - set(QUERY_FILTERS)
+        if unknown:
+            raise ValueError(f"Filtros desconocidos: {', '.join(sorted(unknown))}")
+        return {key: value for key, value in filters.items() if value is not None and value != ""}
+
+    def batch_signatures(self) -> Dict[Tuple[int, str], str]:
+        """
+        Firma de cada lote, que cambia cuando cambia alguno de sus registros.
+        Permite exportaciones incrementales sin releer los lotes sin cambios.
+
+        Returns:
+            Dict (año, batch_id) → firma
+        """
+        signatures = {}
+        for year, batch_id, metadata in self.iter_records():
+            count, latest = signatures.get((year, batch_id), (0, ""))
+            signatures[(year, batch_id)] = (count + 1, max(latest, metadata.get("last_updated") or ""))
+        return {key: f"{count}:{latest}" for key, (count, latest) in signatures.items()}
+
+    @abc.abstractmethod
+    def archive_batch(self, year: int, batch_id: str) -> int:
+        """
+        Mueve los registros de un lote a su segmento comprimido.
+
+        Returns:
+            Cantidad de registros archivados (0 si no quedaba nada suelto)
+        """
+
+    @abc.abstractmethod
+    def compact_history(self) -> int:
+        """
+        Reescribe todos los registros con la codificación de historial
+        configurada (configure_history). Los registros sueltos se reescriben
+        en su lugar y los archivados en su segmento: un lote archivado sigue
+        archivado.
+
+        Returns:
+            Cantidad de registros reescritos
+        """
+
+    def archive_closed_years(self, keep_years: int = 1) -> Dict[Tuple[int, str], int]:
+        """
+        Archiva todos los lotes de los años cerrados.
+
+        Args:
+            keep_years: Años recientes que quedan sueltos (1 = solo el actual)
+
+        Returns:
+            Dict (año, batch_id) → registros archivados
+        """
+        first_open = current_year() - max(keep_years, 1) + 1
+        archived = {}
+        for year, batch_id in sorted(self.batch_signatures()):
+            if year < first_open:
+                count = self.archive_batch(year, batch_id)
+                if count:
+                    archived[(year, batch_id)] = count
+        return archived
+
+    def refresh(self):
+        """Sincroniza cachés internos con el disco (si el backend los tiene)."""
+
+    def close(self):
+        """Libera recursos del backend."""
+
+
+class JsonTreeStore(MetadataStore):
+    """
+    Backend tradicional: un JSON por imagen en metadata/<año>/<lote>/.
+
+    Los lotes archivados (metadata/archive/, ver metadata_archive.py) se
+    leen desde sus segmentos; un JSON suelto del mismo registro tiene
+    prioridad sobre la copia archivada.
+
+    query() usa índices secundarios en memoria (metadata_query.py) que se
+    construyen desde el caché persistente de MetadataIndex y las tablas de
+    los segmentos, y se actualizan solo con lo que cambió en disco.
+    """
+
+    backend = "json"
+
+    # JSON dentro de metadata/ que no son metadatos de imagen
+    EXCLUDED_FILES = MetadataIndex.EXCLUDED_FILES
+
+    def __init__(self, base_dir: str = "./metadata"):
+        self.base_dir = Path(base_dir)
+        self.index = MetadataIndex(self.base_dir)
+        self.archive = MetadataArchive(self.base_dir / "archive")
+
+        self._query_index: Optional[QueryIndex] = None
+        self._segment_signatures: Dict[Tuple[int, str], str] = {}
+        self._query_lock = threading.Lock()
+
+    def _path(self, filename: str, batch_id: str, year: Optional[int]) -> Path:
+        return self.base_dir / str(year or current_year()) / batch_id / (Path(filename).stem + ".json")
+
+    def put(self, metadata: Dict[str, Any], batch_id: str, year: Optional[int] = None) -> Path:
+        metadata_path = self._path(metadata["filename"], batch_id, year)
+        ensure_directory(metadata_path.parent)
+
+        write_json_atomic(metadata_path, self._pack(metadata))
+
+        return metadata_path
+
+    def get(self, filename: str, batch_id: str, year: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        metadata_path = self._path(filename, batch_id, year)
+
+        if metadata_path.exists():
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                return unpack_metadata(json.load(f))
+
+        archived = self.archive.read(year or current_year(), batch_id, Path(filename).stem)
+        return unpack_metadata(archived) if archived is not None else None
+
+    def _batches(self, year: Optional[int], batch_id: Optional[str]) -> List[Tuple[int, str]]:
+        """Lotes sueltos y archivados, ordenados por (año, lote)."""
+        batches = set(self.archive.segments(year))
+        if self.base_dir.exists():
+            for year_entry in os.scandir(self.base_dir):
+                if not year_entry.is_dir() or not year_entry.name.isdigit():
+                    continue
+                if year is not None and int(year_entry.name) != int(year):
+                    continue
+                for batch_entry in os.scandir(year_entry.path):
+                    if batch_entry.is_dir() and not batch_entry.name.startswith('.'):
+                        batches.add((int(year_entry.name), batch_entry.name))
+
+        if batch_id is not None:
+            batches = {key for key in batches if key[1] == batch_id}
+        return sorted(batches)
+
+    def _iter_loose(self, year: int, batch_id: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """JSON sueltos de un lote, tal como están guardados, en orden de stem."""
+        batch_dir = self.base_dir / str(year) / batch_id
+        if not batch_dir.is_dir():
+            return
+
+        for entry in sorted(os.scandir(batch_dir), key=lambda e: e.name[:-len('.json')]):
+            if (not entry.name.endswith('.json') or entry.name.startswith('.')
+                    or entry.name in self.EXCLUDED_FILES):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(metadata, dict):
+                yield entry.name[:-len('.json')], metadata
+
+    def iter_records(self, year: Optional[int] = None, batch_id: Optional[str] = None) -> Iterator[MetadataRecord]:
+        for record_year, record_batch in self._batches(year, batch_id):
+            loose = self._iter_loose(record_year, record_batch)
+            archived = ((Path(m["filename"]).stem, m) for m in self.archive.iter_segment(record_year, record_batch))
+
+            # Mezcla ordenada por stem; ante el mismo stem gana el JSON suelto
+            current_loose, current_archived = next(loose, None), next(archived, None)
+            while current_loose or current_archived:
+                if current_archived is None or (current_loose and current_loose[0] <= current_archived[0]):
+                    if current_archived and current_archived[0] == current_loose[0]:
+                        current_archived = next(archived, None)
+                    metadata, current_loose = current_loose[1], next(loose, None)
+                else:
+                    metadata, current_archived = current_archived[1], next(archived, None)
+                yield record_year, record_batch, unpack_metadata(metadata)
+
+    def find_latest(self, stem: str) -> Optional[Dict[str, Any]]:
+        loose = self.index.lookup(stem)
+        archived = self.archive.find_latest(stem)
+        if archived is None:
+            return loose
+
+        if loose is not None:
+            loose_rank = (loose.get("last_updated") or "", loose["path"].relative_to(self.base_dir).as_posix())
+            if loose_rank >= archived["rank"]:
+                return loose
+
+        return {"format": archived["format"], "last_updated": archived["last_updated"]}
+
+    def query(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        **filters: Any
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Busca con los índices en memoria: solo se abren los JSON (o los
+        registros archivados) de la página. El cursor es la posición
+        (año, lote, stem) del último registro, y cada página empieza con
+        una búsqueda binaria en la lista candidata.
+        """
+        filters = self._clean_filters(filters)
+        limit = max(1, min(limit, QUERY_LIMIT_MAX))
+        after = self._decode_position(cursor)
+
+        query_index = self._sync_query_index()
+        items, last = [], None
+        while len(items) <= limit:
+            selected = query_index.select(filters, after, limit + 1 - len(items))
+            if not selected:
+                break
+            for position, loose in selected:
+                after = position
+                metadata = self._read_position(position, loose)
+                if metadata is None:
+                    continue  # Borrado después de indexar
+                if len(items) == limit:
+                    return items, encode_cursor(last)
+                items.append(metadata)
+                last = position
+
+        return items, None
+
+    def _sync_query_index(self) -> QueryIndex:
+        """Índices de query() al día con el disco (sueltos y segmentos)."""
+        with self._query_lock:
+            if self._query_index is None:
+                self._query_index = QueryIndex()
+                self.index.subscribe(self._query_index.update_loose)
+            self.index.refresh()
+
+            segments = {key: self.archive.signature(*key) for key in self.archive.segments()}
+            for key in set(self._segment_signatures) - set(segments):
+                self._query_index.update_segment(*key, {})
+            for key, signature in segments.items():
+                if self._segment_signatures.get(key) != signature:
+                    self._query_index.update_segment(*key, self.archive.query_fields(*key))
+            self._segment_signatures = segments
+
+            return self._query_index
+
+    def _read_position(self, position: Tuple[int, str, str], loose: bool) -> Optional[Dict[str, Any]]:
+        year, batch_id, stem = position
+        if loose:
+            try:
+                with open(self.base_dir / str(year) / batch_id / f"{stem}.json", 'r', encoding='utf-8') as f:
+                    return unpack_metadata(json.load(f))
+            except (OSError, ValueError):
+                pass
+        archived = self.archive.read(year, batch_id, stem)
+        return unpack_metadata(archived) if archived is not None else None
+
+    def batch_signatures(self) -> Dict[Tuple[int, str], str]:
+        # Solo stat de los archivos (sin parsear JSON)
+        signatures = {}
+        if self.base_dir.exists():
+            for year_entry in os.scandir(self.base_dir):
+                if not year_entry.is_dir() or not year_entry.name.isdigit():
+                    continue
+                for batch_entry in os.scandir(year_entry.path):
+                    if not batch_entry.is_dir() or batch_entry.name.startswith('.'):
+                        continue
+                    count, latest = 0, 0
+                    for entry in os.scandir(batch_entry.path):
+                        if (entry.name.endswith('.json') and not entry.name.startswith('.')
+                                and entry.name not in self.EXCLUDED_FILES):
+                            count += 1
+                            latest = max(latest, entry.stat().st_mtime_ns)
+                    signatures[(int(year_entry.name), batch_entry.name)] = f"{count}:{latest}"
+
+        for key in self.archive.segments():
+            segment = "seg" + self.archive.signature(*key)
+            signatures[key] = f"{signatures[key]}+{segment}" if key in signatures else segment
+
+        return signatures
+
+    def count(self) -> int:
+        total = 0
+        for root, dirs, files in os.walk(self.base_dir):
+            if Path(root) == self.base_dir:
+                dirs[:] = [name for name in dirs if name not in MetadataIndex.EXCLUDED_DIRS]
+            total += sum(
+                1 for name in files
+                if name.endswith('.json') and not name.startswith('.') and name not in self.EXCLUDED_FILES
+            )
+        return total + self.archive.count()
+
+    def archive_batch(self, year: int, batch_id: str) -> int:
+        records = [metadata for _, metadata in self._iter_loose(year, batch_id)]
+        if not records:
+            return 0
+
+        self.archive.write_segment(year, batch_id, records)
+
+        # El segmento ya está en disco: recién ahora se borran los JSON sueltos
+        batch_dir = self.base_dir / str(year) / batch_id
+        for metadata in records:
+            (batch_dir / (Path(metadata["filename"]).stem + ".json")).unlink()
+        for name in MetadataArchive.ATTACHED_FILES:
+            self.archive.attach_file(year, batch_id, batch_dir / name)
+
+        removed = False
+        for directory in (batch_dir, batch_dir.parent):
+            try:
+                directory.rmdir()
+                removed = True
+            except OSError:
+                break  # Quedan archivos: la carpeta se conserva
+        if removed:
+            announce_removed_directories()
+
+        self.index.refresh()
+        return len(records)
+
+    def compact_history(self) -> int:
+        segments = set(self.archive.segments())
+        count = 0
+        for year, batch_id in self._batches(None, None):
+            loose = [metadata for _, metadata in self._iter_loose(year, batch_id)]
+            for metadata in loose:
+                self.put(unpack_metadata(metadata), batch_id, year)
+            count += len(loose)
+
+            if (year, batch_id) in segments:
+                records = [self._pack(unpack_metadata(m)) for m in self.archive.iter_segment(year, batch_id)]
+                self.archive.write_segment(year, batch_id, records)
+                count += len(records)
+
+        self.refresh()
+        return count
+
+    def refresh(self):
+        self.index.refresh()
+        self.archive.refresh()
+
+    def close(self):
+        self.index.flush()
+
+
+class SQLiteMetadataStore(MetadataStore):
+    """
+    Backend consolidado: una base SQLite (WAL) con el metadato completo
+    en una columna JSON y los campos de búsqueda en columnas indexadas.
+
+    En los lotes archivados, data solo guarda
+    {"$segment": [offset, length, segmento]} y el metadato se lee del segmento; las columnas indexadas se conservan,
+    así que query() sigue usando los índices.
+    """
+
+    backend = "sqlite"
+
+    SEGMENT_KEY = "$segment"
+
+    def __init__(self, db_path: str = "./metadata/metadata.db"):
+        self.db_path = Path(db_path)
+        ensure_directory(self.db_path.parent)
+        self.archive = MetadataArchive(self.db_path.parent / "archive")
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS metadata (
+                    year INTEGER NOT NULL,
+                    batch_id TEXT NOT NULL,
+                    stem TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    status TEXT,
+                    format TEXT,
+                    hash TEXT,
+                    num_faces INTEGER,
+                    last_updated TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (year, batch_id, stem)
+                );
+                CREATE INDEX IF NOT EXISTS idx_metadata_stem ON metadata(stem, last_updated);
+                CREATE INDEX IF NOT EXISTS idx_metadata_filename ON metadata(filename);
+                DROP INDEX IF EXISTS idx_metadata_batch;
+                CREATE INDEX IF NOT EXISTS idx_metadata_batch_status ON metadata(batch_id, status, num_faces);
+                CREATE INDEX IF NOT EXISTS idx_metadata_status ON metadata(status);
+                CREATE INDEX IF NOT EXISTS idx_metadata_format ON metadata(format);
+                CREATE INDEX IF NOT EXISTS idx_metadata_hash ON metadata(hash);
+                CREATE INDEX IF NOT EXISTS idx_metadata_faces ON metadata(num_faces);
+                CREATE INDEX IF NOT EXISTS idx_metadata_updated ON metadata(last_updated);
+            """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Abre una conexión nueva (una por operación, segura entre hilos)."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA busy_timeout=30000")
+            yield conn
+        finally:
+            conn.close()
+
+    def _row(self, metadata: Dict[str, Any], batch_id: str, year: Optional[int]) -> Tuple:
+        """Fila a insertar: columnas indexadas + JSON completo."""
+        filename = metadata["filename"]
+        return (
+            int(year or current_year()),
+            batch_id,
+            Path(filename).stem,
+            filename,
+            metadata.get("status"),
+            metadata.get("format"),
+            metadata.get("file_hash"),
+            metadata.get("num_faces"),
+            metadata.get("last_updated"),
+            json.dumps(self._pack(metadata), ensure_ascii=False)
+        )
+
+    # ON CONFLICT DO UPDATE conserva el rowid (cursor estable de query())
+    _UPSERT = """
+        INSERT INTO metadata
+            (year, batch_id, stem, filename, status, format, hash, num_faces, last_updated, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(year, batch_id, stem) DO UPDATE SET
+            filename = excluded.filename,
+            status = excluded.status,
+            format = excluded.format,
+            hash = excluded.hash,
+            num_faces = excluded.num_faces,
+            last_updated = excluded.last_updated,
+            data = excluded.data
+    """
+
+    def put(self, metadata: Dict[str, Any], batch_id: str, year: Optional[int] = None) -> Path:
+        with self._connect() as conn:
+            conn.execute(self._UPSERT, self._row(metadata, batch_id, year))
+        return self.db_path
+
+    def put_many(self, records: Iterable[MetadataRecord], chunk_size: int = 5000) -> int:
+        """Inserta en transacciones de chunk_size registros (migraciones masivas)."""
+        count = 0
+        with self._connect() as conn:
+            chunk = []
+            for year, batch_id, metadata in records:
+                chunk.append(self._row(metadata, batch_id, year))
+                if len(chunk) >= chunk_size:
+                    count += self._insert_chunk(conn, chunk)
+                    chunk = []
+            if chunk:
+                count += self._insert_chunk(conn, chunk)
+            # Estadísticas para que el planificador elija el mejor índice
+            conn.execute("PRAGMA optimize")
+        return count
+
+    def _insert_chunk(self, conn: sqlite3.Connection, rows: list) -> int:
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(self._UPSERT, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def _load(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Metadato de una fila (desde el segmento si el lote está archivado)."""
+        metadata = json.loads(row["data"])
+        pointer = metadata.get(self.SEGMENT_KEY)
+        if pointer is not None:
+            # [offset, length, segmento]; los punteros de la versión 1 no
+            # nombran el segmento y apuntan a records.seg
+            offset, length, *segment = pointer
+            metadata = self.archive.read_at(
+                row["year"], row["batch_id"], offset, length,
+                segment=segment[0] if segment else MetadataArchive.SEGMENT_NAME
+            )
+        return unpack_metadata(metadata)
+
+    def get(self, filename: str, batch_id: str, year: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT year, batch_id, data FROM metadata WHERE year = ? AND batch_id = ? AND stem = ?",
+                (int(year or current_year()), batch_id, Path(filename).stem)
+            ).fetchone()
+        return self._load(row) if row else None
+
+    def iter_records(self, year: Optional[int] = None, batch_id: Optional[str] = None) -> Iterator[MetadataRecord]:
+        query = "SELECT year, batch_id, data FROM metadata"
+        conditions, params = [], []
+        if year is not None:
+            conditions.append("year = ?")
+            params.append(int(year))
+        if batch_id is not None:
+            conditions.append("batch_id = ?")
+            params.append(batch_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY year, batch_id, stem"
+
+        with self._connect() as conn:
+            for row in conn.execute(query, params):
+                yield row["year"], row["batch_id"], self._load(row)
+
+    def find_latest(self, stem: str) -> Optional[Dict[str, Any]]:
+        # Mismo criterio que MetadataIndex: last_updated y luego la ruta mayor
+        with self._connect() as conn:
+            row = conn.execute("""
+                SELECT format, last_updated FROM metadata WHERE stem = ?
+                ORDER BY COALESCE(last_updated, '') DESC, year DESC, batch_id DESC
+                LIMIT 1
+            """, (stem,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    def batch_signatures(self) -> Dict[Tuple[int, str], str]:
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT year, batch_id, COUNT(*) AS total, MAX(COALESCE(last_updated, '')) AS latest
+                FROM metadata GROUP BY year, batch_id
+            """).fetchall()
+        return {(row["year"], row["batch_id"]): f"{row['total']}:{row['latest']}" for row in rows}
+
+    # filtro → condición SQL sobre columnas indexadas
+    _CONDITIONS = {
+        "status": "status = ?",
+        "batch_id": "batch_id = ?",
+        "img_format": "format = ?",
+        "num_faces": "num_faces = ?",
+        "min_faces": "num_faces >= ?",
+        "max_faces": "num_faces <= ?",
+        "updated_after": "last_updated >= ?",
+        "updated_before": "last_updated < ?",
+        "year": "year = ?"
+    }
+
+    def query(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        **filters: Any
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Busca con los índices secundarios; pagina por rowid (keyset), así
+        que cada página cuesta lo mismo sin importar cuántas se leyeron.
+        """
+        filters = self._clean_filters(filters)
+        limit = max(1, min(limit, QUERY_LIMIT_MAX))
+
+        conditions = [self._CONDITIONS[key] for key in filters]
+        params = list(filters.values())
+        if cursor:
+            after = decode_cursor(cursor)
+            if not isinstance(after, int):
+                raise ValueError(f"Cursor inválido: {cursor}")
+            conditions.append("rowid > ?")
+            params.append(after)
+
+        query = "SELECT rowid, year, batch_id, data FROM metadata"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY rowid LIMIT ?"
+        params.append(limit + 1)
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        next_cursor = encode_cursor(rows[limit - 1]["rowid"]) if len(rows) > limit else None
+        return [self._load(row) for row in rows[:limit]], next_cursor
+
+    def archive_batch(self, year: int, batch_id: str) -> int:
+        """
+        Pasa el JSON de un lote a su segmento y deja en data solo el puntero.
+        Pensado para mantenimiento (sin escrituras concurrentes en el lote).
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT data FROM metadata WHERE year = ? AND batch_id = ? AND data NOT LIKE ?",
+                (int(year), batch_id, '{"' + self.SEGMENT_KEY + '"%')
+            ).fetchall()
+            if not rows:
+                return 0
+
+            table = self.archive.write_segment(year, batch_id, (json.loads(row["data"]) for row in rows))
+            self._point_to_segment(conn, year, batch_id, table)
+
+        return len(rows)
+
+    def _point_to_segment(
+        self,
+        conn: sqlite3.Connection,
+        year: int,
+        batch_id: str,
+        table: Dict[str, List],
+        pointers_only: bool = False
+    ):
+        """
+        El segmento se reescribe completo: se actualizan todos los punteros
+        del lote. Con pointers_only, las filas que volvieron a guardarse
+        sueltas después de archivar se conservan.
+        """
+        query = "UPDATE metadata SET data = ? WHERE year = ? AND batch_id = ? AND stem = ? AND data LIKE ?"
+        pattern = '{"' + self.SEGMENT_KEY + '"%' if pointers_only else '%'
+        # El puntero nombra la generación del segmento: hasta que se
+        # actualiza, el anterior sigue leyendo el segmento previo (se conserva)
+        segment = self.archive.current_segment(year, batch_id)
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                query,
+                [
+                    (json.dumps({self.SEGMENT_KEY: [offset, length, segment]}), int(year), batch_id, stem, pattern)
+                    for stem, (offset, length, *_) in table.items()
+                ]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def compact_history(self) -> int:
+        segment_prefix = '{"' + self.SEGMENT_KEY + '"%'
+
+        def loose_records() -> Iterator[MetadataRecord]:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT year, batch_id, data FROM metadata WHERE data NOT LIKE ?",
+                    (segment_prefix,)
+                )
+                for row in rows:
+                    yield row["year"], row["batch_id"], unpack_metadata(json.loads(row["data"]))
+
+        count = self.put_many(loose_records())
+
+        for year, batch_id in self.archive.segments():
+            records = [self._pack(unpack_metadata(m)) for m in self.archive.iter_segment(year, batch_id)]
+            table = self.archive.write_segment(year, batch_id, records)
+            with self._connect() as conn:
+                self._point_to_segment(conn, year, batch_id, table, pointers_only=True)
+            count += len(records)
+
+        return count
+
+    def vacuum(self):
+        """Compacta la base (recupera el espacio de los lotes archivados)."""
+        with self._connect() as conn:
+            conn.execute("VACUUM")
+
+    def refresh(self):
+        self.archive.refresh()
+
+
+def load_store_config() -> Dict[str, Any]:
+    """Sección metadata_store de settings.yml (vacía si no hay configuración)."""
+    try:
+        return load_config().get("metadata_store") or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def open_metadata_store(base_dir: str = "./metadata", backend: Optional[str] = None) -> MetadataStore:
+    """
+    Abre el backend configurado en settings.yml (metadata_store.backend).
+
+    Args:
+        base_dir: Directorio raíz de metadatos
+        backend: "json" o "sqlite" (None = el de la configuración, "json" por defecto)
+    """
+    config = load_store_config()
+    backend = (backend or config.get("backend") or "json").lower()
+
+    if backend == "json":
+        store = JsonTreeStore(base_dir)
+    elif backend == "sqlite":
+        store = SQLiteMetadataStore(config.get("sqlite_path") or Path(base_dir) / "metadata.db")
+    else:
+        raise ValueError(f"Backend de metadatos desconocido: {backend}")
+
+    if config.get("archive_codec"):
+        store.archive = MetadataArchive(store.archive.archive_dir, config["archive_codec"])
+
+    return store.configure_history(
+        encoding=config.get("history_encoding", "full"),
+        compaction=bool(config.get("history_compaction", False))
+    )
+
+
+def migrate(source: MetadataStore, target: MetadataStore) -> int:
+    """Copia todos los registros de un backend a otro; retorna cuántos se copiaron."""
+    return target.put_many(source.iter_records())
+
+
+def main():
+    """Punto de entrada para uso por consola (migración, exportación, compactación y archivo)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Migrar o exportar metadatos entre backends"
+    )
+    parser.add_argument(
+        '--metadata-dir',
+        default='./metadata',
+        help='Directorio de metadatos (default: ./metadata)'
+    )
+    parser.add_argument(
+        '--db',
+        default=None,
+        help='Ruta de la base SQLite (default: <metadata-dir>/metadata.db)'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser(
+        'migrate',
+        help='Importar el árbol JSON por imagen a SQLite'
+    )
+    export_parser = subparsers.add_parser(
+        'export',
+        help='Exportar SQLite al árbol JSON por imagen (compatibilidad)'
+    )
+    export_parser.add_argument(
+        'dest',
+        help='Directorio destino del árbol <año>/<lote>/<nombre>.json'
+    )
+    compact_parser = subparsers.add_parser(
+        'compact-history',
+        help='Reescribir el backend configurado compactando processing_history'
+    )
+    compact_parser.add_argument(
+        '--encoding',
+        choices=['full', 'compact'],
+        default=None,
+        help='Codificación del historial (default: metadata_store.history_encoding)'
+    )
+
+    archive_parser = subparsers.add_parser(
+        'archive',
+        help='Empaquetar lotes de años cerrados en segmentos comprimidos'
+    )
+    archive_parser.add_argument(
+        '--year',
+        type=int,
+        default=None,
+        help='Archivar un año (default: todos los años cerrados)'
+    )
+    archive_parser.add_argument(
+        '--batch',
+        default=None,
+        help='Archivar solo este lote (requiere --year)'
+    )
+    archive_parser.add_argument(
+        '--keep-years',
+        type=int,
+        default=1,
+        help='Años recientes que quedan sin archivar (default: 1, el actual)'
+    )
+    archive_parser.add_argument(
+        '--codec',
+        choices=['zstd', 'gzip'],
+        default=None,
+        help='Compresión de los segmentos (default: zstd si está instalado)'
+    )
+    archive_parser.add_argument(
+        '--vacuum',
+        action='store_true',
+        help='SQLite: compactar la base después de archivar'
+    )
+
+    args = parser.parse_args()
+    config = load_store_config()
+
+    if args.command == 'archive':
+        if args.batch and args.year is None:
+            parser.error("--batch requiere --year")
+
+        store = open_metadata_store(args.metadata_dir)
+        if args.codec:
+            store.archive = MetadataArchive(store.archive.archive_dir, args.codec)
+
+        if args.year is None:
+            archived = store.archive_closed_years(args.keep_years)
+        else:
+            batches = [args.batch] if args.batch else sorted(
+                batch_id for year, batch_id in store.batch_signatures() if year == args.year
+            )
+            archived = {(args.year, batch_id): store.archive_batch(args.year, batch_id) for batch_id in batches}
+
+        for (year, batch_id), count in sorted(archived.items()):
+            print(f"{year}/{batch_id}: {count} metadatos archivados")
+        print(f"Total archivado: {sum(archived.values())} metadatos en {store.archive.archive_dir} ({store.archive.codec})")
+
+        if args.vacuum and store.backend == "sqlite":
+            store.vacuum()
+        return 0
+
+    json_store = JsonTreeStore(args.metadata_dir)
+    sqlite_store = SQLiteMetadataStore(args.db or Path(args.metadata_dir) / "metadata.db")
+    sqlite_store.configure_history(
+        encoding=config.get("history_encoding", "full"),
+        compaction=bool(config.get("history_compaction", False))
+    )
+
+    if args.command == 'compact-history':
+        store = open_metadata_store(args.metadata_dir)
+        store.configure_history(encoding=args.encoding or store.history_encoding, compaction=True)
+        count = store.compact_history()
+        print(f"Historial compactado en {count} metadatos ({store.backend}, {store.history_encoding})")
+    elif args.command == 'migrate':
+        count = migrate(json_store, sqlite_store)
+        print(f"Migrados {count} metadatos a {sqlite_store.db_path}")
+        print("Para usarlo, configurar metadata_store.backend: sqlite en config/settings.yml")
+    else:
+        count = migrate(sqlite_store, JsonTreeStore(args.dest))
+        print(f"Exportados {count} metadatos a {args.dest}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+Distribución de archivos en las carpetas de salida.
+Con la distribución por shards, cada archivo va en <carpeta>/<ab>/<cd>/<nombre>
+(prefijo del hash del nombre) en lugar de un directorio plano con cientos de
+miles de entradas. Escritores y lectores ubican los archivos con
+get_layout(carpeta); la migración reorganiza una carpeta existente en su lugar.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from src.utils.file_utils import announce_removed_directories, ensure_directory, load_config, write_json_atomic
+
+
+class OutputLayout:
+    """
+    Distribución de una carpeta: plana (depth 0) o con depth niveles de
+    shards de dos caracteres hexadecimales.
+
+    La distribución vigente se guarda en <carpeta>/.layout.json (la escribe
+    migrate). Sin ese archivo se usa output_layout de settings.yml. Los
+    lectores toleran carpetas a medio migrar: resolve() busca primero en
+    el shard y luego en la raíz, e iter_files() recorre todos los niveles.
+
+    Los archivos de un lote de input_raw/<año>/<lote>/ van en la misma
+    subcarpeta de la salida (<carpeta>/<año>/<lote>/[<shard>/]<nombre>),
+    para que un mismo nombre en dos lotes no se pise.
+    """
+
+    LAYOUT_NAME = ".layout.json"
+    MAX_DEPTH = 3
+
+    def __init__(self, root: Path, depth: int = 0):
+        """
+        Args:
+            root: Carpeta de salida
+            depth: Niveles de shards (0 = plana, máximo 3)
+        """
+        if not 0 <= depth <= self.MAX_DEPTH:
+            raise ValueError(f"Profundidad de shards fuera de rango (0-{self.MAX_DEPTH}): {depth}")
+        self.root = Path(root)
+        self.depth = depth
+
+    @property
+    def sharded(self) -> bool:
+        return self.depth > 0
+
+    def shard(self, name: str) -> str:
+        """
+        Shard de un archivo ("ab/cd"), derivado del stem: las variantes de
+        formato de una misma foto quedan en el mismo shard.
+        """
+        digest = hashlib.md5(Path(name).stem.encode('utf-8')).hexdigest()
+        return "/".join(digest[2 * i:2 * i + 2] for i in range(self.depth))
+
+    def path_for(self, name: str, subdir: Optional[str] = None) -> Path:
+        """
+        Ruta donde se escribe un archivo (la carpeta del shard no se crea).
+
+        Args:
+            name: Nombre del archivo
+            subdir: Subcarpeta del lote (ej: "2026/admision_01"); None = raíz
+        """
+        base = self.root / subdir if subdir else self.root
+        if not self.depth:
+            return base / name
+        return base / self.shard(name) / name
+
+    def resolve(self, name: str, subdir: Optional[str] = None) -> Optional[Path]:
+        """Ruta existente de un archivo por nombre (y subcarpeta de lote), o None."""
+        base = self.root / subdir if subdir else self.root
+        for candidate in (self.path_for(name, subdir), base / name):
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def subdir_of(self, path: Path) -> Optional[str]:
+        """
+        Subcarpeta de lote de un archivo de la carpeta, sin los niveles de
+        shard (de cualquier profundidad, para tolerar carpetas a medio migrar).
+        None si el archivo no está en una subcarpeta de lote.
+        """
+        path = Path(path)
+        parts = path.parent.relative_to(self.root).parts
+        digest = hashlib.md5(path.stem.encode('utf-8')).hexdigest()
+        for depth in range(min(self.MAX_DEPTH, len(parts)), 0, -1):
+            if parts[-depth:] == tuple(digest[2 * i:2 * i + 2] for i in range(depth)):
+                parts = parts[:-depth]
+                break
+        return "/".join(parts) or None
+
+    def iter_files(self, extensions: Optional[Iterable[str]] = None) -> Iterator[Path]:
+        """Archivos de la carpeta en cualquier nivel (sin ocultos)."""
+        return iter_folder_files(self.root, extensions)
+
+    def migrate(self, depth: int) -> int:
+        """
+        Reorganiza la carpeta en su lugar a la profundidad indicada (0 = plana).
+
+        Los archivos se mueven con os.replace dentro del mismo sistema de
+        archivos. El marcador se escribe al final: si la migración se
+        interrumpe, los lectores siguen encontrando todo y basta con
+        volver a ejecutarla.
+
+        Returns:
+            Archivos movidos
+        """
+        target = OutputLayout(self.root, depth)
+        moved = 0
+
+        for path in list(self.iter_files()):
+            destination = target.path_for(path.name, self.subdir_of(path))
+            if path == destination:
+                continue
+            ensure_directory(destination.parent)
+            os.replace(path, destination)
+            moved += 1
+
+        # Quitar carpetas de shards que quedaron vacías (y avisar a los
+        # procesos que las tengan en el caché de ensure_directory)
+        removed = False
+        for dirpath, _, _ in os.walk(self.root, topdown=False):
+            if Path(dirpath) != self.root and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+                removed = True
+        if removed:
+            announce_removed_directories()
+
+        ensure_directory(self.root)
+        write_json_atomic(self.root / self.LAYOUT_NAME, {"version": 1, "depth": depth}, indent=None)
+
+        self.depth = depth
+        invalidate_layout(self.root)
+        return moved
+
+
+def iter_folder_files(root: Path, extensions: Optional[Iterable[str]] = None) -> Iterator[Path]:
+    """
+    Recorre una carpeta completa con os.scandir (un solo recorrido para
+    todas las extensiones, sin ocultos).
+
+    Args:
+        root: Carpeta raíz
+        extensions: Extensiones válidas (con punto, sin distinguir mayúsculas); None = todas
+    """
+    extensions = {ext.lower() for ext in extensions} if extensions is not None else None
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file() and (
+                        extensions is None or os.path.splitext(entry.name)[1].lower() in extensions
+                    ):
+                        yield Path(entry.path)
+        except FileNotFoundError:
+            continue
+
+
+_layouts: Dict[str, OutputLayout] = {}
+_layouts_lock = threading.Lock()
+
+
+def _configured_depth(root: Path) -> int:
+    """Profundidad de settings.yml (output_layout) para una carpeta sin marcador."""
+    try:
+        config = load_config().get("output_layout") or {}
+    except (OSError, ValueError):
+        config = {}
+
+    folders = config.get("folders") or []
+    if root.name not in folders:
+        return 0
+    return int(config.get("depth", 0) or 0)
+
+
+def get_layout(root) -> OutputLayout:
+    """
+    Distribución de una carpeta (en caché por proceso).
+
+    Args:
+        root: Carpeta de salida (Path o str)
+    """
+    root = Path(root)
+    key = os.path.abspath(root)
+
+    with _layouts_lock:
+        layout = _layouts.get(key)
+    if layout is not None:
+        return layout
+
+    try:
+        with open(root / OutputLayout.LAYOUT_NAME, 'r', encoding='utf-8') as f:
+            depth = int(json.load(f).get("depth", 0))
+    except (OSError, ValueError):
+        depth = _configured_depth(root)
+
+    layout = OutputLayout(root, depth)
+    with _layouts_lock:
+        _layouts[key] = layout
+    return layout
+
+
+def invalidate_layout(root=None):
+    """Descarta la distribución en caché de una carpeta (o de todas)."""
+    with _layouts_lock:
+        if root is None:
+            _layouts.clear()
+        else:
+            _layouts.pop(os.path.abspath(root), None)
+
+
+def main():
+    """Punto de entrada para uso por consola (estado y migración)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Distribución por shards de las carpetas de salida"
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    status_parser = subparsers.add_parser('status', help='Mostrar la distribución de una carpeta')
+    status_parser.add_argument('folder', help='Carpeta (ej: ./output)')
+
+    migrate_parser = subparsers.add_parser('migrate', help='Reorganizar una carpeta en su lugar')
+    migrate_parser.add_argument('folder', help='Carpeta (ej: ./output)')
+    migrate_parser.add_argument(
+        '--depth',
+        type=int,
+        default=2,
+        help='Niveles de shards: 0 = plana, 2 = <ab>/<cd>/<nombre> (default: 2)'
+    )
+
+    args = parser.parse_args()
+    layout = get_layout(args.folder)
+
+    if args.command == 'status':
+        files = sum(1 for _ in layout.iter_files())
+        kind = f"shards de {layout.depth} niveles" if layout.sharded else "plana"
+        print(f"{layout.root}: {kind}, {files} archivos")
+    else:
+        moved = layout.migrate(args.depth)
+        print(f"{layout.root}: {moved} archivos movidos (profundidad {args.depth})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Generación y caché de miniaturas para el dashboard.
+Usa decodificación reducida (draft de JPEG, Image.reduce) y guarda las
+miniaturas en disco con un límite de tamaño (LRU).
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PIL import Image, features
+
+from src.utils.file_utils import atomic_path, ensure_directory
+from src.utils.logger import setup_logger
+
+
+class ThumbnailCache:
+    """
+    Caché de miniaturas en disco con límite de tamaño.
+
+    La clave de cada miniatura depende de la ruta, tamaño y mtime del
+    original, así que un original modificado genera una miniatura nueva.
+    El orden LRU se lleva con el mtime de la miniatura (se actualiza en
+    cada acierto).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "./working/thumbnails",
+        max_bytes: int = 200 * 1024 * 1024,
+        size: Tuple[int, int] = (192, 256),
+        image_format: str = "webp",
+        quality: int = 80,
+        max_workers: int = 2
+    ):
+        """
+        Inicializa la caché.
+
+        Args:
+            cache_dir: Carpeta donde guardar las miniaturas
+            max_bytes: Tamaño máximo de la caché en bytes
+            size: Tamaño máximo (ancho, alto) de la miniatura
+            image_format: "webp" o "jpeg" (webp cae a jpeg si Pillow no lo soporta)
+            quality: Calidad de compresión (1-100)
+            max_workers: Hilos para generación en background
+        """
+        self.cache_dir = Path(cache_dir)
+        ensure_directory(self.cache_dir)
+        self.max_bytes = max_bytes
+        self.size = tuple(size)
+        self.quality = quality
+        self.logger = setup_logger()
+
+        if image_format.lower() == "webp" and features.check("webp"):
+            self.image_format, self.extension, self.media_type = "WEBP", ".webp", "image/webp"
+        else:
+            self.image_format, self.extension, self.media_type = "JPEG", ".jpg", "image/jpeg"
+
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbs")
+        self._total_bytes = sum(
+            p.stat().st_size for p in self.cache_dir.glob(f"*{self.extension}")
+        )
+
+    def _key(self, source: Path, st: os.stat_result) -> str:
+        """Clave de caché para un original y su estado actual."""
+        raw = f"{source.resolve()}|{st.st_size}|{st.st_mtime_ns}|{self.size[0]}x{self.size[1]}|{self.quality}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def etag(self, source: Path) -> str:
+        """ETag (entre comillas) de la miniatura de un original."""
+        return f'"{self._key(source, source.stat())}"'
+
+    def get(self, source: Path) -> Tuple[Path, str]:
+        """
+        Retorna la miniatura de un original, generándola si no existe.
+
+        Returns:
+            Tupla (ruta de la miniatura, ETag)
+        """
+        key = self._key(source, source.stat())
+        thumb_path = self.cache_dir / f"{key}{self.extension}"
+
+        if thumb_path.exists():
+            # Marcar como usada recientemente (orden LRU)
+            try:
+                os.utime(thumb_path)
+            except OSError:
+                pass
+        else:
+            self._generate(source, thumb_path)
+
+        return thumb_path, f'"{key}"'
+
+    def _generate(self, source: Path, thumb_path: Path):
+        """Genera la miniatura con decodificación reducida."""
+        width, height = self.size
+
+        with Image.open(source) as img:
+            if img.format == "JPEG":
+                # El decodificador JPEG escala por 1/2, 1/4 o 1/8 al leer
+                img.draft("RGB", (width, height))
+            img.load()
+
+            # Reducción entera barata antes del remuestreo fino
+            factor = min(img.width // width, img.height // height)
+            if factor >= 2:
+                img = img.reduce(factor)
+
+            img.thumbnail(self.size, Image.Resampling.LANCZOS)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            with atomic_path(thumb_path) as temp_path:
+                img.save(temp_path, self.image_format, quality=self.quality)
+
+        with self._lock:
+            self._total_bytes += thumb_path.stat().st_size
+            over_limit = self._total_bytes > self.max_bytes
+
+        if over_limit:
+            self._evict()
+
+    def _evict(self):
+        """Elimina las miniaturas menos usadas hasta bajar al 90% del límite."""
+        with self._lock:
+            entries = []
+            for thumb in self.cache_dir.glob(f"*{self.extension}"):
+                try:
+                    st = thumb.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, thumb))
+
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+
+            for _, size, thumb in sorted(entries, key=lambda e: e[0]):
+                if total <= target:
+                    break
+                try:
+                    thumb.unlink()
+                    total -= size
+                except FileNotFoundError:
+                    pass
+
+            self._total_bytes = total
+
+    def warm_async(self, source: Path):
+        """Genera la miniatura en background (sin bloquear al llamador)."""
+        source = Path(source)
+        with self._lock:
+            if source in self._pending:
+                return
+            self._pending.add(source)
+
+        self._executor.submit(self._warm, source)
+
+    def _warm(self, source: Path):
+        try:
+            if source.exists():
+                self.get(source)
+        except Exception as e:
+            self.logger.warning(f"No se pudo generar miniatura de {source.name}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(source)
+
+    def shutdown(self, wait: bool = True):
+        """Detiene el pool de generación en background."""
+        self._executor.shutdown(wait=wait)
@@ -4,18 +4,33 @@ Este módulo implementa el flujo determinista definido en docs/FLUJO_PROCESAMIEN
 """
 
 import json
-import shutil
-from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime, timezone
 from PIL import Image
 import numpy as np
 
 from src.core.metadata_manager import MetadataManager
-from src.core.face_detector import FaceDetector
+from src.core.archive_source import ArchiveMember, iter_archive_members, member_parts
+from src.core.batch_summary import BatchSummaryAggregator
+from src.core.blob_store import open_blob_store
+from src.core.output_layout import get_layout, iter_folder_files
+from src.core.ingest_queue import IngestQueue
+from src.core.input_scanner import InputScanner
+from src.core.input_watcher import InputWatcher
+from src.core.face_detector import PerThreadFaceDetector
 from src.core.image_processor import ImageProcessor
 from src.utils.logger import setup_logger
-from src.utils.file_utils import load_paths_config, ensure_directory
+from src.utils.file_utils import (
+    load_config, load_paths_config, ensure_directory, forget_directories, file_sha256,
+    get_batch_id_from_path, link_or_copy, atomic_path, write_json_atomic,
+    remove_stale_temp_files, pid_alive
+)
 
 
 class ProcessedIndexManager:
@@ -23,11 +38,21 @@ class ProcessedIndexManager:
 
     def __init__(self, index_path: str):
         self.index_path = Path(index_path)
+        # True si el archivo existía pero no se pudo leer (se reconstruye)
+        self.damaged = False
         self.data = self._load_index()
 
     def _load_index(self) -> Dict[str, Any]:
         """Carga el índice de procesados desde disco."""
-        if not self.index_path.exists():
+        data = None
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                self.damaged = True
+
+        if data is None:
             return {
                 "processed_files": [],
                 "last_updated": None,
@@ -41,8 +66,11 @@ class ProcessedIndexManager:
                 }
             }
 
-        with open(self.index_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return data
+
+    def reload(self):
+        """Recarga el índice desde disco (por si otro proceso lo actualizó)."""
+        self.data = self._load_index()
 
     def is_processed(self, filename: str) -> bool:
         """Verifica si un archivo ya fue procesado."""
@@ -63,12 +91,22 @@ class ProcessedIndexManager:
             elif status == "error":
                 self.data["statistics"]["errors"] += 1
 
+    def remove_processed(self, filename: str, status: str):
+        """Quita un archivo del índice (se volverá a procesar)."""
+        if filename in self.data["processed_files"]:
+            self.data["processed_files"].remove(filename)
+            self.data["total_processed"] -= 1
+            self.data["statistics"]["total_processed"] -= 1
+
+            key = {"processed": "successful", "manual_review": "manual_review", "error": "errors"}.get(status)
+            if key:
+                self.data["statistics"][key] = max(0, self.data["statistics"][key] - 1)
+
     def save(self):
-        """Guarda el índice actualizado."""
+        """Guarda el índice actualizado (temporal + rename)."""
         self.data["last_updated"] = datetime.now(timezone.utc).isoformat()
-        self.index_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.index_path, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        ensure_directory(self.index_path.parent)
+        write_json_atomic(self.index_path, self.data)
 
 
 class CropDecisionEngine:
@@ -199,6 +237,8 @@ class DeterministicPhotoProcessor:
 
         # Cargar configuración
         self.paths = load_paths_config(config_path)
+        for key, default in self.EXTRA_PATHS.items():
+            self.paths.setdefault(key, default)
         self.logger.info(f"Configuración cargada desde: {config_path}")
 
         # Verificar carpetas necesarias
@@ -206,11 +246,52 @@ class DeterministicPhotoProcessor:
 
         # Inicializar componentes
         self.metadata_manager = MetadataManager(self.paths["metadata"])
-        self.face_detector = FaceDetector()
+        # Un detector por hilo: los lotes concurrentes no comparten el de dlib
+        self.face_detector = PerThreadFaceDetector()
         self.image_processor = ImageProcessor()
         self.processed_index = ProcessedIndexManager(self.paths["processed_index"])
         self.crop_engine = CropDecisionEngine()
 
+        # Caché de miniaturas opcional (la asigna el dashboard)
+        self.thumbnail_cache = None
+
+        # Checkpoints de metadato antes de etapas largas (por defecto, solo escritura final)
+        try:
+            processing_config = load_config().get("processing") or {}
+        except (OSError, ValueError):
+            processing_config = {}
+        self.metadata_checkpoints = bool(processing_config.get("metadata_checkpoints", False))
+
+        # Lotes anidados en input_raw/<año>/<lote>/ y cuántos se procesan a la vez
+        self.scan_batches = bool(processing_config.get("scan_batches", True))
+        self.batch_workers = max(1, int(processing_config.get("batch_workers", 1)))
+
+        # Réplica de originales en manual_review/errors: "auto" (hardlink →
+        # reflink → copy_file_range → copia), "reflink" o "copy"
+        self.link_strategy = processing_config.get("link_strategy", "auto")
+
+        # Almacén de salidas por contenido (None = archivos independientes)
+        self.blob_store = open_blob_store()
+
+        # Escaneo incremental de input_raw (snapshot junto a processed_index.json)
+        self.input_scanner = InputScanner(
+            Path(self.paths["input_raw"]),
+            self.paths.get("input_snapshot")
+            or Path(self.paths["processed_index"]).with_name(InputScanner.SNAPSHOT_NAME),
+            self.VALID_EXTENSIONS,
+            min_size=self.MIN_FILE_SIZE,
+            recursive=self.scan_batches,
+            logger=self.logger
+        )
+
+        # Resúmenes de lote incrementales (uno por batch_id en curso)
+        self.batch_summaries: Dict[str, BatchSummaryAggregator] = {}
+        self._batch_paths: Dict[str, str] = {}
+
+        # Estado compartido entre los hilos de lotes concurrentes
+        # (estadísticas, índice de procesados y resúmenes)
+        self._state_lock = threading.RLock()
+
         # Estadísticas
         self.stats = {
             "total": 0,
@@ -219,6 +300,10 @@ class DeterministicPhotoProcessor:
             "manual_review": 0,
             "errors": 0
         }
+        self.batch_stats: Dict[str, Dict[str, int]] = {}
+
+        # Recuperación de una ejecución interrumpida
+        self.recover()
 
         self.logger.info("Inicialización completada")
 
@@ -232,6 +317,157 @@ class DeterministicPhotoProcessor:
             if dir_key in self.paths:
                 ensure_directory(self.paths[dir_key])
 
+    # Carpetas propias de una subclase que no están en paths.json; se
+    # agregan a self.paths antes de la recuperación
+    EXTRA_PATHS: Dict[str, str] = {}
+
+    # Carpetas de self.paths donde el procesador no escribe temporales
+    RECOVERY_SKIP = ("input_raw", "logs")
+
+    def _recovery_folders(self) -> List[Path]:
+        """
+        Carpetas de self.paths donde se escribe con atomic_path, sin repetir
+        las que ya quedan dentro de otra (el recorrido es recursivo).
+        """
+        folders = sorted(
+            Path(os.path.abspath(value))
+            for key, value in self.paths.items()
+            if key not in self.RECOVERY_SKIP and Path(value).is_dir()
+        )
+        result: List[Path] = []
+        for folder in folders:
+            if not any(folder == parent or parent in folder.parents for parent in result):
+                result.append(folder)
+        return result
+
+    @contextmanager
+    def _running(self):
+        """
+        Marca la ejecución en curso mientras dura el bloque (run, watch o
+        process_archive). Si el proceso termina a mitad (kill, corte de
+        energía), el marcador queda y la próxima inicialización lo detecta
+        como ejecución interrumpida. Un proceso que crea varios
+        procesadores (webapp) no acumula marcadores entre trabajos.
+        """
+        marker = Path(self.paths["processed_index"]).with_name(
+            f".processing.{os.getpid()}.{threading.get_ident()}.json"
+        )
+        write_json_atomic(marker, {
+            "pid": os.getpid(),
+            "started": datetime.now(timezone.utc).isoformat()
+        })
+        try:
+            yield
+        finally:
+            marker.unlink(missing_ok=True)
+
+    def _interrupted_runs(self) -> List[Path]:
+        """Marcadores de ejecuciones cuyo proceso ya no existe."""
+        markers = []
+        for marker in Path(self.paths["processed_index"]).parent.glob(".processing.*.json"):
+            try:
+                pid = int(marker.name.split(".")[2])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not pid_alive(pid):
+                markers.append(marker)
+        return markers
+
+    @staticmethod
+    def _output_complete(path: Optional[str]) -> bool:
+        """True si la salida existe y la imagen está completa (no truncada)."""
+        if not path:
+            return False
+        path = Path(path)
+        try:
+            if path.stat().st_size == 0:
+                return False
+            with Image.open(path) as img:
+                img.verify()
+                is_jpeg = img.format == 'JPEG'
+            if is_jpeg:
+                # Un JPEG truncado no tiene el marcador EOI al final
+                with open(path, 'rb') as f:
+                    f.seek(max(0, path.stat().st_size - 32))
+                    return b'\xff\xd9' in f.read()
+            return True
+        except Exception:
+            return False
+
+    def _result_complete(self, metadata: Dict[str, Any]) -> bool:
+        """True si los archivos que el metadato declara están en disco."""
+        status = metadata.get("status")
+        if status == "processed":
+            return all(
+                self._output_complete(metadata.get(key))
+                for key in ("output_path", "output_white_path")
+                if key == "output_path" or metadata.get(key)
+            )
+        if status == "manual_review":
+            return bool(metadata.get("current_path")) and Path(metadata["current_path"]).is_file()
+        return status == "error"
+
+    def recover(self, force: bool = False) -> Optional[Dict[str, int]]:
+        """
+        Reconciliación tras una ejecución interrumpida.
+
+        Se ejecuta si quedó el marcador de un proceso que ya no existe, si
+        processed_index.json no se pudo leer, o con force=True:
+
+        - Elimina los temporales de escritura que dejó el proceso caído.
+        - Quita del índice los archivos cuyo resultado no está completo en
+          disco (se vuelven a procesar) y agrega los que quedaron completos
+          pero sin registrar (corte entre el metadato y el índice).
+
+        Returns:
+            Conteos (temp_files, dropped, restored), o None si no hizo falta
+        """
+        markers = self._interrupted_runs()
+        if not (force or markers or self.processed_index.damaged):
+            return None
+
+        self.logger.warning("RECUPERACIÓN DE EJECUCIÓN INTERRUMPIDA")
+
+        temp_files = 0
+        for folder in self._recovery_folders():
+            temp_files += remove_stale_temp_files(folder)
+
+        # Último metadato final de cada clave del índice (nombre o <año>/<lote>/<nombre>)
+        latest: Dict[str, Dict[str, Any]] = {}
+        store = self.metadata_manager.store
+        store.refresh()
+        for _, _, metadata in store.iter_records():
+            if metadata.get("status") not in ("processed", "manual_review", "error"):
+                continue
+            key = self._index_key(metadata.get("input_path") or metadata["filename"])
+            current = latest.get(key)
+            if current is None or (current.get("last_updated") or "") < (metadata.get("last_updated") or ""):
+                latest[key] = metadata
+
+        dropped = restored = 0
+        for filename in list(self.processed_index.data["processed_files"]):
+            metadata = latest.get(filename)
+            if metadata is not None and not self._result_complete(metadata):
+                self.processed_index.remove_processed(filename, metadata["status"])
+                dropped += 1
+
+        for filename, metadata in latest.items():
+            if not self.processed_index.is_processed(filename) and self._result_complete(metadata):
+                self.processed_index.add_processed(filename, metadata["status"])
+                restored += 1
+
+        self.processed_index.save()
+        self.processed_index.damaged = False
+        for marker in markers:
+            marker.unlink(missing_ok=True)
+
+        self.logger.warning(
+            f"  Temporales eliminados: {temp_files} | "
+            f"Reprocesar (salida incompleta): {dropped} | "
+            f"Registrados (completos sin índice): {restored}"
+        )
+        return {"temp_files": temp_files, "dropped": dropped, "restored": restored}
+
     def run(self, batch_id: Optional[str] = None, auto_clean: bool = False):
         """
         Ejecuta el flujo completo de procesamiento.
@@ -240,101 +476,277 @@ class DeterministicPhotoProcessor:
             batch_id: Identificador del lote (opcional)
             auto_clean: Si True, elimina archivos procesados exitosamente de input_raw
         """
-        # 2. ESCANEO DE ENTRADA
-        self.logger.info("\n" + "=" * 80)
-        self.logger.info("2. ESCANEO DE ENTRADA")
-        self.logger.info("=" * 80)
+        with self._running():
+            # 2. ESCANEO DE ENTRADA
+            self.logger.info("\n" + "=" * 80)
+            self.logger.info("2. ESCANEO DE ENTRADA")
+            self.logger.info("=" * 80)
+
+            input_dir = Path(self.paths["input_raw"])
+
+            # Los archivos sueltos en la raíz usan un solo batch_id para toda la
+            # ejecución; los de input_raw/<año>/<lote>/ usan el de su carpeta
+            if batch_id is None:
+                batch_id = self._extract_batch_id(input_dir)
+
+            # Las carpetas conocidas se vuelven a comprobar una vez por ejecución
+            forget_directories()
+            self._ensure_directories()
+
+            # 3. FILTRADO y 4. PROCESAMIENTO DE ARCHIVOS NUEVOS
+            # El escaneo es un generador: solo entrega archivos nuevos o
+            # modificados según el snapshot, y cada uno se procesa apenas se
+            # encuentra (sin esperar a que termine el listado)
+            # Un archivo sin cambios solo se omite si sigue en el índice
+            # (recover() o un operador pueden haberlo quitado)
+            with self._state_lock:
+                registered = set(self.processed_index.data["processed_files"])
+            scheduler = _BatchScheduler(self, self.batch_workers)
+            for img_path in self.input_scanner.scan(
+                self.processed_index.data["total_processed"],
+                known=lambda path: self._index_key(path) in registered
+            ):
+                file_batch = self._resolve_batch(img_path, input_dir, batch_id)
+                if not scheduler.submitted:
+                    self.logger.info("\n" + "=" * 80)
+                    self.logger.info("4. PROCESAMIENTO DE ARCHIVOS NUEVOS")
+                    self.logger.info("=" * 80)
+                scheduler.submit(img_path, file_batch)
+            new_count = scheduler.wait()
+
+            self.input_scanner.save(self.processed_index.data["total_processed"])
+
+            # Los archivos sin cambios desde el snapshot cuentan como ya procesados
+            for rel_dir, unchanged in self.input_scanner.unchanged_by_dir.items():
+                # Cualquier nombre dentro de la carpeta resuelve su lote
+                file_batch = self._resolve_batch(input_dir / rel_dir / "_", input_dir, batch_id)
+                self._count(file_batch, "total", unchanged)
+                self._count(file_batch, "skipped", unchanged)
+
+            if self.input_scanner.found == 0:
+                self.logger.warning(f"No se encontraron imágenes en {input_dir}")
+                return self.stats
+
+            self.logger.info(
+                f"Total de archivos encontrados: {self.input_scanner.found} "
+                f"(sin cambios desde el último escaneo: {self.input_scanner.unchanged})"
+            )
 
-        input_dir = Path(self.paths["input_raw"])
-        all_files = self._scan_input_directory(input_dir)
+            if new_count == 0:
+                self.logger.info("No hay archivos nuevos para procesar")
+                return self.stats
 
-        if not all_files:
-            self.logger.warning(f"No se encontraron imágenes en {input_dir}")
-            return self.stats
+            self.logger.info(f"Archivos nuevos procesados: {new_count}")
 
-        self.logger.info(f"Total de archivos encontrados: {len(all_files)}")
+            # 5. RESUMEN DE CADA LOTE
+            self.finalize_summaries()
 
-        # 3. FILTRADO DE ARCHIVOS NUEVOS
-        self.logger.info("\n" + "=" * 80)
-        self.logger.info("3. FILTRADO DE ARCHIVOS NUEVOS")
-        self.logger.info("=" * 80)
+            # 6. LIMPIEZA OPCIONAL
+            if auto_clean:
+                self._cleanup_processed_files(input_dir)
 
-        new_files = self._filter_new_files(all_files)
+            # 7. RESUMEN FINAL
+            self._print_summary()
 
-        if not new_files:
-            self.logger.info("No hay archivos nuevos para procesar")
             return self.stats
 
-        self.logger.info(f"Archivos nuevos a procesar: {len(new_files)}")
+    def watch(
+        self,
+        batch_id: Optional[str] = None,
+        settle_seconds: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+        backend: Optional[str] = None
+    ):
+        """
+        MODO VIGILANCIA: procesa cada foto apenas termina de llegar a
+        input_raw, con los modelos ya cargados y sin reescanear la carpeta.
+        Bloquea hasta Ctrl+C.
 
-        # 4. PROCESAMIENTO DE ARCHIVOS NUEVOS
-        self.logger.info("\n" + "=" * 80)
-        self.logger.info("4. PROCESAMIENTO DE ARCHIVOS NUEVOS")
-        self.logger.info("=" * 80)
+        Args:
+            batch_id: Lote de los archivos recibidos (default: uno nuevo por sesión)
+            settle_seconds: Segundos sin cambios para dar un archivo por completo
+            poll_interval: Segundos entre sondeos (o espera máxima de inotify)
+            backend: "inotify", "poll" o "auto"
+        """
+        with self._running():
+            try:
+                watch_config = load_config().get("watch") or {}
+            except (OSError, ValueError):
+                watch_config = {}
+
+            input_dir = Path(self.paths["input_raw"])
+            if batch_id is None:
+                batch_id = self._extract_batch_id(input_dir)
+
+            # El procesador ya está inicializado: la cola lo reutiliza
+            ingest_queue = IngestQueue(
+                processor_factory=lambda: self,
+                maxsize=watch_config.get("queue_size", 64),
+                workers=watch_config.get("workers", 1)
+            )
+            watcher = InputWatcher(
+                input_dir,
+                ingest_queue,
+                self.VALID_EXTENSIONS,
+                min_size=self.MIN_FILE_SIZE,
+                batch_id=batch_id,
+                settle_seconds=settle_seconds if settle_seconds is not None else watch_config.get("settle_seconds", 2.0),
+                poll_interval=poll_interval if poll_interval is not None else watch_config.get("poll_interval", 1.0),
+                backend=backend or watch_config.get("backend", "auto"),
+                recursive=self.scan_batches
+            )
 
-        for img_path in new_files:
-            self._process_single_file(img_path, batch_id)
+            self.logger.info("\n" + "=" * 80)
+            self.logger.info(f"MODO VIGILANCIA (lote {batch_id}) - Ctrl+C para detener")
+            self.logger.info("=" * 80)
+
+            ingest_queue.start()
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                self.logger.info("Vigilancia detenida")
+            finally:
+                watcher.stop(wait=False)
+                ingest_queue.stop(wait=True)
+                self.finalize_summaries()
+                self._print_summary()
 
-        # 6. LIMPIEZA OPCIONAL
-        if auto_clean:
-            self._cleanup_processed_files(input_dir)
+            return self.stats
 
-        # 7. RESUMEN FINAL
-        self._print_summary()
+    def process_archive(
+        self,
+        archive_path: Path,
+        batch_id: Optional[str] = None,
+        workers: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Procesa las imágenes de un ZIP/TAR sin extraerlas a input_raw.
 
-        return self.stats
+        Los miembros bajo <año>/<lote>/ usan el lote de su carpeta; el resto,
+        batch_id. En los metadatos, input_path queda como
+        "<archivo>!<miembro>". Los resultados son los mismos que procesando
+        los archivos extraídos.
 
-    def _scan_input_directory(self, input_dir: Path) -> List[Path]:
+        Args:
+            archive_path: Archivo .zip, .tar, .tar.gz, .tgz, .tar.bz2 o .tar.xz
+            batch_id: Lote de los miembros sueltos (default: uno nuevo)
+            workers: Miembros de ZIP descomprimidos en paralelo
         """
-        Escanea el directorio de entrada y retorna lista de archivos válidos.
+        with self._running():
+            archive_path = Path(archive_path)
+            if batch_id is None:
+                batch_id = self._extract_batch_id(archive_path)
+
+            self.logger.info("\n" + "=" * 80)
+            self.logger.info(f"PROCESAMIENTO DESDE ARCHIVO: {archive_path}")
+            self.logger.info("=" * 80)
+
+            scheduler = _BatchScheduler(self, self.batch_workers)
+            members = iter_archive_members(archive_path, self.VALID_EXTENSIONS, self.MIN_FILE_SIZE, workers)
+            for member in members:
+                member_batch = get_batch_id_from_path(member.member_path, PurePosixPath())
+                if member_batch == "default_batch":
+                    member_batch = batch_id
+                else:
+                    with self._state_lock:
+                        self._batch_paths.setdefault(member_batch, f"{archive_path}!{member.member_path.parent}")
+                scheduler.submit(member, member_batch)
+
+            scheduler.wait()
+            self.finalize_summaries()
+            self._print_summary()
+            return self.stats
 
-        Returns:
-            Lista de Path con archivos válidos
+    def _batch_subdir(self, img_path: Union[Path, ArchiveMember, str]) -> Optional[str]:
         """
-        all_files = []
+        Carpeta de lote de un archivo, relativa a input_raw o al ZIP/TAR
+        (ej: "2026/admision_01"); None para los archivos sueltos en la raíz.
 
-        # Listar solo archivos en el nivel raíz (sin subdirectorios)
-        for item in input_dir.iterdir():
-            if not item.is_file():
-                continue
+        Acepta también el input_path de un metadato ("<archivo>!<miembro>").
+        """
+        if isinstance(img_path, ArchiveMember):
+            relative = img_path.member_path
+        elif isinstance(img_path, str) and "!" in img_path:
+            parts = member_parts(img_path.split("!", 1)[1])
+            if parts is None:
+                return None
+            relative = PurePosixPath(*parts)
+        else:
+            try:
+                relative = PurePosixPath(
+                    Path(os.path.abspath(img_path)).relative_to(os.path.abspath(self.paths["input_raw"])).as_posix()
+                )
+            except ValueError:
+                return None
+
+        # Estructura de lote: <año>/<lote>/<archivo> (ver get_batch_id_from_path)
+        if len(relative.parts) < 3:
+            return None
+        return relative.parent.as_posix()
 
-            # Excluir archivos ocultos
-            if item.name.startswith('.'):
-                continue
+    def _index_key(self, img_path: Union[Path, ArchiveMember, str]) -> str:
+        """
+        Clave de processed_index.json: el nombre para los archivos sueltos
+        y <año>/<lote>/<nombre> para los de una carpeta de lote, porque el
+        mismo nombre se repite entre convocatorias.
+        """
+        name = PurePosixPath(str(img_path).split("!", 1)[-1]).name if isinstance(img_path, str) else img_path.name
+        subdir = self._batch_subdir(img_path)
+        return f"{subdir}/{name}" if subdir else name
 
-            # Filtrar por extensión
-            if item.suffix.lower() not in self.VALID_EXTENSIONS:
-                continue
+    def _is_new_file(self, file_path: Path, batch_id: Optional[str] = None) -> bool:
+        """
+        3. FILTRADO: verifica que un archivo entregado por el escaneo no
+        esté ya en el índice de procesados.
+        """
+        self._count(batch_id, "total")
 
-            # Verificar tamaño mínimo
-            if item.stat().st_size < self.MIN_FILE_SIZE:
-                self.logger.warning(f"Archivo muy pequeño, ignorando: {item.name}")
-                continue
+        with self._state_lock:
+            processed = self.processed_index.is_processed(self._index_key(file_path))
 
-            all_files.append(item)
+        if processed:
+            self.logger.info(f"✓ Ya procesado, saltando: {file_path.name}")
+            self._count(batch_id, "skipped")
+            return False
 
-        return all_files
+        return True
 
-    def _filter_new_files(self, all_files: List[Path]) -> List[Path]:
+    def _resolve_batch(self, img_path: Path, input_dir: Path, default_batch: str) -> str:
+        """batch_id de un archivo: el de su carpeta <año>/<lote>/ o el de la ejecución."""
+        batch_id = get_batch_id_from_path(img_path, input_dir)
+        if batch_id == "default_batch":
+            return default_batch
+
+        with self._state_lock:
+            self._batch_paths.setdefault(batch_id, str(img_path.parent))
+        return batch_id
+
+    def _count(self, batch_id: Optional[str], key: str, amount: int = 1):
+        """Suma a las estadísticas globales y a las del lote."""
+        with self._state_lock:
+            self.stats[key] += amount
+            if batch_id is not None:
+                batch = self.batch_stats.setdefault(batch_id, dict.fromkeys(self.stats, 0))
+                batch[key] += amount
+
+    def process_file(self, img_path: Path, batch_id: Optional[str] = None) -> bool:
         """
-        Filtra archivos que ya fueron procesados.
+        Procesa un único archivo fuera del escaneo de run().
+        Usado por la ingesta continua (subidas y modo vigilancia).
 
         Returns:
-            Lista de archivos nuevos (no procesados)
+            True si se procesó, False si ya estaba en el índice
         """
-        new_files = []
-
-        for file_path in all_files:
-            self.stats["total"] += 1
-
-            if self.processed_index.is_processed(file_path.name):
-                self.logger.info(f"✓ Ya procesado, saltando: {file_path.name}")
-                self.stats["skipped"] += 1
-                continue
+        if batch_id is None:
+            batch_id = self._extract_batch_id(img_path)
+        # Los archivos de input_raw/<año>/<lote>/ usan el lote de su carpeta
+        batch_id = self._resolve_batch(Path(img_path), Path(self.paths["input_raw"]), batch_id)
 
-            new_files.append(file_path)
+        if not self._is_new_file(img_path, batch_id):
+            return False
 
-        return new_files
+        self._process_single_file(img_path, batch_id)
+        return True
 
     def _process_single_file(self, img_path: Path, batch_id: Optional[str]):
         """
@@ -348,34 +760,74 @@ class DeterministicPhotoProcessor:
         if batch_id is None:
             batch_id = self._extract_batch_id(img_path)
 
-        try:
-            # 4.1 VALIDACIÓN BÁSICA
-            metadata = self._validate_and_create_metadata(img_path, batch_id)
-            if metadata is None:
-                return  # Error manejado en la función
+        for attempt in range(2):
+            # El metadato vive en memoria durante todo el archivo y se guarda
+            # una sola vez al llegar a un estado final (_finalize_file)
+            metadata = None
+
+            try:
+                # 4.1 VALIDACIÓN BÁSICA
+                metadata = self._validate_and_create_metadata(img_path, batch_id)
+                if metadata is None:
+                    return  # Error manejado en la función
+
+                # 4.3 DETECCIÓN FACIAL
+                detection_result = self._detect_faces(img_path, metadata)
+
+                if detection_result is None:
+                    return  # Error manejado
+
+                num_faces, faces, img = detection_result
+
+                # 4.4 y 4.5 PROCESAMIENTO SEGÚN RESULTADO
+                if num_faces == 0:
+                    self._handle_no_face(img_path, metadata, batch_id)
+                elif num_faces == 1:
+                    face_box = self._face_to_box(faces[0])
+                    self._handle_single_face(img_path, img, metadata, batch_id, face_box)
+                else:
+                    largest_face = self.face_detector.get_largest_face(faces)
+                    face_box = self._face_to_box(largest_face)
+                    self._handle_multiple_faces(img_path, metadata, batch_id, num_faces, face_box)
+
+            except Exception as e:
+                if isinstance(e, FileNotFoundError) and attempt == 0:
+                    # Otro proceso (clean_system.py) pudo borrar una carpeta que
+                    # el caché de ensure_directory da por existente: se vuelve a
+                    # crear y el archivo se reintenta una vez
+                    forget_directories()
+                    self.logger.warning(f"  Carpeta no encontrada, reintentando: {e}")
+                    continue
+                self.logger.error(f"Error inesperado: {str(e)}", exc_info=True)
+                self._handle_error(img_path, batch_id, f"Error inesperado: {str(e)}", metadata)
+
+            return
 
-            # 4.3 DETECCIÓN FACIAL
-            detection_result = self._detect_faces(img_path, metadata)
-
-            if detection_result is None:
-                return  # Error manejado
+    @staticmethod
+    def _open_input(img_path: Union[Path, ArchiveMember]):
+        """Ruta o stream de lectura de la imagen de entrada (para Image.open)."""
+        return img_path.open() if isinstance(img_path, ArchiveMember) else img_path
 
-            num_faces, faces, img = detection_result
+    @staticmethod
+    def _input_hash(img_path: Union[Path, ArchiveMember]) -> str:
+        """SHA-256 del contenido original."""
+        return img_path.sha256() if isinstance(img_path, ArchiveMember) else file_sha256(img_path)
 
-            # 4.4 y 4.5 PROCESAMIENTO SEGÚN RESULTADO
-            if num_faces == 0:
-                self._handle_no_face(img_path, metadata, batch_id)
-            elif num_faces == 1:
-                face_box = self._face_to_box(faces[0])
-                self._handle_single_face(img_path, img, metadata, batch_id, face_box)
-            else:
-                largest_face = self.face_detector.get_largest_face(faces)
-                face_box = self._face_to_box(largest_face)
-                self._handle_multiple_faces(img_path, metadata, batch_id, num_faces, face_box)
+    def _copy_input(self, img_path: Union[Path, ArchiveMember], dest_path: Path) -> Optional[str]:
+        """
+        Replica el original en manual_review/errors sin duplicar datos si es
+        posible (ver link_or_copy). Los miembros de ZIP/TAR se escriben.
 
-        except Exception as e:
-            self.logger.error(f"Error inesperado: {str(e)}", exc_info=True)
-            self._handle_error(img_path, batch_id, f"Error inesperado: {str(e)}")
+        Returns:
+            Estrategia usada ("hardlink", "reflink", "copy_file_range",
+            "copy" o "write"), o None si no había contenido
+        """
+        if isinstance(img_path, ArchiveMember):
+            if img_path.data is None:
+                return None
+            img_path.write_to(dest_path)
+            return "write"
+        return link_or_copy(img_path, dest_path, self.link_strategy)
 
     def _validate_and_create_metadata(
         self,
@@ -389,7 +841,10 @@ class DeterministicPhotoProcessor:
 
         try:
             # Intentar abrir imagen
-            img = Image.open(img_path)
+            if isinstance(img_path, ArchiveMember) and img_path.error:
+                raise ValueError(f"No se pudo leer del archivo: {img_path.error}")
+
+            img = Image.open(self._open_input(img_path))
             width, height = img.size
             img_format = img.format
 
@@ -407,14 +862,12 @@ class DeterministicPhotoProcessor:
                 batch_id=batch_id,
                 width=width,
                 height=height,
-                img_format=img_format
+                img_format=img_format,
+                file_hash=self._input_hash(img_path)
             )
 
             self.logger.info(f"  Orientación: {metadata['orientation']}")
 
-            # Guardar metadato inicial
-            self.metadata_manager.save_metadata(metadata, batch_id)
-
             return metadata
 
         except Exception as e:
@@ -434,7 +887,7 @@ class DeterministicPhotoProcessor:
         self.logger.info("4.3 Detección facial con dlib...")
 
         try:
-            img = Image.open(img_path)
+            img = Image.open(self._open_input(img_path))
             img_array = np.array(img.convert('RGB'))
             faces = self.face_detector.detect_faces(img_array)
             num_faces = len(faces)
@@ -446,7 +899,7 @@ class DeterministicPhotoProcessor:
         except Exception as e:
             error_msg = f"dlib error: {str(e)}"
             self.logger.error(f"Error en detección facial: {error_msg}")
-            self._handle_error(img_path, metadata["batch_id"], error_msg)
+            self._handle_error(img_path, metadata["batch_id"], error_msg, metadata)
             return None
 
     def _face_to_box(self, face) -> List[int]:
@@ -476,19 +929,17 @@ class DeterministicPhotoProcessor:
         # Mover a manual_review
         year = datetime.now().year
         dest_dir = Path(self.paths["manual_review"]) / str(year) / batch_id
-        dest_dir.mkdir(parents=True, exist_ok=True)
+        ensure_directory(dest_dir)
         dest_path = dest_dir / img_path.name
 
-        shutil.copy2(img_path, dest_path)
-
+        metadata["copy_strategy"] = self._copy_input(img_path, dest_path)
         metadata["current_path"] = str(dest_path)
 
-        # Guardar metadata y registrar
-        self.metadata_manager.save_metadata(metadata, batch_id)
-        self.processed_index.add_processed(img_path.name, "manual_review")
-        self.processed_index.save()
-        self.stats["manual_review"] += 1
+        # Guardar metadata (única escritura) y registrar
+        self._finalize_file(img_path, metadata, batch_id, "manual_review")
+        self._count(batch_id, "manual_review")
 
+        self._schedule_thumbnails(dest_path)
         self.logger.warning(f"  ⚠️  Imagen enviada a revisión manual → {dest_path}")
 
     def _handle_single_face(
@@ -568,16 +1019,18 @@ class DeterministicPhotoProcessor:
         # Aplicar recorte
         cropped_img = img.crop(crop_box)
 
-        # Guardar en output
-        output_dir = Path(self.paths["output"])
-        output_dir.mkdir(parents=True, exist_ok=True)
-        output_path = output_dir / img_path.name
+        # Guardar en output (en su shard si la carpeta está distribuida)
+        output_path = get_layout(self.paths["output"]).path_for(img_path.name, self._batch_subdir(img_path))
+        ensure_directory(output_path.parent)
 
-        # Guardar con alta calidad
-        if img_path.suffix.lower() in ['.jpg', '.jpeg']:
-            cropped_img.save(output_path, 'JPEG', quality=95)
-        else:
-            cropped_img.save(output_path)
+        # Guardar con alta calidad (temporal + rename: nunca queda a medias)
+        with atomic_path(output_path) as temp_path:
+            if img_path.suffix.lower() in ['.jpg', '.jpeg']:
+                cropped_img.save(temp_path, 'JPEG', quality=95)
+            else:
+                cropped_img.save(temp_path)
+        if self.blob_store is not None:
+            self.blob_store.ingest(output_path)
 
         # Actualizar metadata
         metadata = self.metadata_manager.update_metadata(
@@ -589,12 +1042,11 @@ class DeterministicPhotoProcessor:
             details="Recorte aplicado exitosamente"
         )
 
-        # Guardar y registrar
-        self.metadata_manager.save_metadata(metadata, batch_id)
-        self.processed_index.add_processed(img_path.name, "processed")
-        self.processed_index.save()
-        self.stats["processed"] += 1
+        # Guardar metadata (única escritura) y registrar
+        self._finalize_file(img_path, metadata, batch_id, "processed")
+        self._count(batch_id, "processed")
 
+        self._schedule_thumbnails(output_path)
         self.logger.info(f"  ✓ Imagen procesada exitosamente → {output_path}")
 
     def _send_to_manual_review(
@@ -607,67 +1059,130 @@ class DeterministicPhotoProcessor:
         """Envía imagen a revisión manual"""
         year = datetime.now().year
         dest_dir = Path(self.paths["manual_review"]) / str(year) / batch_id
-        dest_dir.mkdir(parents=True, exist_ok=True)
+        ensure_directory(dest_dir)
         dest_path = dest_dir / img_path.name
 
-        shutil.copy2(img_path, dest_path)
+        copy_strategy = self._copy_input(img_path, dest_path)
 
         # Actualizar metadata
         metadata = self.metadata_manager.update_metadata(
             metadata,
             current_path=str(dest_path),
+            copy_strategy=copy_strategy,
             status="manual_review",
             action="sent_to_manual_review",
             details=reason
         )
 
-        # Guardar y registrar
-        self.metadata_manager.save_metadata(metadata, batch_id)
-        self.processed_index.add_processed(img_path.name, "manual_review")
-        self.processed_index.save()
-        self.stats["manual_review"] += 1
+        # Guardar metadata (única escritura) y registrar
+        self._finalize_file(img_path, metadata, batch_id, "manual_review")
+        self._count(batch_id, "manual_review")
 
+        self._schedule_thumbnails(dest_path)
         self.logger.warning(f"  ⚠️  Imagen enviada a revisión manual → {dest_path}")
 
-    def _handle_error(self, img_path: Path, batch_id: str, error_message: str):
-        """4.6 Manejo de errores"""
+    def _handle_error(
+        self,
+        img_path: Path,
+        batch_id: str,
+        error_message: str,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        """
+        4.6 Manejo de errores
+
+        Si el archivo ya tenía metadato en memoria se reutiliza, para que
+        processing_history conserve las etapas anteriores al error.
+        """
         self.logger.error("  ✗ Error en procesamiento")
 
         # Mover a errors
         year = datetime.now().year
         error_dir = Path(self.paths["errors"]) / str(year) / batch_id
-        error_dir.mkdir(parents=True, exist_ok=True)
+        ensure_directory(error_dir)
         error_path = error_dir / img_path.name
 
+        copy_strategy = None
         try:
-            shutil.copy2(img_path, error_path)
+            copy_strategy = self._copy_input(img_path, error_path)
         except Exception as e:
             self.logger.error(f"No se pudo mover archivo a errors: {e}")
 
-        # Crear metadata de error
-        metadata = self.metadata_manager.create_metadata(
-            filename=img_path.name,
-            input_path=str(img_path),
-            batch_id=batch_id
-        )
+        # Crear metadata de error (si el error ocurrió antes de tenerlo)
+        if metadata is None:
+            metadata = self.metadata_manager.create_metadata(
+                filename=img_path.name,
+                input_path=str(img_path),
+                batch_id=batch_id
+            )
 
         metadata = self.metadata_manager.update_metadata(
             metadata,
             current_path=str(error_path),
+            copy_strategy=copy_strategy,
             status="error",
             error_message=error_message,
             action="error_detected",
             details=error_message
         )
 
-        # Guardar y registrar
-        self.metadata_manager.save_metadata(metadata, batch_id)
-        self.processed_index.add_processed(img_path.name, "error")
-        self.processed_index.save()
-        self.stats["errors"] += 1
+        # Guardar metadata (única escritura) y registrar
+        self._finalize_file(img_path, metadata, batch_id, "error")
+        self._count(batch_id, "errors")
 
         self.logger.error(f"  ✗ Imagen con error → {error_path}")
 
+    def _finalize_file(self, img_path: Path, metadata: Dict[str, Any], batch_id: str, status: str):
+        """
+        Persiste el metadato final del archivo (única escritura) y registra
+        el resultado en el índice de procesados y en el resumen del lote.
+        """
+        self.metadata_manager.save_metadata(metadata, batch_id)
+        with self._state_lock:
+            self.processed_index.add_processed(self._index_key(img_path), status)
+            self.processed_index.save()
+            self._record_summary(metadata, batch_id)
+
+    def _checkpoint_metadata(self, metadata: Dict[str, Any], batch_id: str):
+        """
+        Guarda el metadato parcial antes de una etapa larga.
+        Solo si processing.metadata_checkpoints está activo en settings.yml.
+        """
+        if self.metadata_checkpoints:
+            self.metadata_manager.save_metadata(metadata, batch_id)
+
+    def _record_summary(self, metadata: Dict[str, Any], batch_id: str):
+        """Suma el resultado final de un archivo al resumen de su lote."""
+        try:
+            aggregator = self.batch_summaries.get(batch_id)
+            if aggregator is None:
+                aggregator = BatchSummaryAggregator(
+                    self.metadata_manager,
+                    batch_id,
+                    batch_path=self._batch_paths.get(batch_id, self.paths["input_raw"])
+                )
+                self.batch_summaries[batch_id] = aggregator
+            aggregator.add(metadata)
+        except Exception as e:
+            self.logger.warning(f"No se pudo actualizar el resumen del lote {batch_id}: {e}")
+
+    def finalize_summaries(self):
+        """Escribe el batch_summary.json final de cada lote en curso."""
+        for batch_id, aggregator in list(self.batch_summaries.items()):
+            try:
+                summary_path = aggregator.finalize()
+                self.logger.info(f"Resumen del lote guardado en: {summary_path}")
+            except Exception as e:
+                self.logger.error(f"No se pudo guardar el resumen del lote {batch_id}: {e}")
+            del self.batch_summaries[batch_id]
+
+    def _schedule_thumbnails(self, *paths: Path):
+        """Genera en background las miniaturas de los archivos recién escritos."""
+        if self.thumbnail_cache is None:
+            return
+        for path in paths:
+            self.thumbnail_cache.warm_async(path)
+
     def _extract_batch_id(self, img_path: Path) -> str:
         """Extrae o genera un batch_id desde la ruta del archivo"""
         # Por defecto usar fecha actual
@@ -677,8 +1192,9 @@ class DeterministicPhotoProcessor:
         """6. LIMPIEZA OPCIONAL de archivos procesados exitosamente"""
         self.logger.info("\n6. LIMPIEZA DE ARCHIVOS PROCESADOS")
 
-        for file_path in input_dir.iterdir():
-            if file_path.is_file() and self.processed_index.is_processed(file_path.name):
+        files = iter_folder_files(input_dir) if self.scan_batches else input_dir.iterdir()
+        for file_path in files:
+            if file_path.is_file() and self.processed_index.is_processed(self._index_key(file_path)):
                 try:
                     file_path.unlink()
                     self.logger.info(f"  Limpiado: {file_path.name}")
@@ -696,13 +1212,128 @@ class DeterministicPhotoProcessor:
         self.logger.info(f"  ✓ Exitosos: {self.stats['processed']}")
         self.logger.info(f"  ⚠️  Revisión manual: {self.stats['manual_review']}")
         self.logger.info(f"  ✗ Errores: {self.stats['errors']}")
+        if len(self.batch_stats) > 1:
+            self.logger.info("Por lote:")
+            for batch_id, batch in sorted(self.batch_stats.items()):
+                self.logger.info(
+                    f"  {batch_id}: {batch['total']} encontrados, {batch['skipped']} saltados, "
+                    f"{batch['processed']} exitosos, {batch['manual_review']} revisión manual, "
+                    f"{batch['errors']} errores"
+                )
         self.logger.info("=" * 80)
 
 
+class _BatchScheduler:
+    """
+    Reparte los archivos del escaneo entre lotes concurrentes.
+
+    Cada lote tiene su cola y la consume un solo hilo a la vez (los
+    archivos de un lote se procesan en orden); hasta `workers` lotes
+    avanzan en paralelo. Con workers=1 todo se procesa en el hilo actual.
+    """
+
+    def __init__(self, processor: DeterministicPhotoProcessor, workers: int = 1):
+        self.processor = processor
+        self.new_count = 0
+        self.submitted = 0
+        self._lock = threading.Lock()
+        self._queues: Dict[str, deque] = {}
+        self._active = set()
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") if workers > 1 else None
+
+    def submit(self, img_path: Path, batch_id: str):
+        self.submitted += 1
+        if self._executor is None:
+            self._process(img_path, batch_id)
+            return
+
+        with self._lock:
+            self._queues.setdefault(batch_id, deque()).append(img_path)
+            if batch_id in self._active:
+                return
+            self._active.add(batch_id)
+        self._futures.append(self._executor.submit(self._drain, batch_id))
+
+    def _drain(self, batch_id: str):
+        while True:
+            with self._lock:
+                pending = self._queues[batch_id]
+                if not pending:
+                    self._active.discard(batch_id)
+                    return
+                img_path = pending.popleft()
+            self._process(img_path, batch_id)
+
+    def _process(self, img_path: Path, batch_id: str):
+        processor = self.processor
+        try:
+            if processor._is_new_file(img_path, batch_id):
+                with self._lock:
+                    self.new_count += 1
+                processor._process_single_file(img_path, batch_id)
+            if isinstance(img_path, Path):
+                processor.input_scanner.mark(img_path)
+        except Exception as e:
+            processor.logger.error(f"Error inesperado en {img_path.name}: {e}", exc_info=True)
+
+    def wait(self) -> int:
+        """Espera a que terminen todos los lotes; retorna cuántos archivos nuevos se procesaron."""
+        if self._executor is not None:
+            for future in self._futures:
+                future.result()
+            self._executor.shutdown(wait=True)
+        return self.new_count
+
+
 def main():
     """Punto de entrada principal"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Procesador determinista de fotos"
+    )
+    parser.add_argument(
+        '--batch-id',
+        default="admission_2025_01",
+        help='Identificador del lote (default: admission_2025_01)'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Vigilar input_raw y procesar cada foto apenas llega'
+    )
+    parser.add_argument(
+        '--archive',
+        action='append',
+        default=[],
+        help='Procesar un ZIP/TAR sin extraerlo (se puede repetir)'
+    )
+    parser.add_argument(
+        '--watch-backend',
+        choices=['auto', 'inotify', 'poll'],
+        default=None,
+        help='Detección de archivos nuevos (default: watch.backend de settings.yml)'
+    )
+    parser.add_argument(
+        '--recover',
+        action='store_true',
+        help='Reconciliar processed_index con las salidas antes de procesar'
+    )
+
+    args = parser.parse_args()
+
     processor = DeterministicPhotoProcessor()
-    stats = processor.run(batch_id="admission_2025_01", auto_clean=False)
+    if args.recover:
+        processor.recover(force=True)
+    if args.archive:
+        for archive_path in args.archive:
+            stats = processor.process_archive(archive_path, batch_id=args.batch_id)
+        return stats
+    if args.watch:
+        return processor.watch(batch_id=args.batch_id, backend=args.watch_backend)
+
+    stats = processor.run(batch_id=args.batch_id, auto_clean=False)
     return stats
 
 
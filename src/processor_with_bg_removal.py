@@ -12,10 +12,11 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.deterministic_processor import DeterministicPhotoProcessor
 from src.core.background_remover import BackgroundRemover
+from src.core.blob_store import write_view
 from src.core.format_converter import FormatConverter
-from src.utils.file_utils import ensure_directory
+from src.core.output_layout import get_layout
+from src.utils.file_utils import atomic_path, ensure_directory
 from PIL import Image
-import shutil
 
 
 class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
@@ -24,6 +25,12 @@ class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
     Extiende el procesador determinista para incluir remoción de fondo con IA.
     """
 
+    EXTRA_PATHS = {
+        "working_cropped": "./working/faces_cropped",
+        "prepared": "./prepared",
+        "output_white": "./output_white"
+    }
+
     def __init__(
         self,
         config_path: str = "./config/paths.json",
@@ -59,10 +66,7 @@ class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
             metadata_dir=Path(self.paths["metadata"])
         )
 
-        # Crear carpetas adicionales
-        self.paths["working_cropped"] = "./working/faces_cropped"
-        self.paths["prepared"] = "./prepared"
-        self.paths["output_white"] = "./output_white"
+        # Crear carpetas adicionales (EXTRA_PATHS)
         ensure_directory(self.paths["working_cropped"])
         ensure_directory(self.paths["prepared"])
         ensure_directory(self.paths["output_white"])
@@ -85,6 +89,9 @@ class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
         4. Guardar en prepared
         5. Copiar a output
         6. Actualizar metadata
+
+        Con output_store activado, prepared, output_white y output que
+        tienen el mismo contenido son vistas (hardlinks) de un único blob.
         """
         self.logger.info("  ✓ Aplicando recorte...")
 
@@ -95,24 +102,34 @@ class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
         original_format = img.format or 'JPEG'
         original_extension = img_path.suffix.lower()
 
+        # Subcarpeta del lote (<año>/<lote>): el mismo nombre en dos lotes
+        # concurrentes no comparte archivos intermedios ni salidas
+        subdir = self._batch_subdir(img_path)
+
         # 2. GUARDAR EN WORKING (mantener nombre original)
         working_dir = Path(self.paths["working_cropped"])
-        working_dir.mkdir(parents=True, exist_ok=True)
+        if subdir:
+            working_dir = working_dir / subdir
+        ensure_directory(working_dir)
         working_path = working_dir / img_path.name  # Nombre original
 
-        if img_path.suffix.lower() in ['.jpg', '.jpeg']:
-            cropped_img.save(working_path, 'JPEG', quality=95)
-        else:
-            cropped_img.save(working_path)
+        with atomic_path(working_path) as temp_path:
+            if img_path.suffix.lower() in ['.jpg', '.jpeg']:
+                cropped_img.save(temp_path, 'JPEG', quality=95)
+            else:
+                cropped_img.save(temp_path)
 
         self.logger.info(f"  ✓ Guardado en working: {working_path}")
 
         # 3. ELIMINACIÓN DE FONDO (SI ESTÁ ACTIVADA)
         if self.enable_bg_removal:
             self.logger.info("  🎨 Removiendo fondo con IA...")
+            self._checkpoint_metadata(metadata, batch_id)
 
             prepared_dir = Path(self.paths["prepared"])
-            prepared_dir.mkdir(parents=True, exist_ok=True)
+            if subdir:
+                prepared_dir = prepared_dir / subdir
+            ensure_directory(prepared_dir)
             # Preparada como JPG temporal (fondo blanco)
             prepared_path = prepared_dir / f"{img_path.stem}.jpg"
 
@@ -124,24 +141,29 @@ class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
 
             if success:
                 self.logger.info(f"  ✓ Fondo removido: {prepared_path}")
+                if self.blob_store is not None:
+                    self.blob_store.ingest(prepared_path)
 
                 # Guardar en output_white manteniendo extensión original
-                output_white_dir = Path(self.paths["output_white"])
-                output_white_dir.mkdir(parents=True, exist_ok=True)
-                output_white_path = output_white_dir / f"{img_path.stem}{original_extension}"
+                output_white_path = get_layout(self.paths["output_white"]).path_for(
+                    f"{img_path.stem}{original_extension}", subdir
+                )
+                ensure_directory(output_white_path.parent)
 
                 # Convertir al formato original si es necesario
                 if original_extension == '.jpg' or original_extension == '.jpeg':
                     # Ya es JPG, solo copiar
-                    shutil.copy2(prepared_path, output_white_path)
+                    write_view(self.blob_store, prepared_path, output_white_path)
                 else:
                     # Convertir al formato original
-                    self.format_converter.convert_image(
+                    converted = self.format_converter.convert_image(
                         input_path=prepared_path,
                         output_path=output_white_path,
                         target_format=original_extension,
                         quality=95
                     )
+                    if converted and self.blob_store is not None:
+                        self.blob_store.ingest(output_white_path)
 
                 self.logger.info(f"  ✓ Guardado en output_white: {output_white_path}")
 
@@ -165,16 +187,15 @@ class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
             final_source = working_path
 
         # 4. CONVERTIR AL FORMATO ORIGINAL
-        output_dir = Path(self.paths["output"])
-        output_dir.mkdir(parents=True, exist_ok=True)
         # Usar extensión original del archivo de entrada
-        output_path = output_dir / f"{img_path.stem}{original_extension}"
+        output_path = get_layout(self.paths["output"]).path_for(f"{img_path.stem}{original_extension}", subdir)
+        ensure_directory(output_path.parent)
 
         self.logger.info(f"  🔄 Convirtiendo a formato original: {original_extension}")
 
         # Si la fuente ya está en el formato correcto, solo copiar
         if final_source.suffix.lower() == original_extension:
-            shutil.copy2(final_source, output_path)
+            write_view(self.blob_store, final_source, output_path)
         else:
             # Convertir al formato original
             conversion_success = self.format_converter.convert_image(
@@ -186,7 +207,9 @@ class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
 
             if not conversion_success:
                 self.logger.warning(f"  ⚠ Error en conversión, copiando original")
-                shutil.copy2(final_source, output_path)
+                write_view(self.blob_store, final_source, output_path)
+            elif self.blob_store is not None:
+                self.blob_store.ingest(output_path)
 
         # 5. ACTUALIZAR METADATA
         metadata = self.metadata_manager.update_metadata(
@@ -200,11 +223,14 @@ class PhotoProcessorWithBgRemoval(DeterministicPhotoProcessor):
             )
         )
 
-        # 6. GUARDAR Y REGISTRAR
-        self.metadata_manager.save_metadata(metadata, batch_id)
-        self.processed_index.add_processed(img_path.name, "processed")
-        self.processed_index.save()
-        self.stats["processed"] += 1
+        # 6. GUARDAR METADATA (ÚNICA ESCRITURA) Y REGISTRAR
+        self._finalize_file(img_path, metadata, batch_id, "processed")
+        self._count(batch_id, "processed")
+
+        thumbnail_sources = [output_path]
+        if metadata.get("output_white_path"):
+            thumbnail_sources.append(Path(metadata["output_white_path"]))
+        self._schedule_thumbnails(*thumbnail_sources)
 
         self.logger.info(f"  ✓ Imagen procesada exitosamente → {output_path}")
 
@@ -248,6 +274,17 @@ def main():
         action='store_true',
         help='Eliminar archivos procesados de input_raw'
     )
+    parser.add_argument(
+        '--archive',
+        action='append',
+        default=[],
+        help='Procesar un ZIP/TAR sin extraerlo (se puede repetir)'
+    )
+    parser.add_argument(
+        '--recover',
+        action='store_true',
+        help='Reconciliar processed_index con las salidas antes de procesar'
+    )
 
     args = parser.parse_args()
 
@@ -263,12 +300,18 @@ def main():
         enable_bg_removal=not args.no_bg_removal,
         background_color=color_map[args.bg_color]
     )
+    if args.recover:
+        processor.recover(force=True)
 
     # Ejecutar
-    stats = processor.run(
-        batch_id=args.batch_id,
-        auto_clean=args.auto_clean
-    )
+    if args.archive:
+        for archive_path in args.archive:
+            stats = processor.process_archive(archive_path, batch_id=args.batch_id)
+    else:
+        stats = processor.run(
+            batch_id=args.batch_id,
+            auto_clean=args.auto_clean
+        )
 
     # Resumen
     print("\n" + "=" * 80)
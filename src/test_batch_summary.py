@@ -0,0 +1,61 @@
+"""
+Pruebas de comportamiento del resumen de lote incremental: al retomar un
+lote interrumpido los contadores salen de batch_images.jsonl y un archivo
+reprocesado no se cuenta dos veces.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# Agregar src al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.core.batch_summary import BatchSummaryAggregator
+from src.core.metadata_manager import MetadataManager
+from src.core.metadata_store import JsonTreeStore
+
+
+def result(filename: str, status: str, num_faces: int) -> dict:
+    return {
+        "filename": filename,
+        "status": status,
+        "num_faces": num_faces,
+        "face_detected": num_faces > 0
+    }
+
+
+def test_resume_rebuilds_counters_and_replaces_reprocessed_files(tmp_path):
+    manager = MetadataManager(str(tmp_path), store=JsonTreeStore(str(tmp_path)))
+
+    # Primera ejecución: el último flush cubre a.jpg; b.jpg solo llegó al jsonl
+    aggregator = BatchSummaryAggregator(manager, "b1", flush_every=1000)
+    aggregator.add(result("a.jpg", "processed", 1))
+    aggregator.flush()
+    aggregator.add(result("b.jpg", "manual_review", 0))
+    aggregator._images.flush()
+    with open(aggregator.images_path, 'a', encoding='utf-8') as f:
+        f.write('{"filename": "c.jp')  # Línea cortada por la interrupción
+    aggregator._images.close()
+
+    # Segunda ejecución: b.jpg se reprocesa con otro resultado y llega d.jpg
+    resumed = BatchSummaryAggregator(manager, "b1")
+    assert resumed.total == 2
+    resumed.add(result("b.jpg", "processed", 1))
+    resumed.add(result("d.jpg", "manual_review", 3))
+    summary_path = resumed.finalize()
+
+    with open(summary_path, 'r', encoding='utf-8') as f:
+        summary = json.load(f)
+
+    assert summary["total_images"] == 3
+    assert summary["statistics"] == {"processed": 2, "manual_review": 1, "errors": 0, "pending": 0}
+    assert summary["breakdown"] == {
+        "face_detected_single": 2,
+        "face_detected_multiple": 1,
+        "no_face_detected": 0,
+        "corrupted_files": 0
+    }
+    assert [(image["filename"], image["status"]) for image in summary["images"]] == [
+        ("a.jpg", "processed"), ("b.jpg", "processed"), ("d.jpg", "manual_review")
+    ]
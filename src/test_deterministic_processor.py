@@ -0,0 +1,214 @@
+"""
+Pruebas de comportamiento del procesador determinista: claves del índice
+por carpeta de lote, lotes concurrentes, recuperación tras un corte y
+entrada desde ZIP.
+
+El detector de dlib se reemplaza por uno que siempre encuentra un rostro
+centrado, para que el resultado no dependa del modelo; dlib igual tiene
+que estar instalado para importar el procesador.
+"""
+
+import json
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Agregar src al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+pytest.importorskip("dlib")
+
+from src.core.face_detector import FaceDetector
+from src.deterministic_processor import DeterministicPhotoProcessor
+
+REPO_CONFIG = Path(__file__).resolve().parent.parent / "config"
+
+
+class CenteredFaceDetector(FaceDetector):
+    """Detector de prueba: un rostro centrado de 1/5 del ancho."""
+
+    def __init__(self):
+        pass
+
+    def detect_faces(self, image_array):
+        height, width = image_array.shape[:2]
+        side = width // 5
+        return [(width // 2 - side // 2, height // 2 - side // 2, side, side)]
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Carpeta de trabajo con la configuración del repositorio."""
+    shutil.copytree(REPO_CONFIG, tmp_path / "config")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def make_processor() -> DeterministicPhotoProcessor:
+    processor = DeterministicPhotoProcessor()
+    processor.face_detector = CenteredFaceDetector()
+    return processor
+
+
+def write_photo(path: Path, seed: int = 0):
+    """Foto vertical de 600x800 con ruido (supera MIN_FILE_SIZE)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(60, 200, size=(800, 600, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path, quality=90)
+
+
+def index_keys(workspace: Path) -> set:
+    with open(workspace / "metadata" / "processed_index.json", encoding="utf-8") as f:
+        return set(json.load(f)["processed_files"])
+
+
+def dead_pid() -> int:
+    """PID de un proceso que ya terminó."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_same_name_in_different_batches(workspace):
+    """El mismo nombre en dos lotes y en la raíz son tres archivos distintos."""
+    write_photo(workspace / "input_raw" / "2026" / "b1" / "same.jpg", seed=1)
+    write_photo(workspace / "input_raw" / "2026" / "b2" / "same.jpg", seed=2)
+    write_photo(workspace / "input_raw" / "same.jpg", seed=3)
+
+    stats = make_processor().run(batch_id="root_batch")
+
+    assert stats["processed"] == 3
+    assert index_keys(workspace) == {"2026/b1/same.jpg", "2026/b2/same.jpg", "same.jpg"}
+    for output in ("output/2026/b1/same.jpg", "output/2026/b2/same.jpg", "output/same.jpg"):
+        assert (workspace / output).is_file()
+
+    # Segunda ejecución: nada nuevo
+    stats = make_processor().run(batch_id="root_batch")
+    assert stats["processed"] == 0
+
+
+def test_batches_run_concurrently_and_files_in_order(workspace):
+    """Lotes distintos avanzan en paralelo; los archivos de un lote, de a uno."""
+    for batch in ("b1", "b2", "b3"):
+        for n in range(2):
+            write_photo(workspace / "input_raw" / "2026" / batch / f"{batch}_{n}.jpg", seed=n)
+
+    processor = make_processor()
+    processor.batch_workers = 3
+
+    lock = threading.Lock()
+    active = {"total": 0}
+    peaks = {"total": 0}
+    process_single_file = processor._process_single_file
+
+    def tracked(img_path, batch_id):
+        with lock:
+            for key in ("total", batch_id):
+                active[key] = active.get(key, 0) + 1
+                peaks[key] = max(peaks.get(key, 0), active[key])
+        time.sleep(0.2)
+        try:
+            return process_single_file(img_path, batch_id)
+        finally:
+            with lock:
+                active["total"] -= 1
+                active[batch_id] -= 1
+
+    processor._process_single_file = tracked
+    stats = processor.run()
+
+    assert stats["processed"] == 6
+    assert peaks["total"] >= 2
+    assert all(peaks[batch] == 1 for batch in ("b1", "b2", "b3"))
+    assert len(index_keys(workspace)) == 6
+
+
+def test_recover_reconciles_index_with_outputs(workspace):
+    """Tras un corte: reprocesa salidas truncadas, registra las completas y limpia temporales."""
+    write_photo(workspace / "input_raw" / "2026" / "b1" / "a.jpg", seed=1)
+    write_photo(workspace / "input_raw" / "2026" / "b1" / "b.jpg", seed=2)
+
+    processor = make_processor()
+    processor.run()
+
+    # Salida de a.jpg truncada; b.jpg completa pero fuera del índice
+    truncated = workspace / "output" / "2026" / "b1" / "a.jpg"
+    truncated.write_bytes(truncated.read_bytes()[:500])
+    processor.processed_index.remove_processed("2026/b1/b.jpg", "processed")
+    processor.processed_index.save()
+
+    # Restos del proceso caído: marcador y temporal de escritura
+    pid = dead_pid()
+    marker = workspace / "metadata" / f".processing.{pid}.1.json"
+    marker.write_text("{}", encoding="utf-8")
+    temp_file = workspace / "output" / "2026" / "b1" / f".a.jpg.{pid}.1.tmp.jpg"
+    temp_file.write_bytes(b"partial")
+
+    recovered = make_processor()
+
+    assert index_keys(workspace) == {"2026/b1/b.jpg"}
+    assert not marker.exists()
+    assert not temp_file.exists()
+
+    # a.jpg se vuelve a procesar y su salida queda completa
+    stats = recovered.run()
+    assert stats["processed"] == 1
+    assert index_keys(workspace) == {"2026/b1/a.jpg", "2026/b1/b.jpg"}
+    assert recovered._output_complete(str(truncated))
+
+
+def test_snapshot_does_not_hide_files_removed_from_index(workspace):
+    """Un archivo quitado del índice se reprocesa aunque el total no baje."""
+    write_photo(workspace / "input_raw" / "2026" / "b1" / "a.jpg", seed=1)
+    write_photo(workspace / "input_raw" / "2026" / "b1" / "b.jpg", seed=2)
+    make_processor().run()
+
+    # Se quita a.jpg y se registra otra clave: total_processed no cambia
+    processor = make_processor()
+    processor.processed_index.remove_processed("2026/b1/a.jpg", "processed")
+    processor.processed_index.add_processed("2026/b1/other.jpg", "processed")
+    processor.processed_index.save()
+
+    stats = processor.run()
+
+    assert stats["processed"] == 1
+    assert "2026/b1/a.jpg" in index_keys(workspace)
+
+
+def test_process_archive(workspace):
+    """Los miembros de un ZIP se procesan sin extraerlos; las rutas inseguras se omiten."""
+    write_photo(workspace / "photos" / "a.jpg", seed=1)
+    write_photo(workspace / "photos" / "c.jpg", seed=2)
+    archive_path = workspace / "admision.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.write(workspace / "photos" / "a.jpg", "2026/b1/a.jpg")
+        archive.write(workspace / "photos" / "c.jpg", "c.jpg")
+        # writestr conserva el nombre tal cual (write quita la "/" inicial)
+        data = (workspace / "photos" / "c.jpg").read_bytes()
+        archive.writestr("2026/../../evil.jpg", data)
+        archive.writestr("/tmp/evil/x.jpg", data)
+
+    processor = make_processor()
+    stats = processor.process_archive(archive_path, batch_id="zip_batch")
+
+    assert stats["processed"] == 2
+    assert index_keys(workspace) == {"2026/b1/a.jpg", "c.jpg"}
+    assert (workspace / "output" / "2026" / "b1" / "a.jpg").is_file()
+    assert (workspace / "output" / "c.jpg").is_file()
+    assert not (workspace.parent / "evil.jpg").exists()
+    assert not list((workspace / "input_raw").rglob("*.jpg"))
+
+    input_paths = {
+        metadata["input_path"]
+        for _, _, metadata in processor.metadata_manager.store.iter_records()
+    }
+    assert input_paths == {f"{archive_path}!2026/b1/a.jpg", f"{archive_path}!c.jpg"}
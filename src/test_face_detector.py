@@ -0,0 +1,42 @@
+"""
+Pruebas de comportamiento del detector por hilo: warm_pool() deja un
+detector cargado en cada hilo del pool antes de la primera tarea.
+"""
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+# Agregar src al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+pytest.importorskip("dlib")
+
+from src.core import face_detector
+from src.core.face_detector import PerThreadFaceDetector
+
+
+def test_warm_pool_loads_one_detector_per_worker(monkeypatch):
+    loaded = []
+
+    class CountingDetector:
+        def __init__(self):
+            loaded.append(threading.current_thread().name)
+
+    monkeypatch.setattr(face_detector, "FaceDetector", CountingDetector)
+
+    detectors = PerThreadFaceDetector()
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="warm") as executor:
+        detectors.warm_pool(executor, 3)
+        warmed = len(loaded)
+
+        # Las tareas siguientes ya no cargan modelos
+        for future in [executor.submit(detectors.get) for _ in range(9)]:
+            future.result()
+
+    assert warmed == 4  # Hilo creador + 3 hilos del pool
+    assert len(set(loaded)) == 4
+    assert len(loaded) == 4
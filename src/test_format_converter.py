@@ -0,0 +1,52 @@
+"""
+Pruebas de comportamiento del conversor al formato original: el formato
+de cada foto sale de los metadatos de su propia carpeta de lote, aunque
+el mismo nombre exista en otros lotes.
+"""
+
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+# Agregar src al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.core.format_converter import FormatConverter
+from src.core.metadata_store import JsonTreeStore
+
+
+def put_record(store, year_dir: str, batch_id: str, filename: str, img_format: str, last_updated: str):
+    store.put({
+        "filename": filename,
+        "input_path": f"./input_raw/{year_dir}/{batch_id}/{filename}",
+        "format": img_format,
+        "status": "processed",
+        "last_updated": last_updated,
+        "processing_history": []
+    }, batch_id, 2026)
+
+
+def test_same_stem_in_two_batches_keeps_each_format(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metadata_dir = tmp_path / "metadata"
+    store = JsonTreeStore(str(metadata_dir))
+    # El registro más reciente es el PNG de b2: b1 igual debe quedar en JPEG
+    put_record(store, "2026", "b1", "same.jpg", "JPEG", "2026-01-01T00:00:00Z")
+    put_record(store, "2026", "b2", "same.png", "PNG", "2026-02-01T00:00:00Z")
+    put_record(store, "2026", "b1", "root.bmp", "BMP", "2026-01-01T00:00:00Z")
+
+    input_dir = tmp_path / "output_white"
+    for subdir in ("2026/b1", "2026/b2"):
+        (input_dir / subdir).mkdir(parents=True)
+        Image.new("RGB", (30, 40), (200, 200, 200)).save(input_dir / subdir / "same.jpg")
+    Image.new("RGB", (30, 40), (200, 200, 200)).save(input_dir / "root.jpg")
+
+    output_dir = tmp_path / "output_final"
+    stats = FormatConverter(metadata_dir=metadata_dir).convert_batch(input_dir, output_dir)
+
+    assert stats["converted"] == 3
+    assert (output_dir / "2026" / "b1" / "same.jpg").is_file()
+    assert (output_dir / "2026" / "b2" / "same.png").is_file()
+    # Archivo suelto: se resuelve por stem en todos los lotes
+    assert (output_dir / "root.bmp").is_file()
@@ -0,0 +1,216 @@
+"""
+Pruebas de comportamiento de los backends de metadatos (JSON y SQLite):
+lectura y escritura, búsqueda por stem, consultas paginadas, archivo de
+lotes en segmentos comprimidos y compactación del historial.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# Agregar src al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.core.metadata_index import MetadataIndex
+from src.core.metadata_store import JsonTreeStore, MetadataStore, SQLiteMetadataStore
+
+
+def record(filename: str, batch_id: str, status: str = "processed", img_format: str = "JPG",
+           num_faces: int = 1, last_updated: str = "2026-01-10T00:00:00Z") -> dict:
+    """Metadato con la forma que escribe MetadataManager."""
+    return {
+        "filename": filename,
+        "input_path": f"./input_raw/2026/{batch_id}/{filename}",
+        "format": img_format,
+        "num_faces": num_faces,
+        "status": status,
+        "batch_id": batch_id,
+        "last_updated": last_updated,
+        "processing_history": [
+            {"timestamp": "2026-01-01T00:00:00Z", "action": "initial_scan", "status": "pending"},
+            {"timestamp": "2026-01-01T00:00:01Z", "action": "face_detection", "status": "pending"},
+            {"timestamp": last_updated, "action": "crop", "status": status}
+        ]
+    }
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path) -> MetadataStore:
+    if request.param == "json":
+        return JsonTreeStore(str(tmp_path / "metadata"))
+    return SQLiteMetadataStore(str(tmp_path / "metadata" / "metadata.db"))
+
+
+def test_put_get_and_iter(store):
+    store.put(record("a.jpg", "b1"), "b1", 2026)
+    store.put(record("b.png", "b1", img_format="PNG"), "b1", 2026)
+    store.put(record("a.jpg", "b2", status="manual_review"), "b2", 2026)
+
+    assert store.get("a.jpg", "b1", 2026)["status"] == "processed"
+    assert store.get("a.jpg", "b2", 2026)["status"] == "manual_review"
+    assert store.get("missing.jpg", "b1", 2026) is None
+    assert store.count() == 3
+    assert {(year, batch, m["filename"]) for year, batch, m in store.iter_records(batch_id="b1")} == {
+        (2026, "b1", "a.jpg"), (2026, "b1", "b.png")
+    }
+
+
+def test_put_replaces_record(store):
+    store.put(record("a.jpg", "b1", status="error"), "b1", 2026)
+    store.put(record("a.jpg", "b1", status="processed"), "b1", 2026)
+
+    assert store.count() == 1
+    assert store.get("a.jpg", "b1", 2026)["status"] == "processed"
+
+
+def test_find_latest_by_stem(store):
+    store.put(record("a.jpg", "b1", img_format="JPG", last_updated="2026-01-01T00:00:00Z"), "b1", 2026)
+    store.put(record("a.png", "b2", img_format="PNG", last_updated="2026-02-01T00:00:00Z"), "b2", 2026)
+
+    assert store.find_latest("a")["format"] == "PNG"
+    assert store.find_latest("missing") is None
+
+
+def test_query_filters_and_pages(store):
+    for n in range(7):
+        status = "processed" if n % 2 == 0 else "manual_review"
+        store.put(record(f"f{n}.jpg", "b1", status=status, num_faces=n % 3), "b1", 2026)
+    store.put(record("g.png", "b2", img_format="PNG"), "b2", 2026)
+
+    items, cursor = store.query(status="processed", batch_id="b1")
+    assert sorted(m["filename"] for m in items) == ["f0.jpg", "f2.jpg", "f4.jpg", "f6.jpg"]
+    assert cursor is None
+
+    pages, cursor = [], None
+    while True:
+        items, cursor = store.query(limit=3, cursor=cursor)
+        pages.append([m["filename"] for m in items])
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert len({name for page in pages for name in page}) == 8
+
+    items, _ = store.query(img_format="PNG")
+    assert [m["filename"] for m in items] == ["g.png"]
+    items, _ = store.query(min_faces=2)
+    assert sorted(m["filename"] for m in items) == ["f2.jpg", "f5.jpg"]
+
+    with pytest.raises(ValueError):
+        store.query(color="red")
+
+
+def test_archive_batch_keeps_records_readable(store):
+    for n in range(3):
+        store.put(record(f"f{n}.jpg", "b1"), "b1", 2025)
+    store.put(record("other.jpg", "b2"), "b2", 2025)
+
+    assert store.archive_batch(2025, "b1") == 3
+    assert store.archive_batch(2025, "b1") == 0
+
+    store.refresh()
+    assert store.count() == 4
+    assert store.get("f1.jpg", "b1", 2025)["status"] == "processed"
+    assert store.find_latest("f2")["format"] == "JPG"
+    items, _ = store.query(batch_id="b1")
+    assert len(items) == 3
+
+
+def test_segment_rewrite_commits_on_index_swap(store, monkeypatch):
+    store.put(record("a.jpg", "b1"), "b1", 2025)
+    store.archive_batch(2025, "b1")
+    store.put(record("b.jpg", "b1"), "b1", 2025)
+    store.archive_batch(2025, "b1")
+    assert store.archive.current_segment(2025, "b1") == "records-2.seg"
+
+    # Corte después de escribir el segmento nuevo y antes de reemplazar el índice
+    store.put(record("c.jpg", "b1", status="error"), "b1", 2025)
+    dump = json.dump
+
+    def interrupted(data, f, **kwargs):
+        if isinstance(data, dict) and "records" in data:
+            raise OSError("corte")
+        dump(data, f, **kwargs)
+
+    monkeypatch.setattr(json, "dump", interrupted)
+    with pytest.raises(OSError):
+        store.archive_batch(2025, "b1")
+    monkeypatch.undo()
+
+    store.refresh()
+    assert store.archive.current_segment(2025, "b1") == "records-2.seg"
+    assert store.get("a.jpg", "b1", 2025)["status"] == "processed"
+    assert store.get("b.jpg", "b1", 2025)["status"] == "processed"
+
+    assert store.archive_batch(2025, "b1") == 1
+    store.refresh()
+    assert store.get("c.jpg", "b1", 2025)["status"] == "error"
+    # Quedan la generación vigente y la anterior
+    segment_dir = store.archive.segment_dir(2025, "b1")
+    assert sorted(path.name for path in segment_dir.glob("*.seg")) == ["records-2.seg", "records-3.seg"]
+
+
+def test_compact_history_keeps_archived_batches_archived(store):
+    store.put(record("a.jpg", "b1"), "b1", 2025)
+    store.put(record("b.jpg", "b1"), "b1", 2025)
+    store.archive_batch(2025, "b1")
+    store.put(record("loose.jpg", "b2"), "b2", 2026)
+
+    store.configure_history(encoding="full", compaction=True)
+    assert store.compact_history() == 3
+
+    store.refresh()
+    assert store.archive.segments() == [(2025, "b1")]
+    assert store.archive_batch(2025, "b1") == 0
+    for filename, batch_id, year in (("a.jpg", "b1", 2025), ("loose.jpg", "b2", 2026)):
+        history = store.get(filename, batch_id, year)["processing_history"]
+        # Compactado: se conservan la primera y la última entrada
+        assert history[0]["action"] == "initial_scan"
+        assert history[-1]["action"] == "crop"
+        assert len(history) == 2
+
+
+def test_json_query_follows_disk_changes(tmp_path):
+    store = JsonTreeStore(str(tmp_path / "metadata"))
+    for n in range(3):
+        store.put(record(f"old{n}.jpg", "b1", status="manual_review"), "b1", 2025)
+    store.archive_batch(2025, "b1")
+    store.put(record("a.jpg", "b2", status="manual_review"), "b2", 2026)
+
+    items, _ = store.query(status="manual_review")
+    assert [m["filename"] for m in items] == ["old0.jpg", "old1.jpg", "old2.jpg", "a.jpg"]
+
+    # Cambios posteriores: un JSON suelto reemplaza al archivado, otro se borra
+    store.put(record("old1.jpg", "b1", status="processed"), "b1", 2025)
+    (tmp_path / "metadata" / "2026" / "b2" / "a.json").unlink()
+    store.put(record("b.jpg", "b2", status="manual_review", num_faces=2), "b2", 2026)
+
+    items, cursor = store.query(status="manual_review", limit=2)
+    assert [m["filename"] for m in items] == ["old0.jpg", "old2.jpg"]
+    items, cursor = store.query(status="manual_review", limit=2, cursor=cursor)
+    assert [m["filename"] for m in items] == ["b.jpg"]
+    assert cursor is None
+
+    items, _ = store.query(min_faces=2)
+    assert [m["filename"] for m in items] == ["b.jpg"]
+    items, _ = store.query(status="processed", year=2025)
+    assert [m["filename"] for m in items] == ["old1.jpg"]
+
+
+def test_json_query_reuses_persisted_index(tmp_path, monkeypatch):
+    metadata_dir = tmp_path / "metadata"
+    store = JsonTreeStore(str(metadata_dir))
+    for n in range(5):
+        store.put(record(f"f{n}.jpg", "b1", status="error" if n == 3 else "processed"), "b1", 2026)
+    store.query(status="error")
+    store.close()
+
+    # Otra instancia: los campos salen del caché, sin volver a parsear JSON
+    def fail(path):
+        raise AssertionError(f"{path} se volvió a parsear")
+    monkeypatch.setattr(MetadataIndex, "_read_fields", staticmethod(fail))
+
+    items, cursor = JsonTreeStore(str(metadata_dir)).query(status="error")
+    assert [m["filename"] for m in items] == ["f3.jpg"]
+    assert cursor is None
@@ -0,0 +1,96 @@
+"""
+Pruebas de comportamiento de la recepción de subidas: límites de tamaño
+de los ZIP (comprimido, por miembro y total descomprimido) y nombres
+finales que nunca pisan un archivo existente.
+"""
+
+import io
+import os
+import sys
+import zipfile
+from pathlib import Path
+
+from PIL import Image
+
+# Agregar src al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.webapp.uploads import StreamingUploadReceiver, extract_images_from_zip
+
+BOUNDARY = "photocrop-test"
+
+
+def png_bytes(size: int = 64) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), (120, 80, 40)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def multipart(files: dict) -> bytes:
+    body = b""
+    for name, data in files.items():
+        body += (
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def receive(dest_dir: Path, files: dict, max_archive_bytes: int = 1 << 20) -> StreamingUploadReceiver:
+    receiver = StreamingUploadReceiver(
+        dest_dir, f"multipart/form-data; boundary={BOUNDARY}",
+        max_file_bytes=1 << 20, max_archive_bytes=max_archive_bytes
+    )
+    body = multipart(files)
+    for start in range(0, len(body), 1000):
+        receiver.feed(body[start:start + 1000])
+    receiver.finish()
+    return receiver
+
+
+def test_existing_name_gets_a_new_name(tmp_path):
+    (tmp_path / "foto.png").write_bytes(b"previa")
+
+    receiver = receive(tmp_path, {"foto.png": png_bytes(), "otra.png": png_bytes()})
+
+    assert sorted(path.name for path in receiver.pop_ready()) == ["foto-1.png", "otra.png"]
+    assert (tmp_path / "foto.png").read_bytes() == b"previa"
+    assert not list(tmp_path.glob(".upload-*"))
+
+
+def test_zip_part_over_the_limit_is_rejected(tmp_path):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("a.png", png_bytes() + os.urandom(5000))
+
+    receiver = receive(tmp_path, {"fotos.zip": archive.getvalue()}, max_archive_bytes=1000)
+
+    assert receiver.pop_archives() == []
+    assert receiver.rejected == [{"filename": "fotos.zip", "reason": "ZIP demasiado grande"}]
+    assert not list(tmp_path.iterdir())
+
+
+def test_zip_extraction_limits(tmp_path):
+    zip_path = tmp_path / "fotos.zip"
+    image = png_bytes()
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("a.png", image)
+        # Se comprime a casi nada pero ocupa más que el límite por archivo
+        zf.writestr("bomba.png", image + b"\0" * 200_000)
+        zf.writestr("b.png", image)
+        zf.writestr("c.png", image)
+
+    dest_dir = tmp_path / "input_raw"
+    dest_dir.mkdir()
+    results = list(extract_images_from_zip(
+        zip_path, dest_dir, max_file_bytes=100_000, max_total_bytes=len(image) * 2 + 10
+    ))
+
+    assert [item.name for item in results if isinstance(item, Path)] == ["a.png", "b.png"]
+    assert [item for item in results if isinstance(item, dict)] == [
+        {"filename": "bomba.png", "reason": "Archivo demasiado grande"},
+        {"filename": "fotos.zip", "reason": "Contenido del ZIP demasiado grande"}
+    ]
+    assert sorted(path.name for path in dest_dir.iterdir()) == ["a.png", "b.png"]
+    assert not zip_path.exists()
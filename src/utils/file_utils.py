@@ -2,10 +2,44 @@
 Utilidades para gestión de archivos y rutas.
 """
 
+import errno
+import hashlib
+import os
+import re
 import shutil
 import json
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Set
+
+# Firmas (magic bytes) de los formatos de imagen aceptados
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'BM', '.bmp'),
+    (b'II*\x00', '.tiff'),
+    (b'MM\x00*', '.tiff')
+]
+
+# Bytes necesarios para reconocer cualquiera de las firmas
+IMAGE_SIGNATURE_LENGTH = 8
+
+try:
+    import fcntl
+    FICLONE_AVAILABLE = True
+except ImportError:
+    FICLONE_AVAILABLE = False
+
+# ioctl FICLONE de Linux (_IOW(0x94, 9, int)): clon copy-on-write (btrfs, XFS)
+FICLONE = 0x40049409
+
+# Estrategias de link_or_copy, de la más barata a la más cara
+LINK_STRATEGIES = ("hardlink", "reflink", "copy_file_range", "copy")
+
+# Temporales de escritura atómica: .<nombre>.<pid>.<hilo>.tmp<extensión>
+TEMP_PATTERN = re.compile(r"^\..+\.(\d+)\.(\d+)\.tmp(\.[^.]*)?$")
 
 
 def load_config(config_path: str = "./config/settings.yml") -> Dict[str, Any]:
@@ -65,6 +99,31 @@ def load_paths_config(config_path: str = "./config/paths.json") -> Dict[str, str
         }
 
 
+def detect_image_type(header: bytes) -> Optional[str]:
+    """
+    Identifica el formato de imagen a partir de los primeros bytes.
+
+    Args:
+        header: Primeros bytes del archivo (al menos IMAGE_SIGNATURE_LENGTH)
+
+    Returns:
+        Extensión del formato detectado (ej: '.jpg') o None si no es imagen
+    """
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    return None
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 del contenido de un archivo (leído por bloques)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def list_images_in_directory(directory: Path, extensions: set = None) -> List[Path]:
     """
     Lista todas las imágenes en un directorio.
@@ -102,7 +161,7 @@ def move_file(source: Path, destination: Path, create_dirs: bool = True) -> bool
     """
     try:
         if create_dirs:
-            destination.parent.mkdir(parents=True, exist_ok=True)
+            ensure_directory(destination.parent)
         shutil.move(str(source), str(destination))
         return True
     except Exception as e:
@@ -123,23 +182,261 @@ def copy_file(source: Path, destination: Path, create_dirs: bool = True) -> bool
     """
     try:
         if create_dirs:
-            destination.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(str(source), str(destination))
+            ensure_directory(destination.parent)
+        with atomic_path(destination) as temp_path:
+            shutil.copy2(str(source), str(temp_path))
         return True
     except Exception as e:
         return False
 
 
+def _reflink(source: Path, destination: Path):
+    """Clon copy-on-write con FICLONE (falla con OSError si el FS no lo soporta)."""
+    if not FICLONE_AVAILABLE:
+        raise OSError(errno.EOPNOTSUPP, "FICLONE no disponible")
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy_file_range(source: Path, destination: Path):
+    """Copia dentro del kernel (NFS 4.2 y SMB la resuelven del lado del servidor)."""
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.EOPNOTSUPP, "copy_file_range no disponible")
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+            if copied == 0:
+                raise OSError(errno.EIO, "copy_file_range no avanzó")
+            remaining -= copied
+
+
+def link_or_copy(source: Path, destination: Path, strategy: str = "auto") -> str:
+    """
+    Replica un archivo sin duplicar datos cuando el sistema de archivos lo permite.
+
+    Con "auto" intenta en orden: hardlink, reflink (FICLONE),
+    copy_file_range y copia completa (shutil.copy2). El destino se arma
+    con un nombre temporal y se reemplaza con os.replace, así que nunca
+    queda a medias ni se modifica un hardlink previo en su lugar.
+
+    Un hardlink comparte el inodo con el original: borrar el original
+    (auto_clean) no afecta la réplica, pero editarlo sin reemplazarlo sí.
+    Con strategy="reflink" se omite el hardlink y la réplica es
+    independiente del original.
+
+    Args:
+        source: Archivo original
+        destination: Ruta destino (la carpeta debe existir)
+        strategy: "auto", "reflink" (reflink → copy_file_range → copia) o "copy"
+
+    Returns:
+        Estrategia usada: "hardlink", "reflink", "copy_file_range" o "copy"
+    """
+    source, destination = Path(source), Path(destination)
+    temp_path = temp_path_for(destination)
+
+    if strategy == "auto":
+        candidates = LINK_STRATEGIES
+    elif strategy == "reflink":
+        candidates = LINK_STRATEGIES[1:]
+    elif strategy == "copy":
+        candidates = ("copy",)
+    else:
+        raise ValueError(f"Estrategia de copia desconocida: {strategy}")
+
+    for candidate in candidates:
+        try:
+            if candidate == "hardlink":
+                if destination.exists() and os.path.samefile(source, destination):
+                    return candidate
+                os.link(source, temp_path)
+            elif candidate == "reflink":
+                _reflink(source, temp_path)
+                shutil.copystat(source, temp_path)
+            elif candidate == "copy_file_range":
+                _copy_file_range(source, temp_path)
+                shutil.copystat(source, temp_path)
+            else:
+                shutil.copy2(source, temp_path)
+            os.replace(temp_path, destination)
+            # rename() entre dos enlaces del mismo inodo no hace nada
+            temp_path.unlink(missing_ok=True)
+            return candidate
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+            if candidate == "copy" or not source.exists():
+                raise
+
+    raise OSError(errno.EIO, f"No se pudo replicar {source}")
+
+
+def temp_path_for(path: Path) -> Path:
+    """
+    Temporal oculto junto al destino (mismo directorio, mismo sistema de
+    archivos). Conserva la extensión para que PIL deduzca el formato.
+    """
+    path = Path(path)
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp{path.suffix}")
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """
+    Escritura atómica: entrega una ruta temporal y, si el bloque termina
+    sin error, la renombra sobre el destino con os.replace. Un lector (o
+    una ejecución interrumpida) nunca ve el archivo a medias, y el rename
+    crea un inodo nuevo, así que un hardlink previo no se modifica.
+
+    Ejemplo:
+        with atomic_path(output_path) as temp_path:
+            img.save(temp_path, 'JPEG', quality=95)
+    """
+    temp_path = temp_path_for(path)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def write_json_atomic(path: Path, data: Any, indent: Optional[int] = 2):
+    """Escribe un JSON con atomic_path."""
+    with atomic_path(path) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+
+
+def pid_alive(pid: int) -> bool:
+    """True si existe un proceso con ese pid."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_temp_files(directory: Path) -> int:
+    """
+    Elimina los temporales de escritura atómica que dejó un proceso que
+    ya no existe (ejecución interrumpida). Los de procesos vivos se respetan.
+
+    Returns:
+        Temporales eliminados
+    """
+    removed = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            match = TEMP_PATTERN.match(name)
+            if match and int(match.group(1)) != os.getpid() and not pid_alive(int(match.group(1))):
+                try:
+                    os.unlink(os.path.join(dirpath, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+
+# Directorios que este proceso ya creó o comprobó (rutas absolutas)
+_known_directories: Set[str] = set()
+_known_directories_lock = threading.Lock()
+
+# Marca compartida entre procesos: announce_removed_directories() la
+# reescribe y cada proceso descarta su caché cuando ve que cambió
+DIRECTORY_GENERATION_PATH = Path("./metadata/.directory_generation")
+DIRECTORY_GENERATION_CHECK_SECONDS = 1.0
+_directory_generation: Optional[tuple] = None
+_next_generation_check = 0.0
+
+
+def _check_directory_generation():
+    """Descarta el caché si otro proceso anunció carpetas eliminadas (un stat por segundo como máximo)."""
+    global _directory_generation, _next_generation_check
+
+    now = time.monotonic()
+    if now < _next_generation_check:
+        return
+
+    try:
+        st = os.stat(DIRECTORY_GENERATION_PATH)
+        generation = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except OSError:
+        generation = None
+
+    with _known_directories_lock:
+        _next_generation_check = now + DIRECTORY_GENERATION_CHECK_SECONDS
+        if generation != _directory_generation:
+            _known_directories.clear()
+            _directory_generation = generation
+
+
 def ensure_directory(directory) -> None:
     """
     Asegura que un directorio existe, creándolo si es necesario.
 
+    El resultado se recuerda por proceso junto con sus carpetas padre: las
+    llamadas siguientes para la misma ruta (ej: manual_review/<año>/<lote>
+    por cada foto) no hacen ninguna llamada al sistema de archivos, que en
+    un disco de red es un viaje de ida y vuelta. Quien elimine carpetas
+    debe avisarlo con forget_directories() (este proceso) o con
+    announce_removed_directories() (todos los procesos).
+
     Args:
         directory: Ruta del directorio (Path o str)
     """
-    if isinstance(directory, str):
-        directory = Path(directory)
-    directory.mkdir(parents=True, exist_ok=True)
+    _check_directory_generation()
+
+    key = os.path.abspath(directory)
+    if key in _known_directories:
+        return
+
+    os.makedirs(key, exist_ok=True)
+
+    with _known_directories_lock:
+        while key not in _known_directories:
+            _known_directories.add(key)
+            parent = os.path.dirname(key)
+            if parent == key:
+                break
+            key = parent
+
+
+def forget_directories(directory=None) -> None:
+    """
+    Descarta del caché de ensure_directory una carpeta eliminada y todo lo
+    que contenía (o el caché completo si no se indica carpeta).
+
+    Args:
+        directory: Ruta eliminada (Path o str); None = todas
+    """
+    with _known_directories_lock:
+        if directory is None:
+            _known_directories.clear()
+            return
+        key = os.path.abspath(directory)
+        prefix = key.rstrip(os.sep) + os.sep
+        _known_directories.difference_update(
+            [known for known in _known_directories if known == key or known.startswith(prefix)]
+        )
+
+
+def announce_removed_directories() -> None:
+    """
+    Avisa a todos los procesos (dashboard, procesadores, vigilancia) que se
+    eliminaron carpetas: reescribe DIRECTORY_GENERATION_PATH y cada proceso
+    vacía su caché de ensure_directory en su próxima llamada (a más tardar
+    en DIRECTORY_GENERATION_CHECK_SECONDS).
+    """
+    forget_directories()
+    try:
+        DIRECTORY_GENERATION_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_path(DIRECTORY_GENERATION_PATH) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(f"{os.getpid()} {time.time_ns()}\n")
+    except OSError:
+        pass  # Sin la marca, los demás procesos se recuperan al fallar la escritura
 
 
 def get_batch_id_from_path(filepath: Path, input_base: Path) -> str:
@@ -156,7 +453,7 @@ def get_batch_id_from_path(filepath: Path, input_base: Path) -> str:
     try:
         relative = filepath.relative_to(input_base)
         parts = relative.parts
-        if len(parts) >= 2:
+        if len(parts) >= 3:
             # Estructura: year/batch/file.jpg
             year = parts[0]
             batch = parts[1]
@@ -0,0 +1,106 @@
+"""
+Ejecución en paralelo de lotes de imágenes.
+Un pool de hilos compartido y acotado para las APIs por lotes (conversión,
+remoción de fondo). La codificación/decodificación de Pillow libera el GIL,
+así que los hilos aprovechan todos los núcleos sin el costo de procesos.
+"""
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from src.utils.file_utils import load_config
+
+
+class BatchResult(NamedTuple):
+    """Resultado de un elemento del lote (error es None si no falló)."""
+    item: Any
+    result: Any
+    error: Optional[BaseException]
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def default_workers() -> int:
+    """Hilos del pool compartido (settings.yml: parallel.max_workers, 0 = núcleos)."""
+    try:
+        configured = int((load_config().get("parallel") or {}).get("max_workers", 0))
+    except Exception:
+        configured = 0
+    return configured if configured > 0 else (os.cpu_count() or 1)
+
+
+def get_batch_executor() -> ThreadPoolExecutor:
+    """Retorna el pool compartido (se crea la primera vez que se usa)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=default_workers(),
+                thread_name_prefix="batch"
+            )
+        return _executor
+
+
+def shutdown_batch_executor(wait: bool = True):
+    """Detiene el pool compartido (se vuelve a crear si se usa de nuevo)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _call(func: Callable[[Any], Any], item: Any) -> BatchResult:
+    """Ejecuta func aislando el error del elemento."""
+    try:
+        return BatchResult(item, func(item), None)
+    except Exception as e:
+        return BatchResult(item, None, e)
+
+
+def map_ordered(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    workers: Optional[int] = None
+) -> Iterator[BatchResult]:
+    """
+    Aplica func a cada elemento en el pool compartido.
+
+    Los resultados salen en el mismo orden que items. Como máximo hay
+    `workers` elementos en vuelo, así que items puede ser un generador
+    largo sin cargarlo completo en memoria. Un error en un elemento no
+    detiene el lote: se retorna en BatchResult.error.
+
+    No llamar desde una tarea que ya corre en el pool compartido (se
+    podría quedar sin hilos libres).
+
+    Args:
+        func: Función a aplicar (recibe un elemento)
+        items: Elementos a procesar
+        workers: Elementos en paralelo (None = tamaño del pool, 1 = en serie)
+
+    Yields:
+        BatchResult(item, result, error) en el orden de entrada
+    """
+    limit = max(1, workers or default_workers())
+
+    if limit == 1:
+        for item in items:
+            yield _call(func, item)
+        return
+
+    executor = get_batch_executor()
+    in_flight = deque()
+
+    for item in items:
+        if len(in_flight) >= limit:
+            yield in_flight.popleft().result()
+        in_flight.append(executor.submit(_call, func, item))
+
+    while in_flight:
+        yield in_flight.popleft().result()
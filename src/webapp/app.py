@@ -3,13 +3,16 @@ Aplicación Web para PhotoCrop - Dashboard de Control
 FastAPI + HTML simple para gestión de procesamiento de fotos
 """
 
-from fastapi import FastAPI, Request, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, BackgroundTasks, UploadFile, File
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
+import asyncio
 import json
 import sys
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -19,24 +22,142 @@ sys.path.insert(0, str(ROOT_DIR))
 
 # Imports del sistema PhotoCrop
 from src.processor_with_bg_removal import PhotoProcessorWithBgRemoval
+from src.core.deliverable_export import MEDIA_TYPES, DeliverableExporter
 from src.core.format_converter import convert_to_original_format
+from src.core.ingest_queue import IngestQueue
+from src.core.job_store import JobStore, Lease
+from src.core.metadata_store import open_metadata_store
+from src.core.output_layout import get_layout, iter_folder_files
+from src.core.thumbnails import ThumbnailCache
+from src.utils.file_utils import ensure_directory, load_config, load_paths_config
+from src.utils.parallel import shutdown_batch_executor
+from src.webapp.uploads import StreamingUploadReceiver, extract_images_from_zip
+from src.webapp.file_serving import etag_matches, iter_manifest, serve_file
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Al iniciar precarga los modelos del servicio de recorte; al terminar
+    detiene los pools de hilos (recorte, miniaturas, lotes) y la cola de
+    ingesta.
+    """
+    try:
+        await asyncio.to_thread(get_crop_service)
+    except Exception as e:
+        print(f"⚠ No se pudo precargar el servicio de recorte: {e}")
+
+    yield
+
+    if crop_service is not None:
+        crop_service.shutdown(wait=False)
+    ingest_queue.stop(wait=False)
+    thumbnail_cache.shutdown(wait=False)
+    shutdown_batch_executor(wait=False)
+
 
 # Configuración de FastAPI
-app = FastAPI(title="PhotoCrop Dashboard", version="1.0")
+app = FastAPI(title="PhotoCrop Dashboard", version="1.0", lifespan=lifespan)
 
 # Configuración de templates y archivos estáticos
 BASE_DIR = Path(__file__).parent
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 
-# Estado global del procesamiento
-processing_status = {
-    "is_processing": False,
-    "last_run": None,
-    "last_stats": None,
-    "error": None
+# Estado del procesamiento compartido entre workers (SQLite WAL)
+job_store = JobStore(load_paths_config().get("job_store", "./metadata/jobs.db"))
+PIPELINE_LEASE = "pipeline"
+PIPELINE_LEASE_TTL = 60.0
+
+# Backend de metadatos (árbol JSON o SQLite, según settings.yml)
+metadata_store = open_metadata_store(load_paths_config().get("metadata", "./metadata"))
+
+# Servicio de recorte en memoria (se crea una vez con modelos precargados)
+crop_service = None
+crop_service_lock = threading.Lock()
+crop_api_config = load_config().get("crop_api", {})
+
+
+def get_crop_service():
+    """Retorna el servicio de recorte, creándolo la primera vez."""
+    global crop_service
+
+    if crop_service is None:
+        with crop_service_lock:
+            if crop_service is None:
+                from src.core.crop_service import CropService
+                crop_service = CropService(
+                    enable_bg_removal=crop_api_config.get("remove_background", True),
+                    max_workers=crop_api_config.get("max_workers", 2),
+                    max_pending=crop_api_config.get("max_pending", 8)
+                )
+
+    return crop_service
+
+
+upload_config = load_config().get("upload", {})
+thumbnail_config = load_config().get("thumbnails", {})
+conversion_config = load_config().get("conversion", {})
+background_config = load_config().get("background_removal", {})
+
+# Carpetas de imágenes visibles desde el dashboard
+IMAGE_FOLDERS = {
+    "output": "./output",
+    "output_white": "./output_white",
+    "output_final": "./output_final",
+    "manual_review": "./manual_review",
+    "errors": "./errors",
+    "input_raw": "./input_raw"
 }
 
+# Carpetas de resultados descargables desde /api/files
+OUTPUT_FOLDERS = {
+    key: IMAGE_FOLDERS[key] for key in ("output", "output_white", "output_final")
+}
+
+# Miniaturas para vista previa (generadas en background tras cada foto)
+thumbnail_cache = ThumbnailCache(
+    cache_dir=thumbnail_config.get("cache_dir", "./working/thumbnails"),
+    max_bytes=thumbnail_config.get("max_cache_mb", 200) * 1024 * 1024,
+    size=(thumbnail_config.get("width", 192), thumbnail_config.get("height", 256)),
+    image_format=thumbnail_config.get("format", "webp")
+)
+
+
+def convert_outputs_to_original_format() -> Dict:
+    """
+    Convierte output_white/ a output_final/ con el formato original.
+    Incremental: solo convierte las fotos nuevas o modificadas.
+    """
+    return convert_to_original_format(
+        input_dir="./output_white",
+        output_dir="./output_final",
+        metadata_dir="./metadata",
+        quality=95,
+        workers=conversion_config.get("workers", 4)
+    )
+
+
+def create_processor() -> PhotoProcessorWithBgRemoval:
+    """Crea el procesador con eliminación de fondo (fondo blanco)."""
+    processor = PhotoProcessorWithBgRemoval(
+        enable_bg_removal=True,
+        background_color=(255, 255, 255, 255)  # Blanco
+    )
+    processor.thumbnail_cache = thumbnail_cache
+    return processor
+
+
+# Cola de ingesta para subidas: procesa cada archivo apenas llega.
+# Usa el mismo lease que /api/process: un solo proceso escribe
+# processed_index.json a la vez, aunque haya varios workers.
+ingest_queue = IngestQueue(
+    processor_factory=create_processor,
+    maxsize=upload_config.get("queue_size", 64),
+    workers=upload_config.get("workers", 1),
+    on_idle=convert_outputs_to_original_format,
+    lock=job_store.lease(PIPELINE_LEASE, PIPELINE_LEASE_TTL)
+)
+
 
 def get_folder_stats() -> Dict:
     """Obtiene estadísticas de las carpetas del sistema."""
@@ -63,14 +184,11 @@ def get_folder_stats() -> Dict:
     for key, folder in folders.items():
         if folder.exists():
             if key == "metadata":
-                # Contar archivos JSON en metadata
-                stats[key] = len(list(folder.rglob("*.json")))
+                # Contar registros en el backend de metadatos
+                stats[key] = metadata_store.count()
             else:
-                # Contar imágenes en otras carpetas
-                count = 0
-                for ext in ['.jpg', '.jpeg', '.png', '.bmp']:
-                    count += len(list(folder.rglob(f"*{ext}")))
-                stats[key] = count
+                # Contar imágenes en otras carpetas (un solo recorrido)
+                stats[key] = sum(1 for _ in iter_folder_files(folder, ['.jpg', '.jpeg', '.png', '.bmp']))
 
     return stats
 
@@ -129,30 +247,62 @@ def get_images_in_folder(folder: str, limit: int = 20) -> List[Dict]:
         return images
 
     extensions = ['.jpg', '.jpeg', '.png', '.bmp']
-    count = 0
-
-    for ext in extensions:
-        for img_path in folder_path.rglob(f"*{ext}"):
-            if count >= limit:
-                break
-
-            images.append({
-                "name": img_path.name,
-                "path": str(img_path.relative_to(Path("."))),
-                "size": img_path.stat().st_size,
-                "modified": datetime.fromtimestamp(
-                    img_path.stat().st_mtime
-                ).strftime("%Y-%m-%d %H:%M:%S")
-            })
-            count += 1
+
+    for img_path in iter_folder_files(folder_path, extensions):
+        if len(images) >= limit:
+            break
+
+        st = img_path.stat()
+        images.append({
+            "name": img_path.name,
+            "path": str(img_path.relative_to(Path("."))),
+            "relative_path": img_path.relative_to(folder_path).as_posix(),
+            "size": st.st_size,
+            "modified": datetime.fromtimestamp(
+                st.st_mtime
+            ).strftime("%Y-%m-%d %H:%M:%S")
+        })
 
     return sorted(images, key=lambda x: x["modified"], reverse=True)
 
 
+def resolve_folder_file(
+    folder: str,
+    relative_path: str,
+    folders: Dict[str, str] = IMAGE_FOLDERS
+) -> Optional[Path]:
+    """
+    Resuelve un archivo dentro de una carpeta permitida.
+
+    Si la carpeta está distribuida por shards, el archivo se busca también
+    en su shard (ej: foto.jpg → ab/cd/foto.jpg, 2026/lote/foto.jpg →
+    2026/lote/ab/cd/foto.jpg).
+
+    Returns:
+        Path del archivo, o None si la carpeta no es válida, el archivo no
+        existe o la ruta intenta salir de la carpeta (ej: '../')
+    """
+    if folder not in folders:
+        return None
+
+    root = Path(folders[folder]).resolve()
+    target = (root / relative_path).resolve()
+
+    if not target.is_file():
+        subdir, _, name = relative_path.rpartition('/')
+        target = (get_layout(folders[folder]).resolve(name, subdir or None) or target).resolve()
+
+    if not target.is_relative_to(root) or not target.is_file():
+        return None
+
+    return target
+
+
 def run_pipeline(batch_id: Optional[str] = None) -> Dict:
     """
     Ejecuta el pipeline completo de procesamiento.
-    Esta función es llamada desde el endpoint /process
+    Esta función es llamada desde el endpoint /process, con el lease
+    del pipeline ya tomado.
     """
     try:
         # Configurar batch_id si no se proporciona
@@ -160,10 +310,7 @@ def run_pipeline(batch_id: Optional[str] = None) -> Dict:
             batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
         # Inicializar procesador con eliminación de fondo
-        processor = PhotoProcessorWithBgRemoval(
-            enable_bg_removal=True,
-            background_color=(255, 255, 255, 255)  # Blanco
-        )
+        processor = create_processor()
 
         # Ejecutar procesamiento
         stats = processor.run(
@@ -173,13 +320,7 @@ def run_pipeline(batch_id: Optional[str] = None) -> Dict:
 
         # Convertir fotos de output_white/ a output_final/ con formato original
         try:
-            conversion_stats = convert_to_original_format(
-                input_dir="./output_white",
-                output_dir="./output_final",
-                metadata_dir="./metadata",
-                quality=95
-            )
-            stats["conversion"] = conversion_stats
+            stats["conversion"] = convert_outputs_to_original_format()
         except Exception as e:
             stats["conversion_error"] = str(e)
 
@@ -198,26 +339,43 @@ def run_pipeline(batch_id: Optional[str] = None) -> Dict:
         }
 
 
-async def process_photos_background(batch_id: Optional[str] = None):
-    """Ejecuta el procesamiento en background."""
-    global processing_status
+def enqueue_zip_members(zip_path: Path, batch_id: str, accepted: List[str], rejected: List[Dict]):
+    """Extrae las imágenes de un ZIP subido y encola cada una al terminar de escribirla."""
+    for item in extract_images_from_zip(
+        zip_path,
+        Path("./input_raw"),
+        max_file_bytes=upload_config.get("max_file_mb", 50) * 1024 * 1024,
+        max_total_bytes=upload_config.get("max_extract_mb", 4096) * 1024 * 1024
+    ):
+        if isinstance(item, Path):
+            ingest_queue.put(item, batch_id)
+            accepted.append(item.name)
+        else:
+            rejected.append(item)
 
-    processing_status["is_processing"] = True
-    processing_status["error"] = None
+
+def process_photos_background(lease: Lease, batch_id: Optional[str] = None):
+    """
+    Ejecuta el procesamiento en background (en el threadpool).
+    Registra el trabajo en el job store y libera el lease al terminar.
+    """
+    job_id = job_store.start_job(batch_id, lease.owner)
+    stats = None
+    error = None
 
     try:
         result = run_pipeline(batch_id)
-        processing_status["last_run"] = result["timestamp"]
-        processing_status["last_stats"] = result.get("stats")
+        stats = result.get("stats")
 
         if not result["success"]:
-            processing_status["error"] = result.get("error")
+            error = result.get("error")
 
     except Exception as e:
-        processing_status["error"] = str(e)
+        error = str(e)
 
     finally:
-        processing_status["is_processing"] = False
+        job_store.finish_job(job_id, stats=stats, error=error)
+        lease.release()
 
 
 # ============================================================================
@@ -242,7 +400,8 @@ async def get_stats():
     return JSONResponse({
         "folders": folder_stats,
         "processed": processed_stats,
-        "processing": processing_status,
+        "processing": job_store.get_status(PIPELINE_LEASE),
+        "ingest": ingest_queue.stats(),
         "timestamp": datetime.now().isoformat()
     })
 
@@ -250,14 +409,16 @@ async def get_stats():
 @app.post("/api/process")
 async def process_photos(background_tasks: BackgroundTasks, batch_id: Optional[str] = None):
     """Inicia el procesamiento de fotos en background."""
-    if processing_status["is_processing"]:
+    # Lease atómico: exactamente un runner entre todos los workers
+    lease = job_store.lease(PIPELINE_LEASE, PIPELINE_LEASE_TTL)
+    if not lease.try_acquire():
         return JSONResponse({
             "success": False,
             "message": "Ya hay un procesamiento en curso"
         }, status_code=409)
 
     # Ejecutar en background
-    background_tasks.add_task(process_photos_background, batch_id)
+    background_tasks.add_task(process_photos_background, lease, batch_id)
 
     return JSONResponse({
         "success": True,
@@ -266,15 +427,98 @@ async def process_photos(background_tasks: BackgroundTasks, batch_id: Optional[s
     })
 
 
+@app.post("/api/upload")
+async def upload_photos(request: Request, batch_id: Optional[str] = None):
+    """
+    Sube fotos (o ZIPs con fotos) a input_raw/ por streaming.
+    Cada archivo se encola para procesar apenas termina de llegar; si la
+    cola está llena la lectura de la subida se pausa (contrapresión).
+    """
+    if batch_id is None:
+        batch_id = f"upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    input_dir = Path("./input_raw")
+    ensure_directory(input_dir)
+
+    try:
+        receiver = StreamingUploadReceiver(
+            dest_dir=input_dir,
+            content_type=request.headers.get("content-type", ""),
+            max_file_bytes=upload_config.get("max_file_mb", 50) * 1024 * 1024,
+            max_archive_bytes=upload_config.get("max_archive_mb", 1024) * 1024 * 1024
+        )
+    except ValueError as e:
+        return JSONResponse({
+            "success": False,
+            "message": str(e)
+        }, status_code=400)
+
+    accepted: List[str] = []
+
+    async def enqueue_ready():
+        for img_path in receiver.pop_ready():
+            await asyncio.to_thread(ingest_queue.put, img_path, batch_id)
+            accepted.append(img_path.name)
+
+        for zip_path in receiver.pop_archives():
+            await asyncio.to_thread(
+                enqueue_zip_members, zip_path, batch_id, accepted, receiver.rejected
+            )
+
+    # El parser escribe a disco: fuera del event loop
+    try:
+        async for chunk in request.stream():
+            await asyncio.to_thread(receiver.feed, chunk)
+            await enqueue_ready()
+
+        await asyncio.to_thread(receiver.finish)
+        await enqueue_ready()
+
+    except Exception as e:
+        await asyncio.to_thread(receiver.finish)
+        return JSONResponse({
+            "success": False,
+            "message": f"Subida interrumpida: {e}",
+            "batch_id": batch_id,
+            "accepted": accepted,
+            "rejected": receiver.rejected
+        }, status_code=400)
+
+    return JSONResponse({
+        "success": True,
+        "message": f"{len(accepted)} foto(s) encoladas para procesar",
+        "batch_id": batch_id,
+        "accepted": accepted,
+        "rejected": receiver.rejected,
+        "queue": ingest_queue.stats(),
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.get("/api/upload/queue")
+async def upload_queue_status():
+    """Estado de la cola de ingesta de subidas."""
+    return JSONResponse(ingest_queue.stats())
+
+
 @app.post("/api/remove-background")
 async def remove_background_endpoint():
     """Quita el fondo de las fotos en output/ y las guarda en output_white/."""
+    # Mismo lease que /api/process: no escribir output_white/ mientras
+    # otro worker procesa o convierte
+    lease = job_store.lease(PIPELINE_LEASE, PIPELINE_LEASE_TTL)
+    if not lease.try_acquire():
+        return JSONResponse({
+            "success": False,
+            "message": "Ya hay un procesamiento en curso"
+        }, status_code=409)
+
     try:
         from src.core.background_remover import BackgroundRemover
 
         output_dir = Path("./output")
         output_white_dir = Path("./output_white")
-        output_white_dir.mkdir(parents=True, exist_ok=True)
+        ensure_directory(output_white_dir)
 
         if not output_dir.exists() or not any(output_dir.iterdir()):
             return JSONResponse({
@@ -283,23 +527,21 @@ async def remove_background_endpoint():
             })
 
         remover = BackgroundRemover()
-        processed = 0
-
-        for img_file in output_dir.glob("*"):
-            if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                output_path = output_white_dir / f"{img_file.stem}.jpg"
-                success = remover.remove_background(
-                    input_path=img_file,
-                    output_path=output_path,
-                    background_color=(255, 255, 255, 255)
-                )
-                if success:
-                    processed += 1
+        stats = await asyncio.to_thread(
+            remover.process_batch,
+            output_dir,
+            output_white_dir,
+            (255, 255, 255, 255),
+            ['.jpg', '.jpeg', '.png'],
+            background_config.get("workers")
+        )
+        processed = stats['success']
 
         return JSONResponse({
             "success": True,
             "message": f"Fondo removido de {processed} fotos",
             "processed": processed,
+            "failed": stats['failed'],
             "timestamp": datetime.now().isoformat()
         })
 
@@ -308,14 +550,22 @@ async def remove_background_endpoint():
             "success": False,
             "message": str(e)
         }, status_code=500)
+    finally:
+        lease.release()
 
 
 @app.post("/api/convert-format")
 async def convert_format_endpoint():
     """Convierte fotos de output_white/ al formato original en output_final/."""
-    try:
-        from src.core.format_converter import convert_to_original_format
+    # Mismo lease que /api/process (la ingesta también convierte al vaciarse)
+    lease = job_store.lease(PIPELINE_LEASE, PIPELINE_LEASE_TTL)
+    if not lease.try_acquire():
+        return JSONResponse({
+            "success": False,
+            "message": "Ya hay un procesamiento en curso"
+        }, status_code=409)
 
+    try:
         output_white_dir = Path("./output_white")
 
         if not output_white_dir.exists() or not any(output_white_dir.iterdir()):
@@ -324,17 +574,16 @@ async def convert_format_endpoint():
                 "message": "No hay fotos en output_white/ para convertir"
             })
 
-        stats = convert_to_original_format(
-            input_dir="./output_white",
-            output_dir="./output_final",
-            metadata_dir="./metadata",
-            quality=95
-        )
+        stats = await asyncio.to_thread(convert_outputs_to_original_format)
 
         return JSONResponse({
             "success": True,
-            "message": f"Convertidas {stats['converted']} fotos al formato original",
+            "message": (
+                f"Convertidas {stats['converted']} fotos al formato original "
+                f"({stats['skipped']} sin cambios)"
+            ),
             "converted": stats['converted'],
+            "skipped": stats['skipped'],
             "failed": stats['failed'],
             "timestamp": datetime.now().isoformat()
         })
@@ -344,6 +593,8 @@ async def convert_format_endpoint():
             "success": False,
             "message": str(e)
         }, status_code=500)
+    finally:
+        lease.release()
 
 
 @app.get("/api/logs")
@@ -360,21 +611,12 @@ async def get_logs(lines: int = 50):
 @app.get("/api/images/{folder}")
 async def get_images(folder: str, limit: int = 20):
     """Lista imágenes en una carpeta específica."""
-    folder_map = {
-        "output": "./output",
-        "output_white": "./output_white",
-        "output_final": "./output_final",
-        "manual_review": "./manual_review",
-        "errors": "./errors",
-        "input_raw": "./input_raw"
-    }
-
-    if folder not in folder_map:
+    if folder not in IMAGE_FOLDERS:
         return JSONResponse({
             "error": "Carpeta no válida"
         }, status_code=400)
 
-    images = get_images_in_folder(folder_map[folder], limit)
+    images = get_images_in_folder(IMAGE_FOLDERS[folder], limit)
 
     return JSONResponse({
         "folder": folder,
@@ -383,6 +625,251 @@ async def get_images(folder: str, limit: int = 20):
     })
 
 
+@app.get("/api/metadata")
+async def query_metadata(
+    status: Optional[str] = None,
+    batch: Optional[str] = None,
+    format: Optional[str] = None,
+    num_faces: Optional[int] = None,
+    min_faces: Optional[int] = None,
+    max_faces: Optional[int] = None,
+    updated_after: Optional[str] = None,
+    updated_before: Optional[str] = None,
+    year: Optional[int] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+):
+    """Busca metadatos con filtros y paginación por cursor."""
+    try:
+        items, next_cursor = await asyncio.to_thread(
+            metadata_store.query,
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            batch_id=batch,
+            img_format=format,
+            num_faces=num_faces,
+            min_faces=min_faces,
+            max_faces=max_faces,
+            updated_after=updated_after,
+            updated_before=updated_before,
+            year=year
+        )
+    except ValueError as e:
+        return JSONResponse({
+            "error": str(e)
+        }, status_code=400)
+
+    return JSONResponse({
+        "items": items,
+        "count": len(items),
+        "next_cursor": next_cursor
+    })
+
+
+@app.post("/api/v1/crop")
+async def crop_single_photo(file: UploadFile = File(...), remove_background: bool = True):
+    """
+    Recorta una sola foto en memoria y retorna la imagen resultante.
+    No escribe en input_raw ni en processed_index.json.
+    """
+    max_bytes = crop_api_config.get("max_upload_mb", 25) * 1024 * 1024
+    data = await file.read(max_bytes + 1)
+
+    if not data:
+        return JSONResponse({
+            "success": False,
+            "message": "Archivo vacío"
+        }, status_code=400)
+
+    if len(data) > max_bytes:
+        return JSONResponse({
+            "success": False,
+            "message": "Archivo demasiado grande"
+        }, status_code=413)
+
+    try:
+        service = get_crop_service()
+    except Exception as e:
+        return JSONResponse({
+            "success": False,
+            "message": f"Servicio de recorte no disponible: {e}"
+        }, status_code=503)
+
+    from src.core.crop_service import CropServiceBusy
+
+    try:
+        future = service.submit(data, remove_background)
+    except CropServiceBusy:
+        return JSONResponse({
+            "success": False,
+            "message": "Servicio ocupado, reintentar más tarde"
+        }, status_code=503, headers={"Retry-After": "1"})
+
+    try:
+        result = await asyncio.wrap_future(future)
+    except ValueError as e:
+        return JSONResponse({
+            "success": False,
+            "message": str(e)
+        }, status_code=400)
+    except Exception as e:
+        return JSONResponse({
+            "success": False,
+            "message": str(e)
+        }, status_code=500)
+
+    if result["status"] != "processed":
+        # Veredicto de revisión manual (sin imagen)
+        return JSONResponse({
+            "success": True,
+            "status": result["status"],
+            "reason": result["reason"],
+            "num_faces": result["num_faces"],
+            "face_box": result["face_box"],
+            "processing_time_ms": result["processing_time_ms"]
+        })
+
+    stem = Path(file.filename or "photo").stem
+    return Response(
+        content=result["content"],
+        media_type=result["media_type"],
+        headers={
+            "Content-Disposition": f'inline; filename="{stem}{result["extension"]}"',
+            "X-Crop-Status": result["status"],
+            "X-Crop-Box": ",".join(str(v) for v in result["crop_box"]),
+            "X-Background-Removed": str(result["background_removed"]).lower(),
+            "X-Processing-Time-Ms": str(result["processing_time_ms"])
+        }
+    )
+
+
+@app.get("/api/v1/crop/stats")
+async def crop_stats():
+    """Latencias p50/p99 y contadores del servicio de recorte."""
+    if crop_service is None:
+        return JSONResponse({
+            "available": False
+        })
+
+    return JSONResponse({
+        "available": True,
+        **crop_service.latency_stats()
+    })
+
+
+@app.get("/api/thumb/{folder}/{path:path}")
+async def get_thumbnail(folder: str, path: str, request: Request):
+    """Miniatura (WebP/JPEG) de una imagen, con soporte de ETag/If-None-Match."""
+    source = resolve_folder_file(folder, path)
+    if source is None:
+        return JSONResponse({
+            "error": "Imagen no encontrada"
+        }, status_code=404)
+
+    headers = {"Cache-Control": "no-cache"}
+
+    # Validar ETag sin generar la miniatura
+    etag = thumbnail_cache.etag(source)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+
+    try:
+        thumb_path, etag = await asyncio.to_thread(thumbnail_cache.get, source)
+    except Exception as e:
+        return JSONResponse({
+            "error": f"No se pudo generar la miniatura: {e}"
+        }, status_code=500)
+
+    return FileResponse(
+        thumb_path,
+        media_type=thumbnail_cache.media_type,
+        headers={**headers, "ETag": etag}
+    )
+
+
+@app.api_route("/api/files/{folder}/{path:path}", methods=["GET", "HEAD"])
+async def download_file(folder: str, path: str, request: Request):
+    """
+    Descarga un resultado de output/, output_white/ u output_final/.
+    Soporta ETag fuerte, If-None-Match/If-Modified-Since (304) y Range.
+    """
+    target = resolve_folder_file(folder, path, OUTPUT_FOLDERS)
+    if target is None:
+        return JSONResponse({
+            "error": "Archivo no encontrado"
+        }, status_code=404)
+
+    return serve_file(request.headers, target)
+
+
+@app.get("/api/manifest/{folder}")
+async def folder_manifest(folder: str, since: Optional[float] = None):
+    """
+    Lista (NDJSON) los archivos de una carpeta de resultados con tamaño,
+    fecha y ETag, para sincronizar solo lo nuevo o modificado.
+
+    Args:
+        since: Epoch en segundos; solo archivos modificados después
+    """
+    if folder not in OUTPUT_FOLDERS:
+        return JSONResponse({
+            "error": "Carpeta no válida"
+        }, status_code=400)
+
+    root = Path(OUTPUT_FOLDERS[folder])
+
+    def generate():
+        for entry in iter_manifest(root, since):
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.get("/api/export/{batch_id}")
+async def export_batch(
+    batch_id: str,
+    format: str = "zip",
+    folder: str = "output_final",
+    year: Optional[int] = None,
+    compress: bool = True
+):
+    """
+    Descarga en streaming los entregables de un lote (ZIP o tar.gz) con
+    manifest.csv generado desde los metadatos. No se arma copia temporal.
+
+    Args:
+        format: "zip" (JPEG/PNG en modo stored), "tar.gz" o "tar"
+        folder: Carpeta de resultados a exportar
+        year: Año del lote (default: todos)
+        compress: False = todo sin comprimir
+    """
+    if folder not in OUTPUT_FOLDERS or format not in MEDIA_TYPES:
+        return JSONResponse({
+            "error": "Carpeta o formato no válido"
+        }, status_code=400)
+
+    exporter = DeliverableExporter(
+        metadata_store,
+        batch_id,
+        year=year,
+        source_dir=OUTPUT_FOLDERS[folder],
+        archive_format=format,
+        compress=compress
+    )
+
+    if not await asyncio.to_thread(exporter.has_records):
+        return JSONResponse({
+            "error": "Lote sin metadatos"
+        }, status_code=404)
+
+    return StreamingResponse(
+        exporter.iter_bytes(),
+        media_type=exporter.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{exporter.filename}"'}
+    )
+
+
 @app.get("/api/health")
 async def health_check():
     """Endpoint de health check."""
@@ -0,0 +1,124 @@
+"""
+Entrega de archivos procesados para PhotoCrop.
+ETags fuertes, GETs condicionales (304) y rangos sobre FileResponse, que
+usa envío directo de archivo (pathsend) cuando el servidor ASGI lo soporta.
+"""
+
+import os
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterator, Mapping, Optional
+
+from fastapi.responses import FileResponse, Response
+
+
+def strong_etag(st: os.stat_result) -> str:
+    """ETag fuerte a partir de inodo, tamaño y mtime en nanosegundos."""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara un If-None-Match contra un ETag (comparación débil, RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+
+def is_not_modified(headers: Mapping[str, str], etag: str, st: os.stat_result) -> bool:
+    """
+    Evalúa If-None-Match y, si no viene, If-Modified-Since.
+
+    Returns:
+        True si el cliente ya tiene la versión actual (responder 304)
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return int(st.st_mtime) <= since.timestamp()
+
+    return False
+
+
+def serve_file(
+    request_headers: Mapping[str, str],
+    path: Path,
+    media_type: Optional[str] = None,
+    extra_headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Responde un archivo con ETag fuerte, 304 condicional y soporte de Range.
+
+    Args:
+        request_headers: Cabeceras de la solicitud
+        path: Archivo a entregar (ya validado)
+        media_type: Tipo MIME (None = deducir de la extensión)
+        extra_headers: Cabeceras adicionales
+    """
+    st = path.stat()
+    etag = strong_etag(st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": "no-cache",
+        **(extra_headers or {})
+    }
+
+    if is_not_modified(request_headers, etag, st):
+        return Response(status_code=304, headers=headers)
+
+    # FileResponse resuelve Range/If-Range contra el ETag recibido
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+
+def iter_manifest(root: Path, since: Optional[float] = None) -> Iterator[Dict]:
+    """
+    Recorre una carpeta de salida y describe cada archivo para sincronizar.
+
+    Args:
+        root: Carpeta raíz
+        since: Si se indica, solo archivos con mtime posterior (epoch)
+
+    Yields:
+        Dict con relative_path, size, modified y etag
+    """
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except FileNotFoundError:
+            continue
+
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(Path(entry.path))
+                continue
+            if not entry.is_file():
+                continue
+
+            st = entry.stat()
+            if since is not None and st.st_mtime <= since:
+                continue
+
+            yield {
+                "relative_path": Path(entry.path).relative_to(root).as_posix(),
+                "size": st.st_size,
+                "modified": datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat(),
+                "etag": strong_etag(st)
+            }
@@ -0,0 +1,365 @@
+"""
+Recepción de subidas masivas para PhotoCrop.
+Parsea el cuerpo multipart a medida que llega y escribe cada archivo a disco
+en bloques, sin mantener archivos completos en memoria.
+"""
+
+import os
+import uuid
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # versiones antiguas de python-multipart
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from src.utils.file_utils import detect_image_type, IMAGE_SIGNATURE_LENGTH
+
+VALID_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+ZIP_SIGNATURE = b'PK\x03\x04'
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Nombres alternativos (<stem>-1, <stem>-2, ...) a probar si el nombre ya existe
+MAX_NAME_ATTEMPTS = 1000
+
+
+def _temp_path(dest_dir: Path, suffix: str = "") -> Path:
+    """Ruta temporal oculta (el escáner ignora archivos que empiezan con '.')."""
+    return dest_dir / f".upload-{uuid.uuid4().hex}{suffix}.part"
+
+
+def _safe_name(filename: str) -> Optional[str]:
+    """Nombre de archivo sin directorios; None si no es aceptable."""
+    name = Path(filename.replace('\\', '/')).name
+    if not name or name.startswith('.'):
+        return None
+    return name
+
+
+def _rejection(filename: str, reason: str) -> Dict[str, str]:
+    return {"filename": filename, "reason": reason}
+
+
+def _publish(temp_path: Path, dest_dir: Path, name: str) -> Path:
+    """
+    Mueve un temporal a su nombre final sin pisar un archivo existente.
+
+    os.link falla de forma atómica si el destino ya existe (no hay ventana
+    entre comprobar y renombrar); en ese caso se prueba <stem>-1, <stem>-2...
+    En sistemas de archivos sin hardlinks, el nombre se reserva con O_EXCL
+    y después se reemplaza.
+
+    Returns:
+        Ruta final del archivo
+
+    Raises:
+        FileExistsError: Si no quedó ningún nombre libre
+    """
+    stem, suffix = os.path.splitext(name)
+    try:
+        for attempt in range(MAX_NAME_ATTEMPTS):
+            final_path = dest_dir / (name if attempt == 0 else f"{stem}-{attempt}{suffix}")
+            try:
+                os.link(temp_path, final_path)
+                return final_path
+            except FileExistsError:
+                continue
+            except OSError:
+                try:
+                    os.close(os.open(final_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                except FileExistsError:
+                    continue
+                os.replace(temp_path, final_path)
+                return final_path
+        raise FileExistsError(f"Sin nombre libre para {name} en {dest_dir}")
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+class StreamingUploadReceiver:
+    """
+    Recibe un cuerpo multipart/form-data por bloques.
+
+    Cada parte con archivo se escribe en un temporal de dest_dir, se valida
+    por su cabecera (magic bytes) apenas llegan los primeros bytes y, al
+    terminar, pasa a su nombre final (con sufijo -N si ese nombre ya existe).
+    Los archivos listos se obtienen con pop_ready() para encolarlos mientras
+    el resto sigue llegando.
+
+    feed() y finish() escriben a disco: desde código async se llaman con
+    asyncio.to_thread().
+    """
+
+    def __init__(self, dest_dir: Path, content_type: str, max_file_bytes: int, max_archive_bytes: int):
+        """
+        Inicializa el receptor.
+
+        Args:
+            dest_dir: Carpeta destino (normalmente input_raw)
+            content_type: Cabecera Content-Type de la solicitud
+            max_file_bytes: Tamaño máximo por imagen
+            max_archive_bytes: Tamaño máximo por ZIP
+
+        Raises:
+            ValueError: Si la solicitud no es multipart con boundary
+        """
+        media_type, params = parse_options_header(content_type)
+        if media_type != b'multipart/form-data' or b'boundary' not in params:
+            raise ValueError("Se esperaba multipart/form-data")
+
+        self.dest_dir = dest_dir
+        self.max_file_bytes = max_file_bytes
+        self.max_archive_bytes = max_archive_bytes
+
+        self.rejected: List[Dict[str, str]] = []
+        self._ready: List[Path] = []
+        self._archives: List[Path] = []
+
+        self._reset_part()
+
+        self._parser = MultipartParser(params[b'boundary'], {
+            'on_part_begin': self._reset_part,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end
+        })
+
+    def feed(self, chunk: bytes):
+        """Procesa un bloque del cuerpo de la solicitud."""
+        self._parser.write(chunk)
+
+    def finish(self):
+        """Finaliza el parseo y descarta partes incompletas."""
+        self._parser.finalize()
+        self._discard_part()
+
+    def pop_ready(self) -> List[Path]:
+        """Retorna (y vacía) las imágenes ya escritas en su ruta final."""
+        ready, self._ready = self._ready, []
+        return ready
+
+    def pop_archives(self) -> List[Path]:
+        """Retorna (y vacía) los ZIP recibidos, pendientes de extraer."""
+        archives, self._archives = self._archives, []
+        return archives
+
+    # ------------------------------------------------------------------
+    # Callbacks del parser
+    # ------------------------------------------------------------------
+
+    def _reset_part(self):
+        self._header_field = b''
+        self._header_value = b''
+        self._filename = None
+        self._kind = None  # "image", "zip" o None (parte ignorada)
+        self._file = None
+        self._temp = None
+        self._header = b''
+        self._validated = False
+        self._size = 0
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b'content-disposition':
+            _, params = parse_options_header(self._header_value)
+            if b'filename' in params:
+                self._filename = params[b'filename'].decode('utf-8', 'replace')
+        self._header_field = b''
+        self._header_value = b''
+
+    def _on_headers_finished(self):
+        if self._filename is None:
+            return  # Campo de formulario sin archivo
+
+        name = _safe_name(self._filename)
+        suffix = Path(name).suffix.lower() if name else ''
+
+        if suffix == '.zip':
+            self._kind = "zip"
+        elif suffix in VALID_EXTENSIONS:
+            self._kind = "image"
+        else:
+            self.rejected.append(_rejection(self._filename, "Extensión no permitida"))
+            return
+
+        self._temp = _temp_path(self.dest_dir, suffix)
+        self._file = open(self._temp, 'wb')
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is None:
+            return
+
+        chunk = data[start:end]
+        self._size += len(chunk)
+
+        if self._size > (self.max_file_bytes if self._kind == "image" else self.max_archive_bytes):
+            self._reject_part("Archivo demasiado grande" if self._kind == "image" else "ZIP demasiado grande")
+            return
+
+        if not self._validated:
+            self._header += chunk[:IMAGE_SIGNATURE_LENGTH]
+            if len(self._header) >= IMAGE_SIGNATURE_LENGTH and not self._validate_header():
+                return
+
+        self._file.write(chunk)
+
+    def _on_part_end(self):
+        if self._file is None:
+            self._reset_part()
+            return
+
+        if not self._validated and not self._validate_header():
+            self._reset_part()
+            return
+
+        self._file.close()
+        self._file = None
+
+        if self._kind == "zip":
+            self._archives.append(self._temp)
+        else:
+            try:
+                self._ready.append(_publish(self._temp, self.dest_dir, _safe_name(self._filename)))
+            except FileExistsError:
+                self.rejected.append(_rejection(self._filename, "Sin nombre libre en input_raw"))
+
+        self._reset_part()
+
+    # ------------------------------------------------------------------
+
+    def _validate_header(self) -> bool:
+        """Valida la cabecera de la parte actual; la descarta si no es válida."""
+        if self._kind == "zip":
+            valid = self._header.startswith(ZIP_SIGNATURE)
+        else:
+            valid = detect_image_type(self._header) is not None
+
+        if not valid:
+            self._reject_part("El contenido no corresponde a una imagen válida"
+                              if self._kind == "image" else "ZIP inválido")
+            return False
+
+        self._validated = True
+        return True
+
+    def _reject_part(self, reason: str):
+        self.rejected.append(_rejection(self._filename, reason))
+        self._discard_part()
+
+    def _discard_part(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._temp is not None and self._temp.exists():
+            self._temp.unlink()
+        self._temp = None
+
+
+def extract_images_from_zip(
+    zip_path: Path,
+    dest_dir: Path,
+    max_file_bytes: int,
+    max_total_bytes: int
+) -> Iterator[Union[Path, Dict[str, str]]]:
+    """
+    Extrae las imágenes de un ZIP una por una, copiando en bloques.
+
+    Cada miembro se valida por su cabecera y pasa a su ruta final apenas
+    termina de escribirse, para poder encolarlo de inmediato. Los límites
+    se cuentan sobre los bytes descomprimidos que realmente se escriben
+    (el tamaño declarado en el ZIP puede ser falso), así que un ZIP bomba
+    se corta al superarlos.
+
+    Args:
+        max_file_bytes: Tamaño máximo descomprimido por imagen
+        max_total_bytes: Tamaño máximo descomprimido de todo el ZIP
+
+    Yields:
+        Path de cada imagen extraída, o dict con el rechazo (filename, reason)
+    """
+    total = 0
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or member.filename.startswith('__MACOSX/'):
+                    continue
+
+                name = _safe_name(member.filename)
+                if name is None:
+                    continue
+
+                if Path(name).suffix.lower() not in VALID_EXTENSIONS:
+                    yield _rejection(member.filename, "Extensión no permitida")
+                    continue
+
+                if member.file_size > max_file_bytes:
+                    yield _rejection(member.filename, "Archivo demasiado grande")
+                    continue
+                if total + member.file_size > max_total_bytes:
+                    yield _rejection(zip_path.name, "Contenido del ZIP demasiado grande")
+                    return
+
+                temp_path = _temp_path(dest_dir)
+                try:
+                    with archive.open(member) as src:
+                        header = src.read(IMAGE_SIGNATURE_LENGTH)
+                        if detect_image_type(header) is None:
+                            yield _rejection(member.filename, "El contenido no corresponde a una imagen válida")
+                            continue
+
+                        size = _copy_limited(src, temp_path, header, min(max_file_bytes, max_total_bytes - total))
+                        if size is None:
+                            over_total = max_total_bytes - total < max_file_bytes
+                            yield _rejection(
+                                zip_path.name if over_total else member.filename,
+                                "Contenido del ZIP demasiado grande" if over_total else "Archivo demasiado grande"
+                            )
+                            if over_total:
+                                return
+                            continue
+                        total += size
+
+                    final_path = _publish(temp_path, dest_dir, name)
+                except FileExistsError:
+                    yield _rejection(member.filename, "Sin nombre libre en input_raw")
+                    continue
+                finally:
+                    temp_path.unlink(missing_ok=True)
+
+                yield final_path
+
+    except zipfile.BadZipFile:
+        yield _rejection(zip_path.name, "ZIP inválido")
+
+    finally:
+        zip_path.unlink(missing_ok=True)
+
+
+def _copy_limited(src, temp_path: Path, header: bytes, limit: int) -> Optional[int]:
+    """
+    Copia un miembro del ZIP en bloques hasta limit bytes.
+
+    Returns:
+        Bytes escritos, o None si el miembro supera el límite
+    """
+    size = len(header)
+    with open(temp_path, 'wb') as dst:
+        dst.write(header)
+        while True:
+            chunk = src.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                return size if size <= limit else None
+            size += len(chunk)
+            if size > limit:
+                return None
+            dst.write(chunk)
@@ -170,5 +170,11 @@ cd "$PROJECT_DIR"
 export PYTHONPATH="$PROJECT_DIR:$PYTHONPATH"
 
 # Iniciar servidor
-uvicorn src.webapp.app:app --host 0.0.0.0 --port 8000 --reload
+# WEB_WORKERS>1 levanta varios workers (el estado se comparte en metadata/jobs.db)
+WEB_WORKERS="${WEB_WORKERS:-1}"
+if [ "$WEB_WORKERS" -gt 1 ]; then
+    uvicorn src.webapp.app:app --host 0.0.0.0 --port 8000 --workers "$WEB_WORKERS"
+else
+    uvicorn src.webapp.app:app --host 0.0.0.0 --port 8000 --reload
+fi
 